@@ -0,0 +1,83 @@
+import os, sys
+import time
+import zlib
+import random
+import argparse
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from data.parse_raw_features import Parse, raw_source
+from data.corpus_loader import CorpusLoader, TarSource
+from data.packed_corpus import PackedCorpus, append, source_urlids
+
+
+def sample_urlids(n, seed):
+    urlids = source_urlids(raw_source())
+    random.Random(seed).shuffle(urlids)
+
+    return urlids[:n] if n else urlids
+
+def read(source, urlids, n_threads, read_ahead, parser=None):
+    """
+    Files per second and MB per second reading urlids, parsing each page
+    on the way when a parser is given
+    """
+    start = time.time()
+    size = 0
+
+    for _, content in CorpusLoader(source, n_threads, read_ahead).iter(urlids):
+        size += len(content)
+        # touch every byte, a packed page is only a view until then
+        zlib.crc32(content)
+
+        if parser is not None:
+            parser.extract_html(Parse.decode(content))
+
+    elapsed = time.time() - start
+    return len(urlids) / elapsed, size / 2. ** 20 / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Read throughput of the raw_content corpus, cold and warm page cache')
+    parser.add_argument('--sample', type=int, default=None, help='number of pages, all by default')
+    parser.add_argument('--threads', type=int, action='append', help='reader threads, repeatable, default 1 4 16')
+    parser.add_argument('--read-ahead', type=int, default=64)
+    parser.add_argument('--tar', default=None, help='also read from this tar, written from the sample when missing')
+    parser.add_argument('--packed', default=None, help='also read from this packed corpus, written from the sample when missing')
+    parser.add_argument('--parse', action='store_true', help='parse every page with the lxml engine while reading')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    urlids = sample_urlids(args.sample, args.seed)
+    raw = raw_source()
+
+    sources = [(type(raw).__name__, raw)]
+
+    if args.packed:
+        packed = PackedCorpus(args.packed) if PackedCorpus.is_packed(args.packed) else append(args.packed, raw, urlids)
+        sources.append(('packed', packed))
+
+    if args.tar:
+        tar = TarSource(args.tar) if os.path.exists(args.tar) else TarSource.pack(raw, urlids, args.tar)
+        sources.append(('tar', tar))
+
+    engine = Parse(engine='lxml') if args.parse else None
+
+    print('%d pages%s' % (len(urlids), ', parsed with lxml' if args.parse else ''))
+    print('%-16s %8s %8s %12s %10s' % ('source', 'threads', 'cache', 'files/s', 'MB/s'))
+
+    for name, source in sources:
+        for n_threads in args.threads or [1, 4, 16]:
+            if not getattr(source, 'blocking', True) and n_threads > 1:
+                continue
+
+            # cold drops the pages from the page cache first, warm reads them again right after
+            for cache in ['cold', 'warm']:
+                if cache == 'cold':
+                    source.drop_cache(urlids)
+
+                files, mb = read(source, urlids, n_threads, args.read_ahead, engine)
+                print('%-16s %8d %8s %12.0f %10.1f' % (name, n_threads, cache, files, mb))
+
+if __name__ == '__main__':
+    main()
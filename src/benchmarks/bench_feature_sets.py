@@ -0,0 +1,56 @@
+import os, sys
+import time
+import tracemalloc
+import argparse
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from data import DATASETS
+from features import feature_sets as fs
+
+
+def run(datasets, shared):
+    """
+    Evaluate every dataset expression, with one memo shared by all of them
+    or a fresh memo per expression
+    """
+    memo = {}
+    timings = []
+
+    tracemalloc.start()
+    start = time.time()
+
+    for dataset in datasets:
+        t = time.time()
+        fs.parse(dataset, memo if shared else None)
+        timings.append((dataset, time.time() - t))
+
+    total = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return timings, total, peak / 2 ** 20, len(memo)
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and peak memory of evaluating DATASETS.DATASETS')
+    parser.add_argument('--verbose', action='store_true', help='print the time of every expression')
+    args = parser.parse_args()
+
+    # the store is read from disk once, keep that out of the numbers
+    start = time.time()
+    fs.load_cached('text_features')
+    print('loaded text_features in %.2fs' % (time.time() - start))
+
+    for shared in [False, True]:
+        timings, total, peak, memo_size = run(DATASETS.DATASETS, shared)
+
+        if args.verbose:
+            for dataset, seconds in timings:
+                print('%8.3fs  %s' % (seconds, dataset))
+
+        print('%-22s %d expressions in %.2fs, peak %.1fMB, %d memoized subexpressions' % (
+            'shared memo' if shared else 'memo per expression', len(timings), total, peak, memo_size))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import os, sys
+import time
+import pickle
+import argparse
+import tempfile
+
+import numpy as np
+from scipy import sparse
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from helpers import feature_store
+
+
+def fake_text_features(n_fields, n_rows, n_cols, density, seed=4):
+    rng = np.random.RandomState(seed)
+    text = {}
+
+    for i in range(n_fields):
+        # random positions, duplicates summed, without materializing every cell
+        nnz = int(n_rows * n_cols * density)
+        rows, cols = rng.randint(n_rows, size=nnz), rng.randint(n_cols, size=nnz)
+        text['field%d' % i] = sparse.csr_matrix((rng.rand(nnz), (rows, cols)), shape=(n_rows, n_cols))
+
+    return text
+
+def timed(fun):
+    start = time.time()
+    value = fun()
+    return value, time.time() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Loading one field and slicing folds, pickle vs feature store')
+    parser.add_argument('--fields', type=int, default=11)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--cols', type=int, default=200000)
+    parser.add_argument('--density', type=float, default=0.001)
+    parser.add_argument('--folds', type=int, default=5)
+    args = parser.parse_args()
+
+    text = fake_text_features(args.fields, args.rows, args.cols, args.density)
+    directory = tempfile.mkdtemp()
+
+    pickled = os.path.join(directory, 'text_features.pkl')
+    stored = os.path.join(directory, 'text_features')
+
+    with open(pickled, 'wb') as outfile:
+        pickle.dump(text, outfile, pickle.HIGHEST_PROTOCOL)
+
+    feature_store.write(stored, text)
+
+    def from_pickle():
+        with open(pickled, 'rb') as infile:
+            return pickle.load(infile)['field0']
+
+    _, pickle_time = timed(from_pickle)
+    X, store_time = timed(lambda: feature_store.read(stored)['field0'])
+
+    print('one field: pickle %.3fs, store %.4fs' % (pickle_time, store_time))
+
+    # the train and test rows of an unshuffled KFold
+    bounds = np.linspace(0, args.rows, args.folds + 1).astype(int)
+    folds = [(np.r_[0:start, stop:args.rows], np.arange(start, stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    for i, name in enumerate(['train', 'test']):
+        _, copy_time = timed(lambda: [X[fold[i]] for fold in folds])
+        _, view_time = timed(lambda: [feature_store.take_rows(X, fold[i]) for fold in folds])
+
+        print('%d %s folds: indexing %.4fs, take_rows %.4fs' % (args.folds, name, copy_time, view_time))
+
+    feature_store.remove(directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import os, sys
+import json
+import random
+import tempfile
+import tracemalloc
+import argparse
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from helpers.jsonl import write_jsonl, read_jsonl, read_jsonl_batches
+
+WORDS = 'the recipe for a chocolate cake that stays fresh all year round'.split()
+
+
+def fake_records(n, seed=4):
+    """
+    Records shaped like the output of parse_raw_content.parse_item
+    """
+    rnd = random.Random(seed)
+    text = lambda k: ' '.join(rnd.choice(WORDS) for _ in range(k))
+
+    for i in range(n):
+        yield {
+            'boilerplate': [text(8), text(400)],
+            'title': [text(8)],
+            'h1': [text(6)],
+            'a': [text(3) for _ in range(20)],
+            'other': [text(50)]
+        }
+
+def peak_memory(fun):
+    tracemalloc.start()
+    fun()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return peak / 2 ** 20
+
+def list_write(records, filename):
+    data = list(records)
+
+    with open(filename, 'w') as outfile:
+        for item in data:
+            outfile.write(json.dumps(item))
+            outfile.write('\n')
+
+def list_read(filename):
+    with open(filename, 'r') as infile:
+        return len(list(map(json.loads, infile)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak memory of list based vs streaming JSONL')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    filename = os.path.join(tempfile.mkdtemp(), 'extracted_text')
+
+    print('%8s %12s %12s %12s %12s %12s' % ('records', 'list write', 'stream write',
+                                            'list read', 'stream read', 'batch read'))
+
+    for n in args.sizes:
+        row = [
+            peak_memory(lambda: list_write(fake_records(n), filename)),
+            peak_memory(lambda: write_jsonl(fake_records(n), filename)),
+            peak_memory(lambda: list_read(filename)),
+            peak_memory(lambda: sum(1 for _ in read_jsonl(filename))),
+            peak_memory(lambda: sum(len(b) for b in read_jsonl_batches(filename, args.batch_size)))
+        ]
+
+        print('%8d' % n + ''.join('%10.1fMB' % mb for mb in row))
+
+    os.remove(filename)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import os, sys
+import time
+import tracemalloc
+import argparse
+
+import numpy as np
+from scipy import sparse
+from functools import reduce
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from features import feature_sets as fs
+
+
+def pairwise_maximum(A, B):
+    """ the old two argument version, folded over the inputs of max(all) """
+    BisBigger = A-B
+    BisBigger.data = np.where(BisBigger.data < 0, 1, 0)
+
+    return A - A.multiply(BisBigger) + B.multiply(BisBigger)
+
+def fake_text_features(n_fields, n_rows, n_cols, density, seed=4):
+    rng = np.random.RandomState(seed)
+    fields = {}
+
+    nnz = int(n_rows * n_cols * density)
+
+    for i in range(n_fields):
+        rows = rng.randint(n_rows, size=nnz)
+        cols = rng.randint(n_cols, size=nnz)
+        counts = rng.randint(1, 5, size=nnz).astype(float)
+
+        fields['field%d' % i] = sparse.csr_matrix((counts, (rows, cols)), shape=(n_rows, n_cols))
+
+    return fields
+
+def bench(fun, repeat):
+    tracemalloc.start()
+    start = time.time()
+
+    for _ in range(repeat):
+        result = fun()
+
+    elapsed = (time.time() - start) / repeat
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return result, elapsed, peak / 2 ** 20
+
+def main():
+    parser = argparse.ArgumentParser(description='Pairwise vs n-ary sparse maximum on max(all)')
+    parser.add_argument('--fake', action='store_true', help='use random matrices instead of text_features')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.fake:
+        text = fake_text_features(11, 10000, 200000, 0.0005)
+    else:
+        text = fs.load_cached('text_features')
+
+    matrices = [sparse.csr_matrix(text[field]) for field in text]
+    print('max(all) over %d fields, %d stored entries' % (len(matrices), sum(M.nnz for M in matrices)))
+
+    old, old_time, old_peak = bench(lambda: reduce(pairwise_maximum, matrices), args.repeat)
+    new, new_time, new_peak = bench(lambda: fs.sparse_maximum(*matrices), args.repeat)
+
+    old.eliminate_zeros()
+    identical = (old.shape == new.shape and (old.indptr == new.indptr).all() and
+                 (old.indices == new.indices).all() and (old.data == new.data).all())
+
+    print('%-10s %10.3fs %10.1fMB' % ('pairwise', old_time, old_peak))
+    print('%-10s %10.3fs %10.1fMB' % ('n-ary', new_time, new_peak))
+    print('identical:', identical)
+
+if __name__ == '__main__':
+    main()
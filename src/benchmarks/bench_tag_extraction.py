@@ -0,0 +1,66 @@
+import os, sys
+import random
+import time
+import argparse
+import warnings
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from data.parse_raw_features import Parse, raw_source
+from data.packed_corpus import source_urlids
+
+warnings.filterwarnings('ignore')
+
+
+def old_path(html):
+    soup = Parse.parse_html(html)
+    soup = Parse.remove_tags(soup, ['style', 'script'])
+
+    return [Parse.tag_content(soup, tag) for tag in Parse.TAGS]
+
+def single_pass(html):
+    return Parse.extract_tags(Parse.parse_html(html), Parse.TAGS)
+
+def lxml_native(html):
+    row = Parse.extract_tags_lxml(html, Parse.TAGS)
+    return row if row is not None else single_pass(html)
+
+
+def sample_documents(n, seed):
+    """
+    Read a random sample of raw_content files into memory so the timings
+    below only measure parsing
+    """
+    urlids = source_urlids(raw_source())
+    random.Random(seed).shuffle(urlids)
+
+    return [Parse.read_html(urlid) for urlid in urlids[:n]]
+
+def bench(fun, docs):
+    start = time.time()
+    rows = [fun(html) for html in docs]
+    elapsed = time.time() - start
+
+    return rows, len(docs) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Documents per second for the tag extractors')
+    parser.add_argument('--sample', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=4)
+    args = parser.parse_args()
+
+    docs = sample_documents(args.sample, args.seed)
+    reference, docs_per_sec = bench(old_path, docs)
+
+    print('%-12s %10s %10s' % ('path', 'docs/s', 'matching'))
+    print('%-12s %10.1f %10d' % ('find_all', docs_per_sec, len(docs)))
+
+    for name, fun in [('single-pass', single_pass), ('lxml', lxml_native)]:
+        rows, docs_per_sec = bench(fun, docs)
+        matching = sum(row == ref for row, ref in zip(rows, reference))
+
+        print('%-12s %10.1f %10d' % (name, docs_per_sec, matching))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import os, sys
+import time
+import pickle
+import argparse
+
+import pandas as pd
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from helpers import util
+
+
+def plain(normalize):
+    """
+    Tokenizer without memoization, same as the tokenizers used to be
+    """
+    return lambda doc: [normalize(t) for t in util.word_tokenize(doc)]
+
+def load_bodies(n):
+    train = pd.read_csv(os.path.join(basepath, 'data/raw/train.tsv'), delimiter='\t', na_values=['?'], nrows=n)
+    boilerplate = util.convert_to_json(train.boilerplate)
+
+    return list(util.get_component(boilerplate, 'body'))
+
+def bench(tokenizer, docs):
+    start = time.time()
+    tokens = [tokenizer(doc) for doc in docs]
+
+    return tokens, time.time() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Plain vs memoized tokenizers on the boilerplate body text')
+    parser.add_argument('--sample', type=int, default=None, help='number of training documents, all by default')
+    args = parser.parse_args()
+
+    docs = load_bodies(args.sample)
+    n_tokens = sum(len(util.word_tokenize(doc)) for doc in docs)
+
+    print('%d documents, %d tokens\n' % (len(docs), n_tokens))
+    print('%-8s %10s %10s %10s %10s %8s' % ('', 'plain s', 'memo s', 'speedup', 'hit rate', 'equal'))
+
+    for name, memoized in [('lemma', util.LemmaTokenizer()), ('stem', util.StemTokenizer())]:
+        reference, plain_time = bench(plain(memoized.normalize_word), docs)
+        tokens, memo_time = bench(memoized, docs)
+
+        print('%-8s %10.2f %10.2f %9.1fx %9.1f%% %8s' % (name, plain_time, memo_time, plain_time / memo_time,
+                                                     100 * memoized.hit_rate(), tokens == reference))
+
+        # what a worker process gets, an empty cache and the same output
+        clone = pickle.loads(pickle.dumps(memoized))
+        assert clone.cache_info().currsize == 0 and clone(docs[0]) == reference[0]
+
+    print('\nword_tokenize alone is part of both timings, the difference is normalization')
+
+if __name__ == '__main__':
+    main()
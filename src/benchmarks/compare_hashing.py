@@ -0,0 +1,85 @@
+import os, sys
+import time
+import pickle
+import argparse
+
+import numpy as np
+import pandas as pd
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from sklearn.cross_validation import KFold
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import roc_auc_score
+
+from helpers import util
+from helpers.hashing import HashingTfidfVectorizer
+
+
+def load_bodies(n):
+    train = pd.read_csv(os.path.join(basepath, 'data/raw/train.tsv'), delimiter='\t', na_values=['?'], nrows=n)
+    boilerplate = util.convert_to_json(train.boilerplate)
+
+    return list(util.get_component(boilerplate, 'body')), train.label.values
+
+def vectorizers(tokenizer, n_jobs):
+    options = dict(strip_accents='unicode', tokenizer=tokenizer, ngram_range=(1, 2), min_df=3, sublinear_tf=True)
+
+    yield 'vocabulary', TfidfVectorizer(**options)
+
+    for bits in (18, 20, 22):
+        yield 'hashing 2^%d' % bits, HashingTfidfVectorizer(n_features=2 ** bits, **options)
+
+    yield 'hashing 2^20 x%d' % n_jobs, HashingTfidfVectorizer(n_features=2 ** 20, n_jobs=n_jobs, **options)
+
+def cv_auc(vectorizer, docs, y, n_folds):
+    """
+    Mean AUC of a logistic regression on the tf-idf, the vectorizer is refit
+    on every training fold
+    """
+    scores = []
+
+    for itrain, itest in KFold(len(docs), n_folds=n_folds, shuffle=True, random_state=0):
+        Xtr = vectorizer.fit_transform([docs[i] for i in itrain])
+        Xte = vectorizer.transform([docs[i] for i in itest])
+
+        model = LogisticRegression().fit(Xtr, y[itrain])
+        scores.append(roc_auc_score(y[itest], model.predict_proba(Xte)[:, 1]))
+
+    return np.mean(scores)
+
+def main():
+    parser = argparse.ArgumentParser(description='Accuracy, size and speed of hashing vs vocabulary tf-idf')
+    parser.add_argument('--sample', type=int, default=None, help='number of training documents, all by default')
+    parser.add_argument('--lemma', action='store_true', help='tokenize with util.LemmaTokenizer like the pipelines')
+    parser.add_argument('--n-jobs', type=int, default=4)
+    parser.add_argument('--folds', type=int, default=3)
+    args = parser.parse_args()
+
+    docs, y = load_bodies(args.sample)
+    tokenizer = util.LemmaTokenizer() if args.lemma else None
+
+    print('%-18s %8s %8s %10s %8s %8s %8s' % ('', 'fit s', 'trans s', 'pickle MB', 'load s', 'columns', 'auc'))
+
+    for name, vectorizer in vectorizers(tokenizer, args.n_jobs):
+        start = time.time()
+        vectorizer.fit(docs)
+        fit_time = time.time() - start
+
+        start = time.time()
+        X = vectorizer.transform(docs)
+        transform_time = time.time() - start
+
+        dump = pickle.dumps(vectorizer, protocol=pickle.HIGHEST_PROTOCOL)
+
+        start = time.time()
+        pickle.loads(dump)
+        load_time = time.time() - start
+
+        print('%-18s %8.2f %8.2f %10.2f %8.3f %8d %8.4f' % (name, fit_time, transform_time, len(dump) / 2. ** 20,
+                                                        load_time, X.shape[1], cv_auc(vectorizer, docs, y, args.folds)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import os, sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import threading
+import http.client
+
+import numpy as np
+import pandas as pd
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from data.parse_raw_features import Parse, raw_source
+from data.packed_corpus import source_urlids
+from models import serve, batching
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        http.client.HTTPConnection.__init__(self, 'localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+class TCPHTTPConnection(http.client.HTTPConnection):
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+def connect(address):
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        return TCPHTTPConnection(host, int(port))
+
+    return UnixHTTPConnection(address)
+
+def sample_requests(n, seed):
+    """
+    Raw html of random pages with their boilerplate from train.tsv
+    """
+    urlids = source_urlids(raw_source())
+    random.Random(seed).shuffle(urlids)
+
+    try:
+        train = pd.read_csv(os.path.join(basepath, 'data/raw/train.tsv'), delimiter='\t', na_values=['?'])
+        boilerplate = dict(zip(train.urlid.astype(str), train.boilerplate))
+    except IOError:
+        boilerplate = {}
+
+    return [json.dumps({'html': Parse.read_html(urlid), 'boilerplate': boilerplate.get(urlid, '{}')}).encode('utf-8')
+            for urlid in urlids[:n]]
+
+def start_batching(scorer, max_batch):
+    """
+    Micro batching server on its own event loop thread, returns its address
+    """
+    loop = asyncio.new_event_loop()
+    server = batching.BatchingServer(scorer, max_batch)
+
+    listener = loop.run_until_complete(server.start('127.0.0.1:0'))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    return '127.0.0.1:%d' % listener.sockets[0].getsockname()[1]
+
+def client(address, bodies, latencies, errors):
+    conn = connect(address)
+
+    for body in bodies:
+        start = time.time()
+        conn.request('POST', '/score', body, {'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+
+        latencies.append(1000 * (time.time() - start))
+        if response.status != 200:
+            errors.append(response.status)
+
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the scoring service')
+    parser.add_argument('--address', default=None, help='running server, host:port or unix socket path')
+    parser.add_argument('--model', action='append', help='start an in-process server on these artifacts instead, it shares the GIL with the clients')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--max-batch', type=int, default=1, help='in-process server only, above 1 uses the micro batching front end')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--pages', type=int, default=200, help='distinct pages cycled through')
+    parser.add_argument('--p50-ms', type=float, default=20.)
+    parser.add_argument('--p99-ms', type=float, default=100.)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    server = None
+    address = args.address
+
+    if address is None:
+        directories = args.model or [os.path.join(basepath, model) for model in serve.MODELS
+                                     if os.path.exists(os.path.join(basepath, model, 'manifest.json'))]
+
+        scorer = serve.Scorer(directories)
+
+        if args.max_batch > 1:
+            address = start_batching(scorer, args.max_batch)
+        else:
+            server = serve.make_server(scorer, '127.0.0.1:0')
+            address = '127.0.0.1:%d' % server.server_address[1]
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    pages = sample_requests(args.pages, args.seed)
+    bodies = [pages[i % len(pages)] for i in range(args.requests)]
+
+    # one warm up request per page, tokenizer caches and page cache included
+    client(address, pages, [], [])
+
+    latencies, errors = [], []
+    threads = [threading.Thread(target=client, args=(address, bodies[i::args.concurrency], latencies, errors))
+               for i in range(args.concurrency)]
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+
+    print('%d requests, concurrency %d, %.1f req/s, %d errors' % (len(latencies), args.concurrency,
+                                                                 len(latencies) / elapsed, len(errors)))
+    print('client  p50 %.1fms  p90 %.1fms  p99 %.1fms  max %.1fms' % (p50, p90, p99, max(latencies)))
+
+    conn = connect(address)
+    conn.request('GET', '/stats')
+    stats = json.loads(conn.getresponse().read())
+    print('server  p50 %.1fms  p99 %.1fms over %d requests' % (stats['p50_ms'], stats['p99_ms'], stats['count']))
+
+    if 'batches' in stats:
+        print('batches %d, mean size %.1f, queueing p50 %.1fms p99 %.1fms, sizes %s' % (
+            stats['batches'], stats['mean_batch_size'], stats['queue_delay_p50_ms'], stats['queue_delay_p99_ms'],
+            ' '.join('%s:%d' % item for item in stats['batch_sizes'].items())))
+
+    if server is not None:
+        server.shutdown()
+
+    ok = p50 <= args.p50_ms and p99 <= args.p99_ms and not errors
+    print('targets p50 <= %.0fms, p99 <= %.0fms: %s' % (args.p50_ms, args.p99_ms, 'met' if ok else 'MISSED'))
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import os
+import tarfile
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DirectorySource(object):
+    """
+    One file per urlid, the raw_content layout
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, urlid):
+        return os.path.join(self.directory, str(urlid))
+
+    def read(self, urlid):
+        with open(self.path(urlid), 'rb') as infile:
+            return infile.read()
+
+    def drop_cache(self, urlids):
+        """
+        Evict the files from the page cache, for cold cache measurements
+        """
+        for urlid in urlids:
+            fd = os.open(self.path(urlid), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+class TarSource(object):
+    """
+    Pages packed in an uncompressed tar, member names being the urlids. The
+    member offsets are indexed once and every read is a single pread, so
+    reader threads share one file descriptor without seeking.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._index = None
+        self._fd = None
+        self._pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_fd'] = None
+        state['_pid'] = None
+        return state
+
+    @property
+    def index(self):
+        if self._index is None:
+            with tarfile.open(self.path, 'r:') as archive:
+                self._index = {os.path.basename(member.name): (member.offset_data, member.size)
+                               for member in archive if member.isfile()}
+
+        return self._index
+
+    @property
+    def fd(self):
+        if self._fd is None or self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDONLY)
+            self._pid = os.getpid()
+
+        return self._fd
+
+    def read(self, urlid):
+        try:
+            offset, size = self.index[str(urlid)]
+        except KeyError:
+            raise IOError('%s not in %s' % (urlid, self.path))
+
+        return os.pread(self.fd, size, offset)
+
+    def drop_cache(self, urlids=None):
+        os.posix_fadvise(self.fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+    @staticmethod
+    def pack(source, urlids, path):
+        """
+        Write the pages of urlids from another source into a tar at path
+        """
+        with tarfile.open(path, 'w:') as archive:
+            for urlid in urlids:
+                content = source.read(urlid)
+                info = tarfile.TarInfo(str(urlid))
+                info.size = len(content)
+
+                archive.addfile(info, _Reader(content))
+
+        return TarSource(path)
+
+
+class _Reader(object):
+    def __init__(self, content):
+        self.content = content
+        self.position = 0
+
+    def read(self, size=-1):
+        end = len(self.content) if size is None or size < 0 else self.position + size
+        chunk = self.content[self.position:end]
+        self.position += len(chunk)
+        return chunk
+
+
+class CorpusLoader(object):
+    """
+    Reads pages on a thread pool, keeping up to read_ahead reads in flight
+    ahead of the consumer so disk waits overlap with parsing. Pages come
+    back as raw bytes in the order they were asked for.
+    """
+
+    def __init__(self, source, n_threads=8, read_ahead=64):
+        """
+        source: DirectorySource, TarSource or anything with read(urlid)
+        n_threads: number of reader threads
+        read_ahead: number of pages read ahead of the consumer
+        """
+        self.source = source
+        self.n_threads = n_threads
+        self.read_ahead = read_ahead
+
+        self._executor = None
+        self._pid = None
+
+    def __getstate__(self):
+        # threads do not survive pickling, workers start their own pool
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_pid'] = None
+        return state
+
+    @property
+    def executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(self.n_threads)
+            self._pid = os.getpid()
+
+        return self._executor
+
+    def iter(self, items, key=None):
+        """
+        Yield (item, content) for every item, key maps an item to its urlid
+        """
+        items = iter(items)
+        key = key or (lambda item: item)
+
+        if self.n_threads <= 1 or not getattr(self.source, 'blocking', True):
+            for item in items:
+                yield item, self.source.read(key(item))
+            return
+
+        pending = deque()
+
+        def submit():
+            for item in items:
+                pending.append((item, self.executor.submit(self.source.read, key(item))))
+                return
+
+        for _ in range(self.read_ahead):
+            submit()
+
+        while pending:
+            item, future = pending.popleft()
+            submit()
+
+            yield item, future.result()
+
+    def read_all(self, urlids):
+        return [content for _, content in self.iter(urlids)]
@@ -19,39 +19,78 @@ def extract_domain(url):
 def load_csv(filename):
     return pd.read_table(filename)
 
+def transliterate(texts):
+    """
+    unidecode a whole column at once. unidecode maps every character on its
+    own, so each distinct non-ascii character of the batch is looked up once
+    and the texts are rewritten with str.translate
+    
+    texts: list of strings, None or empty values become ''
+    """
+    texts = [t if t else '' for t in texts]
+    todo = [i for i, t in enumerate(texts) if not t.isascii()]
+    
+    if not todo:
+        return texts
+    
+    chars = set(''.join(texts[i] for i in todo))
+    table = {ord(c): unidecode(c) for c in chars if ord(c) > 127}
+    
+    for i in todo:
+        texts[i] = texts[i].translate(table)
+    
+    return texts
+
 def parse_data(df):
-    data = []
-    columns = df.columns
-    
-    for key, row in df.iterrows():
-        item = {}
-        
-        for column in columns:
-            item[column] = row[column]
-        
-        # parse url
-        
-        item['real_url'] = row['url'].lower()
-        item['domain'] = extract_domain(row['url'])
-        item['tld'] = item['domain'].split('.')[-1]
-        
-        
-        # parse boilerplate
-        boilerplate = json.loads(row['boilerplate'])
-        
-        for f in ['title', 'url', 'body']:
-            item[f] = boilerplate[f] if f in boilerplate else u''
-            item[f] = unidecode(item[f]) if item[f] else ''
-        
-        if 'label' in row:
-            item['label'] = row['label']
-        else:
-            item['label'] = np.nan
-            
-        data.append(item)
+    """
+    Columnar version of the per row parsing, returns a DataFrame with the
+    original columns plus real_url, domain, tld and the boilerplate title,
+    url and body
+    
+    df: raw train or test DataFrame as read by load_csv
+    """
+    data = df.copy()
+    
+    # parse url
+    
+    data['real_url'] = df['url'].str.lower()
+    
+    # hosts repeat a lot, so work out the domain of each distinct host once
+    host_ids, hosts = pd.factorize(data['real_url'].str.split('/', n=3).str[2])
+    
+    # factorize codes missing hosts as -1, which would index the last domain
+    if (host_ids < 0).any():
+        raise ValueError('urls without a host: %s' % ', '.join(df['url'][host_ids < 0].head(5)))
+    
+    domain_parts = pd.Series(hosts).str.split('.')
+    
+    # e.g. co.uk
+    domains = domain_parts.str[-2:].str.join('.').where(
+        ~domain_parts.str[-2].isin(['com', 'co']), domain_parts.str[-3:].str.join('.'))
+    
+    data['domain'] = domains.values[host_ids]
+    data['tld'] = domains.str.rsplit('.', n=1).str[-1].values[host_ids]
+    
+    # parse boilerplate, decoded in one go as a single json array
+    boilerplate = json.loads('[' + ','.join(df['boilerplate']) + ']')
+    
+    for f in ['title', 'url', 'body']:
+        data[f] = transliterate([bp.get(f) for bp in boilerplate])
+    
+    if 'label' not in data:
+        data['label'] = np.nan
     
     return data
 
+def iter_records(df):
+    """
+    Rows of a parsed DataFrame as dicts, built one at a time
+    """
+    columns = list(df.columns)
+    
+    for values in zip(*[df[column].values for column in columns]):
+        yield dict(zip(columns, values))
+
 def get_train():
     train = load_csv('../data/raw/train.tsv')
     
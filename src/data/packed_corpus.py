@@ -0,0 +1,258 @@
+import os, sys
+import glob
+import mmap
+import argparse
+
+import numpy as np
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from data.corpus_loader import DirectorySource, TarSource
+
+INDEX = np.dtype([('urlid', '<i8'), ('offset', '<i8'), ('size', '<i8')])
+
+
+class PackedCorpus(object):
+    """
+    Raw pages concatenated into a few large shard files, shard-NNNNN.bin,
+    each with an index of (urlid, offset, size) in shard-NNNNN.idx.npy.
+    Shards are memory mapped read only and read() hands out memoryview
+    slices of them, nothing is copied until the page is decoded.
+
+    New crawls go into new shards, old ones are never rewritten. A urlid
+    packed again lives in the latest shard holding it.
+    """
+
+    # reads only slice the mapping, there is nothing for reader threads to overlap
+    blocking = False
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._maps = {}
+        self.refresh()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_maps'] = {}
+        return state
+
+    @staticmethod
+    def is_packed(directory):
+        return bool(glob.glob(os.path.join(directory, 'shard-*.idx.npy')))
+
+    def shards(self):
+        return sorted(os.path.basename(path)[:-len('.idx.npy')]
+                      for path in glob.glob(os.path.join(self.directory, 'shard-*.idx.npy')))
+
+    def refresh(self):
+        """
+        Rebuild the urlid lookup from the shard indexes on disk
+        """
+        names = self.shards()
+        indexes = [np.load(os.path.join(self.directory, name + '.idx.npy')) for name in names]
+
+        index = np.concatenate(indexes) if indexes else np.zeros(0, dtype=INDEX)
+        shard = np.repeat(np.arange(len(names), dtype=np.int32), [len(i) for i in indexes])
+
+        # stable sort keeps shard order among duplicates, the last one wins
+        order = np.argsort(index['urlid'], kind='stable')
+        urlids = index['urlid'][order]
+        last = np.append(urlids[1:] != urlids[:-1], True) if len(urlids) else np.zeros(0, dtype=bool)
+        order = order[last]
+
+        self.names = names
+        self.urlids = index['urlid'][order]
+        self.shard = shard[order]
+        self.offset = index['offset'][order]
+        self.size = index['size'][order]
+
+    def __len__(self):
+        return len(self.urlids)
+
+    def __contains__(self, urlid):
+        return self.locate(urlid) is not None
+
+    def locate(self, urlid):
+        i = np.searchsorted(self.urlids, int(urlid))
+
+        if i < len(self.urlids) and self.urlids[i] == int(urlid):
+            return i
+
+        return None
+
+    def mapping(self, shard):
+        if shard not in self._maps:
+            with open(os.path.join(self.directory, self.names[shard] + '.bin'), 'rb') as infile:
+                self._maps[shard] = memoryview(mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ))
+
+        return self._maps[shard]
+
+    def read(self, urlid):
+        i = self.locate(urlid)
+
+        if i is None:
+            raise IOError('%s not in %s' % (urlid, self.directory))
+
+        offset, size = int(self.offset[i]), int(self.size[i])
+
+        if not size:
+            # an empty shard cannot be mapped
+            return memoryview(b'')
+
+        return self.mapping(self.shard[i])[offset:offset + size]
+
+    def drop_cache(self, urlids=None):
+        for name in self.names:
+            fd = os.open(os.path.join(self.directory, name + '.bin'), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+    def stats(self):
+        sizes = [os.path.getsize(os.path.join(self.directory, name + '.bin')) for name in self.names]
+        return {'pages': len(self), 'shards': len(self.names), 'bytes': sum(sizes),
+                'live_bytes': int(self.size.sum())}
+
+
+class ShardWriter(object):
+    """
+    Writes pages straight into a new shard file, only their index is kept in
+    memory. close() renames the shard into place, the index last, so readers
+    never see a partial shard.
+    """
+
+    def __init__(self, directory, number):
+        self.name = os.path.join(directory, 'shard-%05d' % number)
+        self.index = []
+        self.size = 0
+        self.outfile = open(self.name + '.bin.tmp', 'wb')
+
+    def write(self, urlid, content):
+        self.outfile.write(content)
+        self.index.append((int(urlid), self.size, len(content)))
+        self.size += len(content)
+
+    def close(self):
+        self.outfile.close()
+        os.replace(self.name + '.bin.tmp', self.name + '.bin')
+
+        with open(self.name + '.idx.tmp', 'wb') as outfile:
+            np.save(outfile, np.array(self.index, dtype=INDEX))
+
+        os.replace(self.name + '.idx.tmp', self.name + '.idx.npy')
+
+    def abort(self):
+        self.outfile.close()
+        os.remove(self.name + '.bin.tmp')
+
+
+def write_shard(directory, number, pages):
+    """
+    Write (urlid, content) pairs as one shard
+    """
+    writer = ShardWriter(directory, number)
+
+    for urlid, content in pages:
+        writer.write(urlid, content)
+
+    writer.close()
+
+def append(directory, source, urlids, shard_size=1 << 30):
+    """
+    Pack the pages of urlids read from source into new shards of about
+    shard_size bytes after the existing ones. Pages go to disk as they are
+    read, a failing read leaves the shards finished before it in place.
+
+    directory: packed corpus, created when missing
+    source: anything with read(urlid), e.g. DirectorySource or TarSource
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    shards = PackedCorpus(directory).shards()
+    number = int(shards[-1][len('shard-'):]) + 1 if shards else 0
+
+    writer = None
+
+    try:
+        for urlid in urlids:
+            if writer is None:
+                writer = ShardWriter(directory, number)
+
+            writer.write(urlid, source.read(urlid))
+
+            if writer.size >= shard_size:
+                writer.close()
+                number += 1
+                writer = None
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    if writer is not None:
+        writer.close()
+
+    return PackedCorpus(directory)
+
+def open_source(path):
+    """
+    Reader for a raw content location, packed, tar or one file per urlid
+    """
+    if path.endswith('.tar'):
+        return TarSource(path)
+
+    if PackedCorpus.is_packed(path):
+        return PackedCorpus(path)
+
+    return DirectorySource(path)
+
+def source_urlids(source):
+    if isinstance(source, PackedCorpus):
+        return [str(urlid) for urlid in source.urlids]
+
+    if isinstance(source, TarSource):
+        return sorted(source.index)
+
+    return sorted(os.listdir(source.directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack raw_content pages into memory mapped shards')
+    commands = parser.add_subparsers(dest='command')
+
+    pack = commands.add_parser('pack', help='append the pages of a raw_content directory or tar as new shards')
+    pack.add_argument('source', help='directory with one file per urlid, or a tar of them')
+    pack.add_argument('directory', help='packed corpus, created when missing')
+    pack.add_argument('--shard-mb', type=int, default=1024)
+    pack.add_argument('--new-only', action='store_true', help='skip urlids already packed')
+
+    stats = commands.add_parser('stats', help='pages, shards and sizes of a packed corpus')
+    stats.add_argument('directory')
+
+    cat = commands.add_parser('cat', help='write one page to stdout')
+    cat.add_argument('directory')
+    cat.add_argument('urlid')
+
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        source = open_source(args.source)
+        urlids = source_urlids(source)
+
+        if args.new_only and PackedCorpus.is_packed(args.directory):
+            packed = PackedCorpus(args.directory)
+            urlids = [urlid for urlid in urlids if urlid not in packed]
+
+        corpus = append(args.directory, source, urlids, args.shard_mb << 20)
+        print('packed %d pages, %s' % (len(urlids), corpus.stats()))
+    elif args.command == 'stats':
+        print(PackedCorpus(args.directory).stats())
+    elif args.command == 'cat':
+        sys.stdout.buffer.write(PackedCorpus(args.directory).read(args.urlid))
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import os
+import json
+import sqlite3
+import hashlib
+
+
+class ParseCache(object):
+    """
+    Per document cache of parsed raw_content, backed by a sqlite database in
+    WAL mode so any number of processes can read while one of them writes.
+
+    A row is only served back if the digest stored next to it matches the
+    digest of the current file content, which also covers the extractor
+    version, so new or modified pages are the only ones that get reparsed.
+    """
+
+    BATCH = 500
+
+    def __init__(self, path, version=''):
+        """
+        path: sqlite file the parsed rows are kept in
+        version: anything that changes the parsed output e.g. extractor
+                 version and list of tags
+        """
+        self.path = path
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = None
+        self._pid = None
+
+    def __getstate__(self):
+        # connections cannot cross process boundaries, reopen lazily instead
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        state['_pid'] = None
+        return state
+
+    @property
+    def conn(self):
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS parsed '
+                               '(urlid TEXT PRIMARY KEY, digest TEXT, row TEXT)')
+            self._pid = os.getpid()
+
+        return self._conn
+
+    def digest(self, content):
+        """
+        Hash of the raw bytes of a document plus the extractor version
+        """
+        h = hashlib.sha1(self.version.encode('utf-8'))
+        h.update(content)
+        return h.hexdigest()
+
+    def get_many(self, keys):
+        """
+        Look up parsed rows, keys is a list of (urlid, digest) pairs. Returns a
+        dict urlid -> row holding only the entries that are still valid.
+        """
+        keys = [(str(urlid), digest) for urlid, digest in keys]
+        found = {}
+
+        for i in range(0, len(keys), self.BATCH):
+            batch = dict(keys[i:i + self.BATCH])
+            query = 'SELECT urlid, digest, row FROM parsed WHERE urlid IN (%s)' % ','.join('?' * len(batch))
+
+            for urlid, digest, row in self.conn.execute(query, list(batch)):
+                if batch[urlid] == digest:
+                    found[urlid] = json.loads(row)
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+
+        return found
+
+    def put_many(self, items):
+        """
+        Store parsed rows, items is a list of (urlid, digest, row) tuples.
+        Older entries for the same urlid are replaced.
+        """
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO parsed VALUES (?, ?, ?)',
+                                  [(str(urlid), digest, json.dumps(row)) for urlid, digest, row in items])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.
+        }
+
+    def __str__(self):
+        return 'ParseCache(hits={hits}, misses={misses}, hit_rate={hit_rate:.2%})'.format(**self.stats())
@@ -1,28 +1,96 @@
 import os, sys
 import re
 
+from multiprocessing import Pool, cpu_count
 from sklearn.externals import joblib
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Tag
+from lxml import etree
 from collections import defaultdict
+from functools import lru_cache
 
 basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
 sys.path.append(os.path.join(basepath, 'src'))
 
 
 from data import load_datasets
+from data.parse_cache import ParseCache
+from data.corpus_loader import CorpusLoader
+from data.packed_corpus import open_source
+
+
+# one file per urlid, or the same pages packed by data.packed_corpus
+RAW_CONTENT = os.path.join(basepath, 'data/raw/raw_content')
+
+NON_WORDS = re.compile(r'[^a-z0-9]+')
+
+# lxml is only fed utf-8 bytes so encoding declarations in the page are ignored
+LXML_PARSER = etree.HTMLParser(encoding='utf-8')
+
+
+def clean_text(s):
+	s = s.lower()
+	s = s.strip()
+	return NON_WORDS.sub(' ', s)
+
+
+@lru_cache(maxsize=None)
+def raw_source(path=RAW_CONTENT):
+	"""
+	Reader of the raw pages, opened once per process
+	"""
+	return open_source(path)
+
+
+def tag_slots(tags):
+	"""
+	Split tag specs into plain tag names and meta names, each mapped to the
+	positions in tags it has to fill
+	
+	tags: list of tag specs e.g. ['h1', 'meta-description']
+	"""
+	plain = defaultdict(list)
+	meta = defaultdict(list)
+	
+	for i, tag in enumerate(tags):
+		tags_component = tag.split('-')
+		
+		if len(tags_component) > 1:
+			meta[tags_component[1]].append(i)
+		else:
+			plain[tags_component[0]].append(i)
+	
+	return plain, meta
+
+
+def _extract_chunk(args):
+	"""
+	Worker entry point for the process pool, parses one shard of urlids
+
+	args: tuple of (Parse instance, list of urlids)
+	"""
+	parser, urlids = args
+	return parser.extract_many(urlids)
 
 
 class Parse():
 	TAGS = ['h1', 'h2', 'h3', 'h4', 'span',\
 			'a', 'label_', 'meta-title', 'meta-description','li']
 	
+	# bump whenever a change to the extraction changes its output
+	VERSION = 2
+	
 	@staticmethod
 	def read_html(urlid):
-		with open(os.path.join(basepath, 'data/raw/raw_content/'+str(urlid)), 'r', encoding='utf-8', errors='ignore') as infile:
-			html = infile.read()
-			infile.close()
-		return html
+		return Parse.decode(raw_source().read(urlid))
+	
+	@staticmethod
+	def decode(content):
+		"""
+		Raw bytes of a page, or a memoryview of a packed one, decoded the way
+		a text mode open would
+		"""
+		return str(content, 'utf-8', 'ignore').replace('\r\n', '\n').replace('\r', '\n')
 	
 	@staticmethod
 	def parse_html(html):
@@ -59,51 +127,230 @@ class Parse():
 			else:
 				return process(el.text) if el.text else ''        
 		return '' # could not find the tag
+	
+	@staticmethod
+	def extract_tags(html, tags):
+		"""
+		Same output as remove_tags followed by tag_content for every tag, but
+		the tree is walked once and stops as soon as every slot is filled
+		
+		html: parsed BeautifulSoup document
+		tags: list of tag specs e.g. Parse.TAGS
+		"""
+		plain, meta = tag_slots(tags)
+		found = [None] * len(tags)
+		pending = len(tags)
+		
+		for el in html.descendants:
+			if not isinstance(el, Tag):
+				continue
+			
+			slots = plain.get(el.name, ())
+			
+			if el.name == 'meta' and meta:
+				slots = list(slots) + meta.get(el.get('name'), [])
+			
+			for i in slots:
+				if found[i] is None:
+					found[i] = el
+					pending -= 1
+			
+			if not pending:
+				break
+		
+		row = []
 		
-	def __init__(self, key='urlid'):
+		for i, el in enumerate(found):
+			if el is None:
+				row.append('')
+			elif el.name == 'meta' and i not in plain.get('meta', ()):
+				row.append(clean_text(el.get('content', '')))
+			else:
+				# script and style only matter for the text of the matched elements
+				for junk in el.find_all(['script', 'style']):
+					junk.extract()
+				
+				text = el.text
+				row.append(clean_text(text) if text else '')
+		
+		return row
+	
+	@staticmethod
+	def extract_tags_lxml(html, tags):
+		"""
+		lxml native version of extract_tags that never builds a BeautifulSoup
+		tree, returns None when lxml cannot make sense of the document
+		
+		html: raw html string
+		tags: list of tag specs e.g. Parse.TAGS
+		"""
+		try:
+			root = etree.fromstring(html.encode('utf-8'), LXML_PARSER)
+		except (etree.XMLSyntaxError, ValueError):
+			return None
+		
+		if root is None:
+			return None
+		
+		plain, meta = tag_slots(tags)
+		names = set(plain)
+		
+		if meta:
+			names.add('meta')
+		
+		found = [None] * len(tags)
+		pending = len(tags)
+		
+		for el in root.iter(*names):
+			slots = plain.get(el.tag, ())
+			
+			if el.tag == 'meta' and meta:
+				slots = list(slots) + meta.get(el.get('name'), [])
+			
+			for i in slots:
+				if found[i] is None:
+					found[i] = el
+					pending -= 1
+			
+			if not pending:
+				break
+		
+		row = []
+		
+		for i, el in enumerate(found):
+			if el is None:
+				row.append('')
+			elif el.tag == 'meta' and i not in plain.get('meta', ()):
+				row.append(clean_text(el.get('content', '')))
+			else:
+				etree.strip_elements(el, 'script', 'style', with_tail=False)
+				
+				text = ''.join(el.itertext())
+				row.append(clean_text(text) if text else '')
+		
+		return row
+		
+	def __init__(self, key='urlid', n_jobs=1, chunksize=100, engine='soup', cache=None, loader=None):
+		"""
+		key: column holding the urlid of every page
+		n_jobs: number of worker processes, -1 uses every core
+		chunksize: number of urlids handed to a worker at a time
+		engine: 'soup' or 'lxml', the latter skips BeautifulSoup and falls
+				back to it only for documents lxml cannot parse
+		cache: optional ParseCache, only pages missing from it get parsed
+		loader: CorpusLoader the pages are read through, by default the
+				raw_content directory with reads running ahead of the parsing
+		"""
 		self.key = key
+		self.n_jobs = n_jobs
+		self.chunksize = chunksize
+		self.engine = engine
+		self.cache = cache
+		self.loader = loader or CorpusLoader(raw_source())
 	
 	def fit(self, X, y=None):
 		return self
 	
-	def transform(self, df):
-		urlids = df[self.key]
-		tags_content_dict = defaultdict(list)
+	def extract(self, urlid):
+		"""
+		Parse a single page and return the content of every tag in TAGS
+		"""
+		return self.extract_html(self.read_html(urlid))
+	
+	def extract_html(self, html):
+		"""
+		Content of every tag in TAGS for a page already in memory
+		"""
+		if self.engine == 'lxml':
+			row = self.extract_tags_lxml(html, self.TAGS)
+			
+			if row is not None:
+				return row
+		
+		return self.extract_tags(self.parse_html(html), self.TAGS)
+	
+	def extract_many(self, urlids):
+		"""
+		extract over many pages, the next ones are read while one is parsed
+		"""
+		return [self.extract_html(self.decode(content)) for _, content in self.loader.iter(urlids)]
+	
+	@classmethod
+	def cache_version(cls):
+		return '%d:%s' % (cls.VERSION, ','.join(cls.TAGS))
+	
+	def extract_all(self, urlids):
+		"""
+		Parse every page, rows come back in the same order as urlids
+		"""
+		urlids = list(urlids)
+		
+		if self.cache is None:
+			return self.extract_pages(urlids)
+		
+		digests = [self.cache.digest(content) for _, content in self.loader.iter(urlids)]
 		
-		for urlid in urlids.values:
-			html = self.read_html(urlid)
-			html = self.parse_html(html)
-			html = self.remove_tags(html, ['style', 'script'])
+		cached = self.cache.get_many(list(zip(urlids, digests)))
+		missing = [(urlid, digest) for urlid, digest in zip(urlids, digests) if str(urlid) not in cached]
+		
+		if missing:
+			rows = self.extract_pages([urlid for urlid, digest in missing])
+			self.cache.put_many([(urlid, digest, row) for (urlid, digest), row in zip(missing, rows)])
 			
-			for tag in self.TAGS:
-				tags_content_dict[tag].append(self.tag_content(html, tag))
+			for (urlid, digest), row in zip(missing, rows):
+				cached[str(urlid)] = row
+		
+		return [cached[str(urlid)] for urlid in urlids]
+	
+	def extract_pages(self, urlids):
+		"""
+		Parse pages without looking at the cache, serially or on the pool
+		"""
+		n_jobs = self.n_jobs if self.n_jobs > 0 else max(cpu_count() + 1 + self.n_jobs, 1)
+		
+		if n_jobs == 1 or len(urlids) <= self.chunksize:
+			return self.extract_many(urlids)
 		
-		for tag in self.TAGS:
-			df[tag] = tags_content_dict[tag]
+		chunks = [(self, urlids[i:i + self.chunksize]) for i in range(0, len(urlids), self.chunksize)]
+		rows = []
+		
+		# imap hands out chunks as workers free up but yields them in order
+		with Pool(n_jobs) as pool:
+			for chunk in pool.imap(_extract_chunk, chunks):
+				rows.extend(chunk)
+		
+		return rows
+	
+	def transform(self, df):
+		rows = self.extract_all(df[self.key].values)
+		
+		for i, tag in enumerate(self.TAGS):
+			df[tag] = [row[i] for row in rows]
 		
 		return df
 
 
-def main():
-	try:
-		# load pickle from the disk
-		train = joblib.load(os.path.join(basepath, 'data/processed/train_raw_content.pkl'))
-		test = joblib.load(os.path.join(basepath, 'data/processed/test_raw_content.pkl'))
-		
-		return train, test
-	except:
-		# parse raw content
-		train, test, sample_sub = load_datasets.load_dataset()
+def main(n_jobs=-1, verbose=False):
+	"""
+	verbose: print the hits and misses of the parse cache
+	"""
+	train, test, sample_sub = load_datasets.load_dataset()
+	
+	# parse raw content, only new or modified pages miss the cache
+	cache = ParseCache(os.path.join(basepath, 'data/processed/raw_content_cache.db'), Parse.cache_version())
+	
+	parse_train = Parse(n_jobs=n_jobs, cache=cache)
+	train = parse_train.transform(train)
 
-		parse_train = Parse()
-		train = parse_train.transform(train)
+	parse_test = Parse(n_jobs=n_jobs, cache=cache)
+	test = parse_test.transform(test)
+	
+	if verbose:
+		print(cache)
 
-		parse_test = Parse()
-		test = parse_test.transform(test)
+	# dump the parsed data in the processed folder
 
-		# dump the parsed data in the processed folder
+	joblib.dump(train, os.path.join(basepath, 'data/processed/train_raw_content.pkl'))
+	joblib.dump(test, os.path.join(basepath, 'data/processed/test_raw_content.pkl'))
 
-		joblib.dump(train, os.path.join(basepath, 'data/processed/train_raw_content.pkl'))
-		joblib.dump(test, os.path.join(basepath, 'data/processed/test_raw_content.pkl'))
-	 	
-	 	return train, test
\ No newline at end of file
+	return train, test
@@ -1,11 +1,15 @@
-import json, re
+from helpers.jsonl import read_jsonl_batches
 
-def main():
-    # load data
+def main(batch_size=1000):
+    """
+    Only counts the records of extracted_text, no words are counted yet.
+    The file is streamed so a single batch is in memory at a time.
+    """
     
     path = '../data/processed/extracted_text'
+    n_records = 0
     
-    with open(path, 'r') as infile:
-        data = list(map(json.loads, infile))
-        print('data loaded is', data)
-        infile.close()
\ No newline at end of file
+    for batch in read_jsonl_batches(path, batch_size):
+        n_records += len(batch)
+    
+    print('data loaded is', n_records, 'records')
@@ -2,73 +2,138 @@ import re
 
 import numpy as np
 from scipy import sparse
-from scipy.sparse import dok_matrix
 
-from functools import reduce
+from functools import reduce, lru_cache
 
 from sklearn.preprocessing import normalize
 from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
 from sklearn.feature_extraction.text import TfidfTransformer
 
 from nltk.stem.porter import PorterStemmer
-from collections import defaultdict
+from collections import OrderedDict
+
+from helpers import feature_store
 
 stemmer = PorterStemmer()
 
+# objects loaded from disk once per process, see load_cached
+_loaded = {}
+
+# matches a whole expression of the form name(param, param, ...)
+FUNCTION = re.compile(r'^(\w*)\(([^)]*)\)$')
+
 def save(name, data):
-    """ save object to disk for caching """
+    """
+    save object to disk for caching, matrices and dicts of them go to the
+    columnar feature store so fields can be loaded one at a time
+    """
     import pickle
+    
+    path = '../data/processed/'+name
+    
+    # load_cached must not keep handing out the old value, nor what was
+    # derived from it
+    _loaded.pop(name, None)
+    
+    if name == 'stopword_matrix':
+        _loaded.pop('stopword_mask', None)
+    
+    if feature_store.storable(data):
+        return feature_store.write(path, data)
+    
+    feature_store.remove(path)
 
-    with open('../data/processed/'+name, 'wb') as f:
+    with open(path, 'wb') as f:
         pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
         f.close()
 
 def load(name):
+    """ stored matrices come back memory mapped, a dict as a lazy FeatureStore """
     import pickle
     
-    with open('../data/processed/'+name, 'rb') as f:
+    path = '../data/processed/'+name
+    
+    if feature_store.is_stored(path):
+        return feature_store.read(path)
+    
+    with open(path, 'rb') as f:
         data = pickle.load(f)
     
     return data
+
+def load_cached(name):
+    """ load object from disk the first time it is asked for, then keep it in memory """
+    if name not in _loaded:
+        _loaded[name] = load(name)
     
-def make_stopword_matrix():
-    words = load('text_vectorizer').get_feature_names()
+    return _loaded[name]
     
-    matrix = sparse.eye(len(words), format='dok')
+def make_stopword_mask(words=None):
+    """
+    Boolean mask over the vocabulary, False for english stop words
     
-    for word_id, word in enumerate(words):
-        if word in ENGLISH_STOP_WORDS:
-            matrix[word_id, word_id] = 0
-        
-    return matrix.tocsr()
+    words: vocabulary, defaults to the one of text_vectorizer
+    """
+    if words is None:
+        words = load_cached('text_vectorizer').get_feature_names()
+    
+    return np.array([word not in ENGLISH_STOP_WORDS for word in words], dtype=bool)
+    
+def make_stopword_matrix(words=None):
+    mask = make_stopword_mask(words)
+    
+    # identity matrix without the entries of the stop words
+    indices = np.flatnonzero(mask)
+    indptr = np.concatenate(([0], np.cumsum(mask)))
+    
+    return sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(mask), len(mask)))
 
-def make_stem_matrix():
-    words = load('text_vectorizer').get_feature_names()
+@lru_cache(maxsize=None)
+def stem(word):
+    return stemmer.stem(word)
+
+def make_stem_matrix(words=None):
+    if words is None:
+        words = load_cached('text_vectorizer').get_feature_names()
     
-    # stem all words
-    stems = defaultdict(list)
+    # stem ids in order of first appearance, one entry per word
+    stems = {}
+    stem_ids = np.array([stems.setdefault(stem(word), len(stems)) for word in words], dtype=np.int32)
     
-    for word_id, word in enumerate(words):
-        stems[stemmer.stem(word)].append(word_id)
-        
-    # make matrix
-    matrix = dok_matrix((len(words), len(stems)))
+    return sparse.csr_matrix((np.ones(len(words)), stem_ids, np.arange(len(words) + 1)),
+                             shape=(len(words), len(stems)))
+
+def stopword_mask():
+    """ mask equivalent to the stored stopword_matrix, i.e. its diagonal """
+    if 'stopword_mask' not in _loaded:
+        _loaded['stopword_mask'] = load_cached('stopword_matrix').diagonal() != 0
     
-    for stem_id, s in enumerate(stems):
-        for word_id in stems[s]:
-            matrix[word_id, stem_id] = 1.
-            
-    return matrix.tocsr()
+    return _loaded['stopword_mask']
+
+def mask_columns(data, mask):
+    """
+    Same as data * diag(mask) without the sparse product: drops the entries
+    of masked columns along with explicit zeros
+    
+    data: sparse matrix
+    mask: boolean array, one entry per column
+    """
+    data = sparse.csr_matrix(data)
+    keep = mask[data.indices] & (data.data != 0)
+    indptr = np.concatenate(([0], np.cumsum(keep)))[data.indptr]
+    
+    return sparse.csr_matrix((data.data[keep].astype(np.result_type(data.dtype, np.float64)),
+                              data.indices[keep], indptr), shape=data.shape)
 
 def get_featureset(name, stem=True, tf_idf=True, stopwords=False, norm='l2',
-                   use_idf=1, smooth_idf=1, sublinear_tf=1, binary=False):
+                   use_idf=1, smooth_idf=1, sublinear_tf=1, binary=False, memo=None):
 
-    data = parse(name)
+    data = parse(name, memo)
 
     if stopwords:
-        data = data * load('stopword_matrix')
+        data = mask_columns(data, stopword_mask())
     if stem:
-        data = data * load('stem_matrix')
+        data = data * load_cached('stem_matrix')
     if tf_idf:
         data = TfidfTransformer(use_idf=use_idf, smooth_idf=smooth_idf, sublinear_tf=sublinear_tf).fit_transform(data)
     if norm:
@@ -78,67 +143,247 @@ def get_featureset(name, stem=True, tf_idf=True, stopwords=False, norm='l2',
 
     return data
     
-def parse(s):
+def nbytes(value):
+    """ memory held by a dense or sparse matrix """
+    if sparse.issparse(value):
+        value = value.tocsr()
+        return value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+    
+    return getattr(value, 'nbytes', 0)
+
+class FeatureSetCache(object):
+    """
+    Least recently used cache of feature sets under a memory budget.
+    
+    get() memoizes get_featureset by (expression, options) and fetch() any
+    other derived data, e.g. decompositions. The cache also serves as the
+    parse memo of every expression it computes, so subexpressions shared by
+    different expressions and options are evaluated once and compete for
+    the same budget. Values are shared, treat them as read only.
+    """
+    
+    def __init__(self, max_bytes=2 << 30):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def __contains__(self, key):
+        return key in self.entries
+    
+    def __getitem__(self, key):
+        value = self.entries[key]
+        self.entries.move_to_end(key)
+        
+        return value
+    
+    def __setitem__(self, key, value):
+        if key in self.entries:
+            self.size -= nbytes(self.entries.pop(key))
+        
+        self.entries[key] = value
+        self.size += nbytes(value)
+        
+        # evict the oldest entries, the newest is always kept
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            self.size -= nbytes(self.entries.popitem(last=False)[1])
+    
+    def fetch(self, key, compute):
+        """
+        Cached value of key, calling compute() to build it on a miss
+        """
+        if key in self.entries:
+            self.hits += 1
+            return self[key]
+        
+        self.misses += 1
+        value = compute()
+        self[key] = value
+        
+        return value
+    
+    def get(self, name, **options):
+        """
+        Same as get_featureset(name, **options), computed once per budget
+        """
+        key = ('featureset', name.replace(' ', ''), tuple(sorted(options.items())))
+        
+        return self.fetch(key, lambda: get_featureset(name, memo=self, **options))
+    
+def parse(s, memo=None):
+    """
+    Evaluate a dataset expression e.g. 'max(title, h1) * 10 + boilerplate'
+    against the in-memory text features
+    
+    s: dataset expression
+    memo: dict of already evaluated subexpressions, pass the same dict to
+          share them between expressions. By default subexpressions are
+          only shared within s.
+    """
     # remove spaces if any
     
     if ' ' in s:
         s = s.replace(' ', '')
-    return _parse(s).copy()
+    
+    text = load_cached('text_features')
+    expr = compile_expression(s, tuple(text))
+    
+    return evaluate(expr, text, {} if memo is None else memo).copy()
 
 def _apply(fun, items):
     assert len(items) > 0
     return reduce(fun, items[1:], items[0])
 
-def _parse(s):
-    text = load('text_features')
-    function = re.compile(r'^(\w*)\(([^)]*)\)$')
-    
-    plus = lambda x, y: x + y
-    times = lambda x, y: x * y
+@lru_cache(maxsize=None)
+def compile_expression(s, fields):
+    """
+    Compile a dataset expression into a tree of (op, args) tuples. Equal
+    subexpressions compile to equal tuples so they can be used as memo keys.
     
+    s: dataset expression without spaces
+    fields: names of the text features, used to expand max(all)
+    """
     # replace some strings
     if s == 'body':
         s = 'h1+h2+h3+img+a+other'
     
     # apply functions
-    if function.match(s):
-        name, param = function.match(s).group(1, 2)
+    if FUNCTION.match(s):
+        name, param = FUNCTION.match(s).group(1, 2)
         
         if param == 'all':
-            param = ','.join(text)
+            param = ','.join(fields)
+        
+        items = [compile_expression(p, fields) for p in param.split(',')]
         
-        items = list(map(_parse, param.split(',')))
+        # max does not care about order, so max(h1,title) == max(title,h1)
+        if name == 'max':
+            items = sorted(items)
         
-        return _apply({'max': maximum, 'sum': plus}[name], items)
+        return (name, tuple(items))
     
     # addition and multiplication
     if '+' in s:
-        items = list(map(_parse, s.split('+')))
-        return _apply(plus, items)
+        return ('+', tuple(compile_expression(p, fields) for p in s.split('+')))
     
     if '*' in s:
-        items = list(map(_parse, s.split('*')))
-        return _apply(times, items)
+        return ('*', tuple(compile_expression(p, fields) for p in s.split('*')))
     
     # try to parse any numbers
     try:
-        return float(s)
+        return ('number', float(s))
     except ValueError:
         pass
     
-    # return corresponding dataset
-    return text[s]
+    # corresponding dataset
+    return ('dataset', s)
+
+def evaluate(expr, text, memo):
+    """
+    Evaluate a compiled expression, every function, sum and product is
+    computed once per memo
+    
+    expr: tree returned by compile_expression
+    text: dict like object of text features
+    memo: dict the evaluated subexpressions are kept in
+    """
+    op, args = expr
+    
+    if op == 'number':
+        return args
+    
+    if op == 'dataset':
+        return text[args]
+    
+    if expr not in memo:
+        plus = lambda x, y: x + y
+        times = lambda x, y: x * y
+        
+        items = [evaluate(item, text, memo) for item in args]
+        
+        if op == 'max':
+            memo[expr] = maximum(*items)
+        else:
+            memo[expr] = _apply({'sum': plus, '+': plus, '*': times}[op], items)
+    
+    return memo[expr]
+    
+def sparse_maximum(*matrices, block_size=1 << 20):
+    """
+    Element-wise maximum of any number of CSR matrices of the same shape.
+    
+    Rows are handled in blocks of about block_size stored entries. Within a
+    block the entries of all inputs are merged in one stable sort on their
+    (row, column) position, every run of equal positions is reduced with
+    np.maximum.reduceat and positions missing from some input are compared
+    with the implicit zero. No intermediate sparse matrices are built.
+    """
+    matrices = [M if M.has_canonical_format else M.tocsr(copy=True) for M in matrices]
+    
+    for M in matrices:
+        M.sum_duplicates()
+    
+    n_rows, n_cols = matrices[0].shape
+    dtype = np.result_type(*matrices)
+    
+    # split rows so that every block holds about block_size entries
+    nnz_per_row = sum(np.diff(M.indptr) for M in matrices)
+    bounds = np.searchsorted(np.cumsum(nnz_per_row), np.arange(block_size, nnz_per_row.sum(), block_size))
+    bounds = np.unique(np.concatenate(([0], bounds + 1, [n_rows])).clip(0, n_rows))
+    
+    indices, data, row_counts = [], [], []
+    
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        keys, values = [], []
+        
+        for M in matrices:
+            lo, hi = M.indptr[start], M.indptr[stop]
+            rows = np.repeat(np.arange(stop - start, dtype=np.int64), np.diff(M.indptr[start:stop + 1]))
+            
+            keys.append(rows * n_cols + M.indices[lo:hi])
+            values.append(M.data[lo:hi])
+        
+        keys = np.concatenate(keys)
+        values = np.concatenate(values).astype(dtype, copy=False)
+        
+        if not len(keys):
+            row_counts.append(np.zeros(stop - start, dtype=np.int64))
+            continue
+        
+        # every input is sorted already, so the stable sort only merges runs
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        values = values[order]
+        
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        counts = np.diff(np.append(starts, len(keys)))
+        values = np.maximum.reduceat(values, starts)
+        keys = keys[starts]
+        
+        missing = counts < len(matrices)
+        values[missing] = np.maximum(values[missing], 0)
+        
+        keep = values != 0
+        keys = keys[keep]
+        
+        indices.append((keys % n_cols).astype(matrices[0].indices.dtype))
+        data.append(values[keep])
+        row_counts.append(np.bincount(keys // n_cols, minlength=stop - start))
+    
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
     
-def sparse_maximum(A, B):
-    BisBigger = A-B
-    BisBigger.data = np.where(BisBigger.data < 0, 1, 0)
+    if row_counts:
+        np.cumsum(np.concatenate(row_counts), out=indptr[1:])
     
-    return A - A.multiply(BisBigger) + B.multiply(BisBigger)
+    return sparse.csr_matrix((np.concatenate(data) if data else np.zeros(0, dtype=dtype),
+                              np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32),
+                              indptr), shape=(n_rows, n_cols))
 
-def maximum(A, B):
+def maximum(*items):
     from scipy.sparse import issparse, csr_matrix
     
-    if issparse(A) or issparse(B):
-        return sparse_maximum(csr_matrix(A), csr_matrix(B))
+    if any(issparse(item) for item in items):
+        return sparse_maximum(*[csr_matrix(item) for item in items])
     else:
-        return np.maximum(A, B)
+        return reduce(np.maximum, items)
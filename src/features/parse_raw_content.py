@@ -1,8 +1,16 @@
-import re, json, datetime
+import re, time, datetime
 
+from collections import defaultdict
+from functools import lru_cache
+from itertools import chain
 from unidecode import unidecode
 from bs4 import BeautifulSoup
 
+from data.make_dataset import iter_records
+from data.corpus_loader import CorpusLoader
+from data.packed_corpus import open_source
+from helpers.jsonl import write_jsonl
+
 
 # html tags of interest
 TAGS = ['title', 'h1', 'h2', 'h3', 'meta-description', 'meta-keywords',
@@ -13,99 +21,213 @@ def clean_string(s):
     s = re.sub(r'\s+', ' ', s)
     return s.strip()
     
-def soupify(urlid, parser='lxml'):
-    filename = '../data/raw/raw_content/' + str(urlid)
+class ParserChoice(object):
+    """
+    Picks the BeautifulSoup parser for a page before parsing it, so that a
+    page is parsed once instead of going through lxml, xml and html5lib in
+    turn. When the guess is wrong the parser that last worked for the same
+    domain is tried next. Every parse is timed so report() can show where
+    the time goes.
+    """
+    
+    PARSERS = ['lxml', 'xml', 'html5lib']
+    
+    # <body> means lxml will find it, which is by far the common case
+    BODY = re.compile(rb'<body[\s>/]', re.I)
+    
+    # markup lxml keeps out of the body, anything else makes lxml create one
+    NO_BODY = re.compile(rb'<!--.*?-->|<!doctype[^>]*>|<\?xml[^>]*>|</?(?:html|head)[^>]*>|'
+                         rb'<(title|script|style)[^>]*>.*?</\1\s*>|<(?:meta|link|base)[^>]*>|\s+',
+                         re.I | re.S)
+    
+    def __init__(self):
+        self.domains = {}
+        self.attempts = defaultdict(int)
+        self.wins = defaultdict(int)
+        self.seconds = defaultdict(float)
+    
+    def sniff(self, html):
+        """
+        Cheaply guess the first parser of PARSERS that will find a body in a
+        page without a <body> tag, None if none of them will
+        
+        html: raw bytes of the page
+        """
+        rest = self.NO_BODY.sub(b'', html)
+        
+        if not rest:
+            # neither lxml nor xml make up a body for an empty document
+            return 'html5lib'
+        if rest[:9].lower() == b'<frameset':
+            return None
+        
+        return 'lxml'
+    
+    def candidates(self, html, domain=None):
+        """
+        Parsers to try in order: the sniffed guess, then whatever worked last
+        for this domain, then the rest of the old chain
+        """
+        first = 'lxml' if self.BODY.search(html) else self.sniff(html)
+        
+        if first is None:
+            return []
+        
+        order = [first]
+        remembered = self.domains.get(domain)
+        
+        if remembered and remembered != first:
+            order.append(remembered)
+        
+        return order + [parser for parser in self.PARSERS if parser not in order]
     
-    with open(filename, 'rb') as infile:
-        html = infile.read()
+    def parse(self, html, parser):
+        start = time.time()
+        soup = BeautifulSoup(html, parser) if parser else BeautifulSoup(html)
         
-        for parser in ['lxml', 'xml', 'html5lib']:
-            soup = BeautifulSoup(html, parser)
+        self.attempts[parser] += 1
+        self.seconds[parser] += time.time() - start
+        
+        return soup
+    
+    def soup(self, html, domain=None):
+        # BeautifulSoup wants bytes, packed pages come as memoryview slices
+        if isinstance(html, memoryview):
+            html = html.tobytes()
+        
+        for parser in self.candidates(html, domain):
+            soup = self.parse(html, parser)
             
             if soup.body:
+                self.wins[parser] += 1
+                
+                if domain is not None:
+                    self.domains[domain] = parser
+                
                 return soup
         
-        infile.close()
-        return BeautifulSoup(html)
+        # nothing finds a body e.g. framesets, keep whatever the default makes of it
+        self.wins[None] += 1
         
-def main(train, test):
-    data = train + test
+        return self.parse(html, None)
     
-    with open('../data/processed/extracted_text', 'w') as outfile:
-
-        for i, item in enumerate(data):
-            # status update
-            
-            if (i % 500 == 0):
-                print(i, datetime.datetime.now().time())
-            
+    def report(self):
+        lines = ['%-10s %10s %10s %10s %12s' % ('parser', 'attempts', 'used', 'seconds', 'ms/attempt')]
         
-            # parse file
-            parsed_data = {}
-            
-            soup = soupify(item['urlid'])
-            
-            # given boilerplate
+        for parser in self.PARSERS + [None]:
+            attempts = self.attempts[parser]
+            ms = 1000 * self.seconds[parser] / attempts if attempts else 0.
             
-            parsed_data['boilerplate'] = [item['title'], item['body']]
-            
-            # remove non-text tags
-            for tag in ['script', 'style']:
-                for el in soup.find_all(tag):
-                    el.extract()
-                    
-            # extract text from each tag
-            
-            for tag in TAGS:
-                items = []
-                
-                for el in soup.find_all(tag):
-                    el.extract()
-                    
-                    if tag == 'img':
-                        try:
-                            items.append(el['alt'])
-                        except KeyError:
-                            pass
-                        
-                        try:
-                            items.append(el['title'])
-                        except KeyError:
-                            pass
-                    else:
-                        items.append(el.text)
-                
-                parsed_data[tag] = items
+            lines.append('%-10s %10d %10d %10.2f %12.2f' % (parser or 'default', attempts, self.wins[parser],
+                                                             self.seconds[parser], ms))
+        
+        return '\n'.join(lines)
+
+
+parser_choice = ParserChoice()
+
+# one file per urlid, or the same pages packed by data.packed_corpus
+RAW_CONTENT = '../data/raw/raw_content/'
+
+@lru_cache(maxsize=None)
+def raw_source():
+    return open_source(RAW_CONTENT)
+
+def soupify(urlid, domain=None, html=None):
+    if html is None:
+        html = raw_source().read(urlid)
+    
+    return parser_choice.soup(html, domain)
+        
+def parse_item(item, html=None):
+    """
+    Extract the text of every tag of interest from the raw html of one page
+
+    item: parsed row of train/test with urlid, title and body
+    html: raw bytes of the page when already read, else read from disk
+    """
+
+    parsed_data = {}
+    
+    soup = soupify(item['urlid'], item.get('domain'), html)
+    
+    # given boilerplate
+    
+    parsed_data['boilerplate'] = [item['title'], item['body']]
+    
+    # remove non-text tags
+    for tag in ['script', 'style']:
+        for el in soup.find_all(tag):
+            el.extract()
             
-            # extract meta tags
-            meta = soup.find_all('meta')
+    # extract text from each tag
+    
+    for tag in TAGS:
+        items = []
+        
+        for el in soup.find_all(tag):
+            el.extract()
             
-            for el in meta:
-                prop = el.get('property') if el.get('property') else el.get('name')
-                
-                if not prop:
-                    continue
-                prop = prop.lower()
-                
+            if tag == 'img':
                 try:
-                    s = s.decode('unicode-escape')
-                except:
-                    continue
+                    items.append(el['alt'])
+                except KeyError:
+                    pass
                 
-                parsed_data['meta-'+prop] = s.split(u',') if prop == 'keywords' else [s]
-            
-            # clean string
-            for d in parsed_data:
-                parsed_data[d] = list(map(clean_string, parsed_data[d]))
-                parsed_data[d] = list(filter(None, parsed_data[d]))
+                try:
+                    items.append(el['title'])
+                except KeyError:
+                    pass
+            else:
+                items.append(el.text)
         
-            outfile.write(json.dumps(parsed_data))
-            outfile.write('\n')
-            
-        outfile.close()
-
-
+        parsed_data[tag] = items
+    
+    # extract meta tags
+    meta = soup.find_all('meta')
+    
+    for el in meta:
+        prop = el.get('property') if el.get('property') else el.get('name')
+        
+        if not prop:
+            continue
+        prop = prop.lower()
+        
+        try:
+            s = s.decode('unicode-escape')
+        except:
+            continue
+        
+        parsed_data['meta-'+prop] = s.split(u',') if prop == 'keywords' else [s]
+    
+    # clean string
+    for d in parsed_data:
+        parsed_data[d] = list(map(clean_string, parsed_data[d]))
+        parsed_data[d] = list(filter(None, parsed_data[d]))
 
+    return parsed_data
 
+def parse_items(items, loader=None):
+    """
+    Lazily parse pages one at a time, yields the extracted text of each.
+    The loader reads the next pages while the current one is parsed.
 
+    loader: CorpusLoader over the raw content, the raw_content directory by default
+    """
+    loader = loader or CorpusLoader(raw_source())
 
+    for i, (item, html) in enumerate(loader.iter(items, key=lambda item: item['urlid'])):
+        # status update
+        
+        if (i % 500 == 0):
+            print(i, datetime.datetime.now().time())
+        
+        yield parse_item(item, html)
+        
+def main(train, test, loader=None):
+    # stream train and test through the parser, nothing is kept in memory
+    data = chain(iter_records(train), iter_records(test))
+    
+    write_jsonl(parse_items(data, loader), '../data/processed/extracted_text')
+    
+    print(parser_choice.report())
@@ -0,0 +1,240 @@
+import os, sys
+import json
+import shutil
+import argparse
+
+import numpy as np
+
+from collections.abc import Mapping
+from scipy import sparse
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from helpers.shared_arrays import matrix_arrays, matrix_from_arrays
+
+META = 'meta.json'
+
+
+def storable(value):
+    """
+    True for what the store keeps as flat arrays: a sparse matrix, a
+    numeric ndarray, or a dict of those keyed by field name
+    """
+    if isinstance(value, Mapping):
+        return len(value) > 0 and all(isinstance(key, str) and storable(item) and not isinstance(item, Mapping)
+                                      for key, item in value.items())
+
+    if sparse.issparse(value):
+        return True
+
+    return isinstance(value, np.ndarray) and value.dtype.kind in 'biuf'
+
+def is_stored(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META))
+
+def load_array(path, mmap=True):
+    try:
+        return np.load(path, mmap_mode='r' if mmap else None)
+    except ValueError:
+        # empty arrays cannot be mapped
+        return np.load(path)
+
+def remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def write_matrix(path, value):
+    """
+    A sparse matrix as its CSR data, indices and indptr, or a dense one,
+    each in its own .npy file under the directory path
+    """
+    os.makedirs(path)
+    arrays = matrix_arrays(value)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), np.ascontiguousarray(array))
+
+    with open(os.path.join(path, META), 'w') as outfile:
+        json.dump({'format': 'dense' if 'dense' in arrays else 'csr'}, outfile)
+
+def read_matrix(path, mmap=True):
+    with open(os.path.join(path, META)) as infile:
+        names = ['dense'] if json.load(infile)['format'] == 'dense' else ['data', 'indices', 'indptr', 'shape']
+
+    return matrix_from_arrays({name: load_array(os.path.join(path, name + '.npy'), mmap) for name in names})
+
+def write(path, value):
+    """
+    Replace whatever is at path, a pickle included, with value stored as
+    flat arrays. A dict becomes one subdirectory per field.
+    """
+    tmp = path + '.tmp'
+    remove(tmp)
+
+    if isinstance(value, Mapping):
+        os.makedirs(tmp)
+
+        for name, item in value.items():
+            write_matrix(os.path.join(tmp, name), item)
+
+        with open(os.path.join(tmp, META), 'w') as outfile:
+            json.dump({'format': 'store', 'fields': list(value)}, outfile)
+    else:
+        write_matrix(tmp, value)
+
+    remove(path)
+    os.rename(tmp, path)
+
+def read(path, mmap=True):
+    """
+    What write stored at path, a dict comes back as a lazy FeatureStore
+    """
+    with open(os.path.join(path, META)) as infile:
+        meta = json.load(infile)
+
+    if meta['format'] == 'store':
+        return FeatureStore(path, mmap)
+
+    return read_matrix(path, mmap)
+
+def row_slice(X, start, stop):
+    """
+    Rows start to stop of a CSR matrix sharing its data and indices, only
+    the indptr is copied
+    """
+    lo, hi = X.indptr[start], X.indptr[stop]
+
+    # the constructor prunes, i.e. copies, views of much larger arrays
+    rows = sparse.csr_matrix((stop - start, X.shape[1]), dtype=X.dtype)
+    rows.data = X.data[lo:hi]
+    rows.indices = X.indices[lo:hi]
+    rows.indptr = (X.indptr[start:stop + 1] - lo).astype(X.indices.dtype)
+
+    return rows
+
+def row_runs(rows):
+    """
+    (start, stop) of every run of consecutive row numbers, None unless rows
+    is sorted ascending
+    """
+    rows = np.asarray(rows)
+
+    if rows.dtype == bool:
+        rows = np.flatnonzero(rows)
+
+    if not len(rows):
+        return []
+
+    steps = np.diff(rows)
+
+    if np.any(steps <= 0):
+        return None
+
+    breaks = np.flatnonzero(steps != 1) + 1
+    starts = np.concatenate(([0], breaks))
+    stops = np.concatenate((breaks, [len(rows)]))
+
+    return [(int(rows[i]), int(rows[j - 1]) + 1) for i, j in zip(starts, stops)]
+
+def take_rows(X, rows):
+    """
+    X[rows] for a CSR or dense matrix, without fancy indexing when rows are
+    sorted. A single run of consecutive rows, e.g. the test rows of an
+    unshuffled KFold, is a view sharing the data of X. A few runs, e.g. the
+    two train ranges around it, are views stacked with one copy. Rows of a
+    DataFrame are taken by position.
+    """
+    if hasattr(X, 'iloc'):
+        return X.iloc[rows]
+
+    if isinstance(rows, slice):
+        start, stop, step = rows.indices(X.shape[0])
+        runs = [(start, max(start, stop))] if step == 1 else None
+    else:
+        runs = row_runs(rows)
+
+    if runs is None or not runs or not (sparse.isspmatrix_csr(X) or isinstance(X, np.ndarray)):
+        return X[rows]
+
+    if isinstance(X, np.ndarray):
+        return X[runs[0][0]:runs[0][1]] if len(runs) == 1 else np.concatenate([X[a:b] for a, b in runs])
+
+    if len(runs) == 1:
+        return row_slice(X, *runs[0])
+
+    return sparse.vstack([row_slice(X, a, b) for a, b in runs], format='csr')
+
+class FeatureStore(Mapping):
+    """
+    Read only mapping of field name to matrix over a directory written by
+    write(). A field is memory mapped the first time it is asked for, so
+    loading title does not touch the other fields, and its matrix shares
+    the page cache with every process reading the same store.
+    """
+
+    def __init__(self, directory, mmap=True):
+        self.directory = directory
+        self.mmap = mmap
+        self.loaded = {}
+
+        with open(os.path.join(directory, META)) as infile:
+            self.fields = json.load(infile)['fields']
+
+    def __getstate__(self):
+        # workers map the fields again instead of receiving copies
+        state = self.__dict__.copy()
+        state['loaded'] = {}
+        return state
+
+    def __getitem__(self, name):
+        if name not in self.loaded:
+            if name not in self.fields:
+                raise KeyError(name)
+
+            self.loaded[name] = read_matrix(os.path.join(self.directory, name), self.mmap)
+
+        return self.loaded[name]
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def rows(self, name, rows):
+        """ rows of a field, see take_rows """
+        return take_rows(self[name], rows)
+
+    def nbytes(self):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(self.directory) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert pickled features in data/processed to the columnar store')
+    parser.add_argument('names', nargs='+', help='pickles under data/processed, e.g. text_features')
+    args = parser.parse_args()
+
+    import pickle
+
+    for name in args.names:
+        path = os.path.join(basepath, 'data/processed', name)
+
+        if is_stored(path):
+            print('%s is stored already' % name)
+            continue
+
+        with open(path, 'rb') as infile:
+            value = pickle.load(infile)
+
+        if not storable(value):
+            print('%s holds a %s, left pickled' % (name, type(value).__name__))
+            continue
+
+        write(path, value)
+        print('%s converted' % name)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import time
+import multiprocessing
+
+import numpy as np
+
+from scipy import sparse
+from sklearn.pipeline import FeatureUnion
+
+
+# what forked workers read their branch and input from, set by the parent
+# right before forking so nothing is pickled on the way in
+_shared = {}
+
+
+def _run_branch(args):
+    index, fit = args
+    name, transformer, weight = _shared['branches'][index]
+    X, y = _shared['X'], _shared['y']
+
+    start = time.time()
+
+    if not fit:
+        Xt = transformer.transform(X)
+    elif hasattr(transformer, 'fit_transform'):
+        Xt = transformer.fit_transform(X, y)
+    else:
+        Xt = transformer.fit(X, y).transform(X)
+
+    if weight is not None:
+        Xt = Xt * weight
+
+    return (transformer if fit else None), Xt, time.time() - start
+
+
+class ParallelFeatureUnion(FeatureUnion):
+    """
+    FeatureUnion fitting and transforming its branches in forked worker
+    processes. The input is handed to the workers through fork, so every
+    branch reads the parent's DataFrame instead of a pickled copy of it,
+    only the fitted branches and their outputs travel back.
+
+    timings_ holds the seconds spent in every branch during the last fit or
+    transform, slowest branches are started first on the next call.
+    """
+
+    def __init__(self, transformer_list, n_jobs=1, transformer_weights=None):
+        super(ParallelFeatureUnion, self).__init__(transformer_list, n_jobs=n_jobs,
+                                                   transformer_weights=transformer_weights)
+
+    def workers(self, n_branches):
+        # pool workers are daemons and cannot fork children of their own,
+        # e.g. when the union is fit inside Blending or experiment_grid jobs
+        if 'fork' not in multiprocessing.get_all_start_methods() or multiprocessing.current_process().daemon:
+            return 1
+
+        n_jobs = self.n_jobs or 1
+        n_jobs = multiprocessing.cpu_count() + 1 + n_jobs if n_jobs < 0 else n_jobs
+
+        return max(1, min(n_jobs, n_branches))
+
+    def run(self, X, y=None, fit=False):
+        branches = list(self._iter())
+        order = list(range(len(branches)))
+
+        timings = getattr(self, 'timings_', {})
+        order.sort(key=lambda i: -timings.get(branches[i][0], 0))
+
+        _shared.update(branches=branches, X=X, y=y)
+
+        try:
+            n_jobs = self.workers(len(branches))
+
+            if n_jobs == 1:
+                results = [_run_branch((i, fit)) for i in order]
+            else:
+                pool = multiprocessing.get_context('fork').Pool(n_jobs)
+                try:
+                    results = pool.map(_run_branch, [(i, fit) for i in order], chunksize=1)
+                finally:
+                    pool.close()
+                    pool.join()
+        finally:
+            _shared.clear()
+
+        outputs = [None] * len(branches)
+        fitted = {}
+        self.timings_ = {}
+
+        for i, (transformer, Xt, elapsed) in zip(order, results):
+            name = branches[i][0]
+
+            outputs[i] = Xt
+            fitted[name] = transformer
+            self.timings_[name] = elapsed
+
+        if fit:
+            self.transformer_list = [(name, fitted[name] if name in fitted else transformer)
+                                     for name, transformer in self.transformer_list]
+
+        if any(sparse.issparse(Xt) for Xt in outputs):
+            return sparse.hstack(outputs).tocsr()
+
+        return np.hstack(outputs)
+
+    def fit(self, X, y=None):
+        self.run(X, y, fit=True)
+        return self
+
+    def fit_transform(self, X, y=None, **fit_params):
+        return self.run(X, y, fit=True)
+
+    def transform(self, X):
+        return self.run(X)
+
+    def report(self):
+        total = sum(self.timings_.values())
+
+        for name, elapsed in sorted(self.timings_.items(), key=lambda item: -item[1]):
+            print('%-20s %8.2fs %6.1f%%' % (name, elapsed, 100 * elapsed / total if total else 0.))
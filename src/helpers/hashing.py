@@ -0,0 +1,158 @@
+import numbers
+
+import numpy as np
+
+from scipy import sparse
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+from sklearn.externals.joblib import Parallel, delayed
+
+
+def mix64(keys):
+    """
+    splitmix64 finalizer, spreads int features evenly over all 64 bits so
+    taking them modulo n_features does not only look at the low bits
+    """
+    z = keys.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+
+    return z ^ (z >> np.uint64(31))
+
+
+def _hash_chunk(vectorizer, docs):
+    return vectorizer.hash_counts(docs)
+
+
+class HashingTfidfVectorizer(BaseEstimator, TransformerMixin):
+    """
+    TfidfVectorizer that hashes n-grams into n_features buckets instead of
+    keeping a vocabulary. Fitting only remembers the buckets passing min_df
+    and their idf, a few bytes per kept column instead of a dict entry per
+    distinct n-gram, and transform is stateless apart from that so it is
+    split over n_jobs processes in chunks of chunksize documents.
+
+    The analyzer either is 'word', built from the text options like
+    CountVectorizer does, or a callable returning str or int features, e.g.
+    tokens.NgramAnalyzer.
+    """
+
+    def __init__(self, n_features=2 ** 20, analyzer='word', strip_accents=None, lowercase=True,
+                 preprocessor=None, tokenizer=None, stop_words=None, token_pattern=r'(?u)\b\w\w+\b',
+                 ngram_range=(1, 1), min_df=1, norm='l2', use_idf=True, smooth_idf=True,
+                 sublinear_tf=False, n_jobs=1, chunksize=2000):
+        self.n_features = n_features
+        self.analyzer = analyzer
+        self.strip_accents = strip_accents
+        self.lowercase = lowercase
+        self.preprocessor = preprocessor
+        self.tokenizer = tokenizer
+        self.stop_words = stop_words
+        self.token_pattern = token_pattern
+        self.ngram_range = ngram_range
+        self.min_df = min_df
+        self.norm = norm
+        self.use_idf = use_idf
+        self.smooth_idf = smooth_idf
+        self.sublinear_tf = sublinear_tf
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+
+    def build_analyzer(self):
+        if callable(self.analyzer):
+            return self.analyzer
+
+        return CountVectorizer(analyzer=self.analyzer, strip_accents=self.strip_accents,
+                               lowercase=self.lowercase, preprocessor=self.preprocessor,
+                               tokenizer=self.tokenizer, stop_words=self.stop_words,
+                               token_pattern=self.token_pattern,
+                               ngram_range=self.ngram_range).build_analyzer()
+
+    def hash_counts(self, docs):
+        """
+        Raw term counts of docs, one column per hash bucket
+        """
+        analyze = self.build_analyzer()
+        features = [analyze(doc) for doc in docs]
+
+        first = next((f for f in features if len(f)), [])
+
+        if not isinstance(first[0] if len(first) else '', str):
+            lengths = np.array([len(f) for f in features])
+            indptr = np.concatenate([[0], np.cumsum(lengths)])
+
+            keys = np.concatenate([np.asarray(f, dtype=np.int64) for f in features]) \
+                if len(features) else np.zeros(0, dtype=np.int64)
+            buckets = mix64(keys) % np.uint64(self.n_features)
+
+            counts = sparse.csr_matrix((np.ones(len(buckets)), buckets.astype(np.int64), indptr),
+                                       shape=(len(features), self.n_features))
+        else:
+            hasher = FeatureHasher(n_features=self.n_features, input_type='string', alternate_sign=False)
+            counts = hasher.transform(features)
+
+        counts.sum_duplicates()
+        return counts
+
+    def counts(self, raw_documents):
+        docs = list(raw_documents)
+
+        if self.n_jobs == 1 or len(docs) <= self.chunksize:
+            return self.hash_counts(docs)
+
+        chunks = [docs[i:i + self.chunksize] for i in range(0, len(docs), self.chunksize)]
+        return sparse.vstack(Parallel(n_jobs=self.n_jobs)(delayed(_hash_chunk)(self, chunk) for chunk in chunks)).tocsr()
+
+    def fit(self, raw_documents, y=None):
+        self.fit_transform(raw_documents)
+        return self
+
+    def fit_transform(self, raw_documents, y=None):
+        counts = self.counts(raw_documents)
+        n_samples = counts.shape[0]
+
+        df = np.bincount(counts.indices, minlength=self.n_features)
+        # an absolute count or a proportion of the documents, as in CountVectorizer
+        if isinstance(self.min_df, numbers.Integral):
+            if self.min_df < 0:
+                raise ValueError('min_df has to be a non negative count, got %r' % self.min_df)
+            min_df = self.min_df
+        elif 0 <= self.min_df <= 1:
+            min_df = int(np.ceil(self.min_df * n_samples))
+        else:
+            raise ValueError('min_df has to be a count or a float in [0.0, 1.0], got %r' % self.min_df)
+
+        self.columns_ = np.flatnonzero(df >= max(min_df, 1)).astype(np.int32)
+
+        df = df[self.columns_] + int(self.smooth_idf)
+        self.idf_ = np.log(float(n_samples + int(self.smooth_idf)) / df) + 1
+
+        return self.weight(counts)
+
+    def weight(self, counts):
+        # keep the buckets seen in fit and renumber them 0..len(columns_)
+        position = np.searchsorted(self.columns_, counts.indices)
+        position[position == len(self.columns_)] = 0
+        kept = self.columns_[position] == counts.indices if len(self.columns_) else \
+            np.zeros(len(counts.indices), dtype=bool)
+
+        rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        X = sparse.csr_matrix((counts.data[kept], (rows[kept], position[kept])),
+                              shape=(counts.shape[0], len(self.columns_)))
+
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+
+        if self.use_idf:
+            X = X @ sparse.diags(self.idf_)
+
+        if self.norm:
+            X = normalize(X, norm=self.norm, copy=False)
+
+        return sparse.csr_matrix(X)
+
+    def transform(self, raw_documents):
+        return self.weight(self.counts(raw_documents))
@@ -0,0 +1,58 @@
+import json
+
+from itertools import islice
+
+
+def write_jsonl(records, filename, buffering=1 << 20):
+    """
+    Write records one JSON document per line, pulling them lazily so only
+    the current record and the write buffer are ever held in memory
+
+    records: any iterable of json serializable objects, e.g. a generator
+    filename: output file
+    buffering: size of the write buffer in bytes
+    """
+
+    n = 0
+
+    with open(filename, 'w', buffering=buffering) as outfile:
+        for record in records:
+            outfile.write(json.dumps(record))
+            outfile.write('\n')
+            n += 1
+
+    return n
+
+def read_jsonl(filename):
+    """
+    Iterate over the records of a JSON lines file one at a time
+
+    filename: file written by write_jsonl
+    """
+
+    with open(filename, 'r') as infile:
+        for line in infile:
+            if line.strip():
+                yield json.loads(line)
+
+def read_jsonl_batches(filename, batch_size):
+    """
+    Iterate over the records of a JSON lines file in lists of at most
+    batch_size records
+
+    filename: file written by write_jsonl
+    batch_size: number of records per batch
+    """
+
+    records = read_jsonl(filename)
+
+    while True:
+        batch = list(islice(records, batch_size))
+
+        if not batch:
+            return
+
+        yield batch
+
+        # drop our reference before reading the next batch
+        del batch
@@ -0,0 +1,66 @@
+import numpy as np
+
+from scipy import sparse
+from multiprocessing import shared_memory
+
+
+def share_arrays(arrays):
+    """
+    Copy numpy arrays into shared memory blocks once, so worker processes
+    can attach to them instead of receiving pickled copies
+
+    arrays: dict of name -> numpy array
+
+    Returns the list of SharedMemory blocks, to be closed and unlinked by
+    the caller, and a small picklable spec to hand to attach_arrays.
+    """
+    blocks = []
+    spec = {}
+
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+
+        blocks.append(block)
+        spec[name] = (block.name, array.shape, array.dtype.str)
+
+    return blocks, spec
+
+def attach_arrays(spec):
+    """
+    Zero copy views on arrays shared by share_arrays. The blocks have to be
+    kept alive as long as the arrays are used.
+    """
+    blocks = []
+    arrays = {}
+
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+
+    return blocks, arrays
+
+def matrix_arrays(X):
+    """ flat arrays of a CSR or dense matrix, see matrix_from_arrays """
+    if sparse.issparse(X):
+        X = sparse.csr_matrix(X)
+        return {'data': X.data, 'indices': X.indices, 'indptr': X.indptr,
+                'shape': np.array(X.shape)}
+
+    return {'dense': np.asarray(X)}
+
+def matrix_from_arrays(arrays):
+    if 'dense' in arrays:
+        return arrays['dense']
+
+    return sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                             shape=tuple(arrays['shape']), copy=False)
+
+def release(blocks, unlink=False):
+    for block in blocks:
+        block.close()
+
+        if unlink:
+            block.unlink()
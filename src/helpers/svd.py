@@ -0,0 +1,288 @@
+import numpy as np
+
+from collections import OrderedDict
+from scipy import sparse
+from scipy.linalg import solve_triangular
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.utils import check_random_state
+
+
+
+def row_chunks(X, rows):
+    for start in range(0, X.shape[0], rows):
+        yield X[start:start + rows]
+
+def column_variance(X, rows):
+    """
+    Variance of every column of X, summed over chunks of rows
+    """
+    total = np.zeros(X.shape[1])
+    squares = np.zeros(X.shape[1])
+
+    for chunk in row_chunks(X, rows):
+        total += np.asarray(chunk.sum(axis=0)).ravel()
+        squares += np.asarray(chunk.multiply(chunk).sum(axis=0) if sparse.issparse(chunk) else (chunk ** 2).sum(axis=0)).ravel()
+
+    mean = total / X.shape[0]
+    return squares / X.shape[0] - mean ** 2
+
+def orthonormalize(Y):
+    """
+    Orthonormal basis of the columns of a tall matrix, cholesky QR done twice
+    is as accurate as householder QR here and a lot cheaper
+    """
+    try:
+        for _ in range(2):
+            L = np.linalg.cholesky(Y.T @ Y)
+            Y = solve_triangular(L, Y.T, lower=True).T
+        return Y
+    except np.linalg.LinAlgError:
+        return np.linalg.qr(Y)[0]
+
+def feature_terms(vectorizer):
+    """
+    Term of every column a fitted vectorizer produces, the vocabulary of a
+    TfidfVectorizer or the kept buckets of a HashingTfidfVectorizer
+    """
+    vocabulary = getattr(vectorizer, 'vocabulary_', None)
+
+    if vocabulary is not None:
+        terms = [None] * len(vocabulary)
+
+        for term, column in vocabulary.items():
+            terms[column] = term
+
+        return terms
+
+    return vectorizer.columns_.tolist()
+
+
+class BasisCache(object):
+    """
+    Fitted bases of ChunkedSVDs, kept under (basis_key, n_components) with
+    the row of every term, for later fits to start from. Warm starts only
+    happen through a cache the caller creates and hands to the estimators,
+    e.g. for the folds of one cross validation.
+
+    Like TokenCache it survives clone / deepcopy of the estimators holding
+    it and is pickled empty, so fits in worker processes start cold and do
+    not add to the cache of the parent.
+    """
+
+    def __init__(self, max_size=64):
+        """
+        max_size: number of bases kept, the least recently used go first
+        """
+        self.max_size = max_size
+        self.bases = OrderedDict()
+
+    def __deepcopy__(self, memo):
+        # shared on purpose, clone() must not hand every fold its own copy
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['bases'] = OrderedDict()
+        return state
+
+    def __len__(self):
+        return len(self.bases)
+
+    def get(self, key):
+        """
+        (row of every term, components) stored under key, None if absent
+        """
+        if key not in self.bases:
+            return None
+
+        self.bases.move_to_end(key)
+        return self.bases[key]
+
+    def put(self, key, terms, components):
+        self.bases[key] = ({term: row for row, term in enumerate(terms)}, components)
+        self.bases.move_to_end(key)
+
+        while len(self.bases) > self.max_size:
+            self.bases.popitem(last=False)
+
+    def clear(self):
+        self.bases.clear()
+
+
+class ChunkedSVD(BaseEstimator, TransformerMixin):
+    """
+    Truncated SVD by randomized subspace iteration that only ever looks at
+    max_memory worth of rows at a time. Every pass over the rows both
+    refines the subspace and gives its Rayleigh-Ritz singular values, so
+    iteration stops as soon as the variance they capture settles.
+
+    Fits start cold by default. Given a BasisCache and the terms of the
+    columns, the fitted basis is stored in the cache term by term, and the
+    next fit with the same cache and basis_key (another fold, a refit after
+    a parameter change) starts from it with every row moved to the column
+    its term has now, usually settling after one or two passes. Terms the
+    old basis has not seen start at zero. A stale basis only costs the
+    passes a cold start would have.
+    """
+
+    def __init__(self, n_components=50, n_oversamples=10, n_iter=7, tol=1e-3,
+                 max_memory=256 << 20, basis_cache=None, basis_key=None, random_state=None):
+        """
+        n_components: number of singular vectors kept
+        n_oversamples: extra vectors iterated along for accuracy
+        n_iter: maximum number of passes over the rows
+        tol: relative change of the captured variance considered settled
+        max_memory: bytes of row chunks and their projections held at once
+        basis_cache: BasisCache to warm start from and store the fitted
+                     basis in, None to always start cold. Fits without
+                     terms start cold as well.
+        basis_key: name of the basis in basis_cache, e.g. the field
+        random_state: seed of the initial subspace
+        """
+        self.n_components = n_components
+        self.n_oversamples = n_oversamples
+        self.n_iter = n_iter
+        self.tol = tol
+        self.max_memory = max_memory
+        self.basis_cache = basis_cache
+        self.basis_key = basis_key
+        self.random_state = random_state
+
+    def cache_key(self):
+        return (self.basis_key, self.n_components)
+
+    def remember(self, terms):
+        if self.basis_cache is None or terms is None or not hasattr(self, 'components_'):
+            return
+
+        self.basis_cache.put(self.cache_key(), terms, self.components_)
+
+    def chunk_rows(self, X, width):
+        nnz = X.nnz if sparse.issparse(X) else X.shape[0] * X.shape[1]
+        row_bytes = 12. * nnz / max(X.shape[0], 1) + 16. * width
+
+        return max(1, int(self.max_memory // row_bytes))
+
+    def initial_basis(self, n_features, width, terms=None):
+        random_state = check_random_state(self.random_state)
+        Q = random_state.standard_normal((n_features, width))
+
+        cached = self.basis_cache.get(self.cache_key()) if self.basis_cache is not None and terms is not None else None
+        self.warm_started_ = False
+
+        if cached is not None:
+            rows, basis = cached
+            m = min(basis.shape[0], width)
+            # the old row of every column whose term the old basis has seen
+            pairs = [(column, rows[term]) for column, term in enumerate(terms) if term in rows]
+
+            if pairs:
+                columns, old = np.array(pairs).T
+                Q[:, :m] = 0
+                Q[columns, :m] = basis[:m, old].T
+                self.warm_started_ = True
+
+        return orthonormalize(Q)
+
+    def fit(self, X, y=None, terms=None):
+        self.fit_transform(X, terms=terms)
+        return self
+
+    def fit_transform(self, X, y=None, terms=None):
+        """
+        terms: term of every column of X, see feature_terms, needed to start
+               from the remembered basis and to remember this one
+        """
+        if sparse.issparse(X):
+            X = sparse.csr_matrix(X)
+
+        n_features = X.shape[1]
+
+        if terms is not None and len(terms) != n_features:
+            raise ValueError('%d terms for %d columns' % (len(terms), n_features))
+
+        k = self.n_components
+        width = min(k + self.n_oversamples, n_features)
+        rows = self.chunk_rows(X, width)
+
+        Q = self.initial_basis(n_features, width, terms)
+        previous = None
+
+        for self.n_iter_ in range(1, self.n_iter + 1):
+            # one pass: X^T X Q for the next subspace, (XQ)^T XQ for the
+            # singular values and vectors of the current one
+            Y = np.zeros((n_features, width))
+            G = np.zeros((width, width))
+
+            for chunk in row_chunks(X, rows):
+                Z = np.asarray(chunk @ Q)
+                G += Z.T @ Z
+                Y += np.asarray(chunk.T @ Z)
+
+            values, W = np.linalg.eigh(G)
+            order = np.argsort(values)[::-1][:k]
+            s = np.sqrt(np.clip(values[order], 0, None))
+            V = Q @ W[:, order]
+
+            energy = np.sum(s ** 2)
+            converged = previous is not None and abs(energy - previous) <= self.tol * energy
+            previous = energy
+
+            if converged:
+                break
+
+            Q = orthonormalize(Y)
+
+        # same sign convention whatever the starting basis
+        signs = np.sign(V[np.argmax(np.abs(V), axis=0), np.arange(V.shape[1])])
+        signs[signs == 0] = 1
+
+        self.components_ = (V * signs).T
+        self.singular_values_ = s
+        self.remember(terms)
+
+        Xt = self.transform(X)
+
+        # same definitions as TruncatedSVD
+        self.explained_variance_ = np.var(Xt, axis=0)
+        self.explained_variance_ratio_ = self.explained_variance_ / column_variance(X, rows).sum()
+
+        return Xt
+
+    def transform(self, X):
+        if sparse.issparse(X):
+            X = sparse.csr_matrix(X)
+
+        rows = self.chunk_rows(X, self.components_.shape[0])
+
+        return np.vstack([np.asarray(chunk @ self.components_.T) for chunk in row_chunks(X, rows)])
+
+
+class TermSVD(BaseEstimator, TransformerMixin):
+    """
+    A vectorizer followed by a ChunkedSVD that is told the term of every
+    column, so a basis kept in its BasisCache carries over to another fold
+    or vocabulary by term instead of by column number
+    """
+
+    def __init__(self, vectorizer, svd):
+        """
+        vectorizer: TfidfVectorizer or HashingTfidfVectorizer
+        svd: ChunkedSVD
+        """
+        self.vectorizer = vectorizer
+        self.svd = svd
+
+    def __sklearn_is_fitted__(self):
+        return hasattr(self.svd, 'components_')
+
+    def fit(self, X, y=None):
+        self.fit_transform(X, y)
+        return self
+
+    def fit_transform(self, X, y=None):
+        Xt = self.vectorizer.fit_transform(X, y)
+        return self.svd.fit_transform(Xt, terms=feature_terms(self.vectorizer))
+
+    def transform(self, X):
+        return self.svd.transform(self.vectorizer.transform(X))
@@ -0,0 +1,184 @@
+import numpy as np
+
+from collections import OrderedDict
+from sklearn.base import BaseEstimator, TransformerMixin
+
+
+class TokenCache(object):
+    """
+    Tokenizes every distinct text once and keeps the result as an array of
+    token ids, so vectorizers fit on the same documents again (every fold of
+    a cross validation, every field that shares a text) skip tokenization.
+
+    The vocabulary only grows while fitting. Outside a fit every token it
+    has not seen gets the id one past the vocabulary, the unknown id the
+    exported artifact uses as well, which no fitted vectorizer has a feature
+    for. Texts with unknown tokens are not kept, their ids would change once
+    a later fit adds the tokens.
+
+    The cache survives clone / deepcopy of the estimators holding it, only
+    the vocabulary is kept when it is pickled.
+    """
+
+    def __init__(self, preprocessor=None, tokenizer=None, stop_words=None, max_docs=200000):
+        """
+        preprocessor: callable applied to the raw text e.g. stemming
+        tokenizer: callable splitting the preprocessed text into tokens,
+                   whitespace split by default
+        stop_words: tokens dropped after tokenization
+        max_docs: number of texts kept, the least recently used go first
+        """
+        self.preprocessor = preprocessor
+        self.tokenizer = tokenizer
+        self.stop_words = frozenset(stop_words or ())
+        self.max_docs = max_docs
+
+        self.vocabulary = {}
+        self.docs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __deepcopy__(self, memo):
+        # shared on purpose, clone() must not hand every fold its own copy
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['docs'] = OrderedDict()
+        return state
+
+    def token_ids(self, tokens, grow=True):
+        vocabulary = self.vocabulary
+
+        if grow:
+            return np.array([vocabulary.setdefault(t, len(vocabulary)) for t in tokens], dtype=np.int32)
+
+        unknown = len(vocabulary)
+        return np.array([vocabulary.get(t, unknown) for t in tokens], dtype=np.int32)
+
+    def tokenize(self, text, grow=True):
+        """
+        Token id array of a single text
+
+        grow: give unseen tokens new ids, False while not fitting
+        """
+        if not isinstance(text, str):
+            text = ''
+
+        ids = self.docs.get(text)
+
+        if ids is not None:
+            self.hits += 1
+            self.docs.move_to_end(text)
+            return ids
+
+        self.misses += 1
+
+        ids = self.token_ids(self.tokens(text), grow)
+
+        if grow or not (ids == len(self.vocabulary)).any():
+            self.docs[text] = ids
+
+            while len(self.docs) > self.max_docs:
+                self.docs.popitem(last=False)
+
+        return ids
+
+    def tokens(self, text):
+        """
+        Token strings of a text, before they are given ids
+        """
+        doc = self.preprocessor(text) if self.preprocessor else text
+        tokens = self.tokenizer(doc) if self.tokenizer else doc.split()
+
+        return [t for t in tokens if t not in self.stop_words]
+
+    def transform(self, texts, grow=True):
+        return [self.tokenize(text, grow) for text in texts]
+
+    def clear(self):
+        self.docs.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+
+        return {
+            'docs': len(self.docs),
+            'tokens': len(self.vocabulary),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.
+        }
+
+    def __str__(self):
+        return 'TokenCache(docs={docs}, tokens={tokens}, hits={hits}, misses={misses}, ' \
+               'hit_rate={hit_rate:.2%})'.format(**self.stats())
+
+
+class Tokenize(BaseEstimator, TransformerMixin):
+    """
+    Replaces the text in the given columns of a dataframe with token id
+    arrays taken from a TokenCache. Only fit_transform adds tokens to the
+    vocabulary, transform maps unseen ones to the unknown id.
+    """
+
+    def __init__(self, cache, keys=None):
+        self.cache = cache
+        self.keys = keys
+
+    def fit(self, X, y=None):
+        return self
+
+    def tokenize(self, df, grow):
+        keys = self.keys if self.keys is not None else list(df.columns)
+        tokens = df[keys].copy()
+
+        for key in keys:
+            tokens[key] = self.cache.transform(df[key].values, grow)
+
+        return tokens
+
+    def fit_transform(self, df, y=None):
+        return self.tokenize(df, grow=True)
+
+    def transform(self, df):
+        return self.tokenize(df, grow=False)
+
+
+class NgramAnalyzer(object):
+    """
+    Analyzer for vectorizers fed with token id arrays. Unigrams keep their
+    token id, an n-gram is the (n - 1) preceding ids packed above it so every
+    feature is a plain int. Ids have to stay below 2 ** BITS - 1 and n below
+    64 / BITS, anything larger raises instead of packing grams onto each
+    other.
+    """
+
+    BITS = 21
+
+    def __init__(self, ngram_range=(1, 1)):
+        self.ngram_range = ngram_range
+
+    def __call__(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        min_n, max_n = self.ngram_range
+
+        if max_n > 1 and self.BITS * max_n >= 64:
+            raise ValueError('%d-grams do not fit in %d bits per token' % (max_n, self.BITS))
+
+        if max_n > 1 and len(ids) and ids.max() + 1 >= 1 << self.BITS:
+            raise ValueError('token id %d does not fit in %d bits, the vocabulary has outgrown '
+                             'NgramAnalyzer.BITS' % (ids.max(), self.BITS))
+
+        features = []
+
+        for n in range(min_n, min(max_n, len(ids)) + 1):
+            grams = ids[n - 1:].copy()
+
+            for i in range(1, n):
+                # + 1 keeps a leading id 0 from colliding with a shorter gram
+                grams |= (ids[n - 1 - i:len(ids) - i] + 1) << (self.BITS * i)
+
+            features.append(grams)
+
+        return np.concatenate(features).tolist() if features else []
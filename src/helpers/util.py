@@ -1,5 +1,9 @@
+import os
 import json
+import numpy as np
+import pandas as pd
 
+from functools import lru_cache
 from sklearn.preprocessing import LabelEncoder
 from sklearn.base import BaseEstimator, TransformerMixin
 
@@ -8,11 +12,18 @@ from nltk.stem.snowball import SnowballStemmer
 from nltk.stem.porter import PorterStemmer
 from nltk import word_tokenize
 
+from helpers import feature_store
 
 
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+
 sns = SnowballStemmer(language='english')
 por = PorterStemmer()
 
+# distinct words seen by one tokenizer, english text rarely gets near it
+WORD_CACHE_SIZE = 1 << 18
+
 
 def encode_variable(train, test):
     """
@@ -36,7 +47,8 @@ def encode_variable(train, test):
 
 def store(filename, data):
     """
-    Pickle data onto disk
+    Pickle data onto disk, matrices and dicts of them are written to the
+    columnar feature store instead
     
     filename: filename that you want to give to this dump
     data: actual data that you want to dump.
@@ -44,7 +56,14 @@ def store(filename, data):
     
     import pickle
     
-    with open(os.path.join(basepath, 'data/processed/') + filename, 'wb') as outfile:
+    path = os.path.join(basepath, 'data/processed/') + filename
+    
+    if feature_store.storable(data):
+        return feature_store.write(path, data)
+    
+    feature_store.remove(path)
+    
+    with open(path, 'wb') as outfile:
         pickle.dump(data, outfile, protocol=pickle.HIGHEST_PROTOCOL)
         outfile.close()
         
@@ -57,26 +76,69 @@ def load(filename):
     
     import pickle
     
-    with open(os.path.join(basepath, 'data/processed/') + filename, 'rb') as infile:
+    path = os.path.join(basepath, 'data/processed/') + filename
+    
+    if feature_store.is_stored(path):
+        return feature_store.read(path)
+    
+    with open(path, 'rb') as infile:
         data = pickle.load(infile)
         infile.close()
         
         return data
 
 
-class LemmaTokenizer(object):
-    def __init__(self):
-        self.wnl = WordNetLemmatizer()
-    
+class MemoizedTokenizer(object):
+    """
+    Tokenizer normalizing every word through a bounded lru cache, word
+    frequencies are zipfian so almost every call after the first few
+    thousand documents is a cache hit. The cache is dropped when pickled and
+    rebuilt empty on the other side.
+    """
+
+    def __init__(self, normalize_word, maxsize=WORD_CACHE_SIZE):
+        """
+        normalize_word: callable mapping a word to its normal form e.g. a stemmer
+        maxsize: number of distinct words kept in the cache
+        """
+        self.normalize_word = normalize_word
+        self.maxsize = maxsize
+        self._build()
+
+    def _build(self):
+        self.normalize = lru_cache(maxsize=self.maxsize)(self.normalize_word)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['normalize']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build()
+
     def __call__(self, doc):
-        return [self.wnl.lemmatize(t) for t in word_tokenize(doc)]
+        normalize = self.normalize
+        return [normalize(t) for t in word_tokenize(doc)]
+
+    def cache_info(self):
+        return self.normalize.cache_info()
 
-class StemTokenizer(object):
-    def __init__(self):
+    def hit_rate(self):
+        info = self.cache_info()
+        lookups = info.hits + info.misses
+
+        return info.hits / lookups if lookups else 0.
+
+class LemmaTokenizer(MemoizedTokenizer):
+    def __init__(self, maxsize=WORD_CACHE_SIZE):
+        self.wnl = WordNetLemmatizer()
+        super(LemmaTokenizer, self).__init__(self.wnl.lemmatize, maxsize)
+
+class StemTokenizer(MemoizedTokenizer):
+    def __init__(self, maxsize=WORD_CACHE_SIZE):
         self.sns = sns
-    
-    def __call__(self, doc):
-        return [self.sns.stem(t) for t in word_tokenize(doc)]
+        super(StemTokenizer, self).__init__(self.sns.stem, maxsize)
 
 
 class VarSelect(BaseEstimator, TransformerMixin):
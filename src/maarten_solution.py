@@ -1,9 +1,9 @@
-import numpy as np
-
+from functools import partial
 from data import make_dataset, DATASETS
 from features import parse_raw_content, count_words
 from features import feature_sets as fs
 from models import train_model
+from models.experiment_grid import run_grid, unique_expressions
 from sklearn.decomposition import TruncatedSVD as SVD
 
 def save(filename, data):
@@ -11,55 +11,71 @@ def save(filename, data):
     with open('../data/processed/'+filename, 'wb') as outfile:
         pickle.dump(data, outfile, pickle.HIGHEST_PROTOCOL)
         outfile.close()
-        
-def preprocess_and_train(labels):
-    scores = {}
+
+# feature sets and decompositions shared by the methods of a dataset
+featuresets = fs.FeatureSetCache(max_bytes=4 << 30)
+
+def svd(dataset, n_components):
+    return featuresets.fetch(('svd', dataset, n_components),
+                             lambda: SVD(n_components).fit_transform(featuresets.get(dataset)))
+
+PREPROCESSING = {
+    'raw': lambda dataset: featuresets.get(dataset, tf_idf=False),
+    'tfidf': lambda dataset: featuresets.get(dataset),
+    'nostem': lambda dataset: featuresets.get(dataset, stem=False),
+    # components come sorted by singular value, so the first 50 of the 100
+    # component decomposition stand in for a 50 component one
+    'svd50': lambda dataset: svd(dataset, 100)[:, :50],
+    'svd100': lambda dataset: svd(dataset, 100),
+    'lda': lambda dataset: train_model.get_lda(dataset, 100),
+}
+
+def score_cell(cell, labels, fold_jobs=1):
+    method, dataset = cell
+
+    # get the data
+    data = PREPROCESSING[method](dataset)
+
+    # train model
+    return train_model.get_scores(data, labels, n_jobs=fold_jobs)
+
+def preprocess_and_train(labels, n_jobs=1, fold_jobs=1):
+    # pool workers cannot start pools of their own, so parallelise either
+    # the grid (n_jobs) or the folds within a cell (fold_jobs)
+    if n_jobs > 1:
+        fold_jobs = 1
     
-    PREPROCESSING = {
-        'raw': lambda: fs.get_featureset(dataset, tf_idf=False),
-        'tfidf': lambda: fs.get_featureset(dataset),
-        'nostem': lambda: fs.get_featureset(dataset, stem=False),
-        'svd50': lambda: SVD(50).fit_transform(fs.get_featureset(dataset)),
-        'svd100': lambda: SVD(100).fit_transform(fs.get_featureset(dataset)),
-        'lda': lambda: train_model.get_lda(dataset, 100),
-    }
+    cells = {}
     
-    for dataset in DATASETS.DATASETS:
+    for dataset in unique_expressions(DATASETS.DATASETS):
         for method in PREPROCESSING:
-            # name of feature set
-            name = method + ':' + dataset
-
-            # check if we calulated this score before
-            if name in scores:
-                continue
-
             # we can only do iton some datasets
             if method == 'lda':
-                if 'dataset' not in DATASETS.LDA_DATASETS:
+                if dataset not in unique_expressions(DATASETS.LDA_DATASETS):
                     continue
 
-            print(name)
-
-            # get the data
-            data = PREPROCESSING[method]()
+            # name of feature set
+            cells[method + ':' + dataset] = (method, dataset)
 
-            # train model
-            scores[name] = train_model.get_scores(data, labels)
+    # every cell is kept in its own record, finished cells are skipped, and
+    # the methods of a dataset run on the same worker to share featuresets
+    scores = run_grid(cells, partial(score_cell, labels=labels, fold_jobs=fold_jobs), '../data/processed/scores/',
+                      n_jobs, group_by=lambda cell: cell[1], verbose=True)
 
-            # save it
-            save('scores', scores)
+    # save it
+    save('scores', scores)
 
-def main(dataset=False):
+def main(dataset=False, n_jobs=1, fold_jobs=1):
     train = make_dataset.get_train()
     test = make_dataset.get_test()
-    labels = np.array([item['label'] for item in train])
+    labels = train['label'].values
     
     
     if dataset:
         parse_raw_content.main(train, test)
         count_words.main()
     
-    preprocess_and_train(labels)
+    preprocess_and_train(labels, n_jobs, fold_jobs)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,348 @@
+import os, sys
+import json
+import pickle
+
+import numpy as np
+
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.pipeline import Pipeline, FeatureUnion
+from sklearn.preprocessing import FunctionTransformer, MinMaxScaler, StandardScaler, normalize
+from sklearn.feature_selection import SelectKBest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.decomposition import TruncatedSVD
+from sklearn.linear_model import LogisticRegression
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from helpers import util
+from helpers.svd import ChunkedSVD, TermSVD
+from helpers.tokens import TokenCache, Tokenize
+from helpers.hashing import HashingTfidfVectorizer
+
+FORMAT_VERSION = 2
+
+
+class FlatVocabulary(object):
+    """
+    Vocabulary as two flat arrays, the sorted keys (fixed width utf-8 bytes
+    or int64) and the column of every key, looked up with searchsorted
+    """
+
+    def __init__(self, keys, columns):
+        self.keys = keys
+        self.columns = columns
+
+    @classmethod
+    def from_dict(cls, vocabulary):
+        items = list(vocabulary.items())
+
+        if items and isinstance(items[0][0], str):
+            # utf-8 bytes sort in code point order, like the str they encode
+            items = sorted((term.encode('utf-8'), column) for term, column in items)
+            width = max(len(term) for term, _ in items)
+            keys = np.array([term for term, _ in items], dtype='S%d' % max(width, 1))
+        else:
+            items = sorted(items)
+            keys = np.array([term for term, _ in items], dtype=np.int64)
+
+        return cls(keys, np.array([column for _, column in items], dtype=np.int32))
+
+    def lookup(self, features):
+        """
+        Column of every feature, -1 for the ones not in the vocabulary
+        """
+        if not len(features) or not len(self.keys):
+            return np.full(len(features), -1, dtype=np.int32)
+
+        if self.keys.dtype.kind == 'S':
+            encoded = [f.encode('utf-8') for f in features]
+            # longer than every key means unknown, and would be truncated below
+            fits = np.array([len(f) <= self.keys.itemsize for f in encoded])
+            query = np.array(encoded, dtype=self.keys.dtype)
+        else:
+            fits = True
+            query = np.asarray(features, dtype=np.int64)
+
+        position = np.searchsorted(self.keys, query)
+        position[position == len(self.keys)] = 0
+
+        found = (self.keys[position] == query) & fits
+        return np.where(found, self.columns[position], -1)
+
+
+def normalize_rows(X, norm):
+    """
+    sklearn's normalize without its input validation, which dominates the
+    cost of transforming a single document
+    """
+    if norm not in ('l1', 'l2'):
+        return normalize(X, norm=norm, copy=False) if norm else X
+
+    values = X.data ** 2 if norm == 'l2' else np.abs(X.data)
+    rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+
+    norms = np.bincount(rows, weights=values, minlength=X.shape[0])
+    norms = np.sqrt(norms) if norm == 'l2' else norms
+    norms[norms == 0] = 1
+
+    X.data /= norms[rows]
+    return X
+
+
+class ArtifactWriter(object):
+    def __init__(self, directory):
+        self.directory = directory
+        self.arrays = {}
+        self.analyzers = {}
+
+        os.makedirs(directory, exist_ok=True)
+
+    def array(self, name, value):
+        value = np.ascontiguousarray(value)
+        np.save(os.path.join(self.directory, name + '.npy'), value)
+        self.arrays[name] = {'dtype': value.dtype.str, 'shape': list(value.shape)}
+
+        return name
+
+    def vocabulary(self, name, vocabulary):
+        flat = FlatVocabulary.from_dict(vocabulary)
+        return [self.array(name + '.keys', flat.keys), self.array(name + '.columns', flat.columns)]
+
+    def analyzer(self, name, value):
+        self.analyzers[name] = value
+        return name
+
+    def step(self, name, step):
+        """
+        Flat description of a fitted step, its arrays written next to it
+        """
+        if isinstance(step, Pipeline):
+            return {'type': 'pipeline',
+                    'steps': [[key, self.step(name + '.' + key, sub)] for key, sub in step.steps]}
+
+        if isinstance(step, FeatureUnion):
+            weights = step.transformer_weights or {}
+            return {'type': 'union',
+                    'branches': [[key, self.step(name + '.' + key, sub), weights.get(key)]
+                                 for key, sub in step.transformer_list]}
+
+        if isinstance(step, TermSVD):
+            return {'type': 'pipeline',
+                    'steps': [['tfidf', self.step(name + '.tfidf', step.vectorizer)],
+                              ['svd', self.step(name + '.svd', step.svd)]]}
+
+        if isinstance(step, FunctionTransformer):
+            return {'type': 'function', 'analyzer': self.analyzer(name, step.func)}
+
+        if isinstance(step, util.VarSelect):
+            return {'type': 'column', 'key': step.keys}
+
+        if isinstance(step, Tokenize):
+            # the token vocabulary goes flat, only the tokenizers are pickled
+            cache = step.cache
+            return {'type': 'tokenize', 'keys': step.keys,
+                    'vocabulary': self.vocabulary(name + '.tokens', cache.vocabulary),
+                    'analyzer': self.analyzer(name, TokenCache(cache.preprocessor, cache.tokenizer, cache.stop_words))}
+
+        if isinstance(step, HashingTfidfVectorizer):
+            return {'type': 'hashing_tfidf', 'analyzer': self.analyzer(name, clone(step)),
+                    'columns': self.array(name + '.columns', step.columns_),
+                    'idf': self.array(name + '.idf', step.idf_)}
+
+        if isinstance(step, TfidfVectorizer):
+            return {'type': 'tfidf', 'analyzer': self.analyzer(name, clone(step)),
+                    'vocabulary': self.vocabulary(name + '.vocabulary', step.vocabulary_),
+                    'idf': self.array(name + '.idf', step.idf_) if step.use_idf else None,
+                    'sublinear_tf': step.sublinear_tf, 'norm': step.norm}
+
+        if isinstance(step, (TruncatedSVD, ChunkedSVD)):
+            # stored transposed so X @ components needs no contiguous copy
+            return {'type': 'projection', 'components': self.array(name + '.components', step.components_.T)}
+
+        if type(step).__name__ == 'Weights':
+            return {'type': 'weight', 'weight': step.weight}
+
+        if isinstance(step, MinMaxScaler):
+            return {'type': 'affine', 'scale': self.array(name + '.scale', step.scale_),
+                    'offset': self.array(name + '.offset', step.min_)}
+
+        if isinstance(step, StandardScaler):
+            scale = 1. / step.scale_ if step.scale_ is not None else np.ones_like(step.mean_)
+            mean = step.mean_ if step.mean_ is not None else np.zeros_like(scale)
+            return {'type': 'affine', 'scale': self.array(name + '.scale', scale),
+                    'offset': self.array(name + '.offset', -mean * scale)}
+
+        if isinstance(step, SelectKBest):
+            return {'type': 'select', 'columns': self.array(name + '.columns', step.get_support(indices=True))}
+
+        if isinstance(step, LogisticRegression) and len(step.classes_) == 2:
+            return {'type': 'logistic', 'coef': self.array(name + '.coef', step.coef_),
+                    'intercept': self.array(name + '.intercept', step.intercept_),
+                    'classes': step.classes_.tolist()}
+
+        raise ValueError('cannot export step %s of type %s' % (name, type(step).__name__))
+
+    def close(self, root):
+        with open(os.path.join(self.directory, 'analyzers.pkl'), 'wb') as outfile:
+            pickle.dump(self.analyzers, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+
+        manifest = {'version': FORMAT_VERSION, 'root': root, 'arrays': self.arrays}
+
+        with open(os.path.join(self.directory, 'manifest.json'), 'w') as outfile:
+            json.dump(manifest, outfile, indent=1)
+
+
+def export(pipeline, directory):
+    """
+    Write a fitted pipeline as flat .npy arrays (vocabularies, idf, svd
+    components, scaler and model coefficients), a manifest.json describing
+    how they chain and analyzers.pkl holding only the tokenizers
+    """
+    writer = ArtifactWriter(directory)
+    writer.close(writer.step('model', pipeline))
+
+    return directory
+
+
+class Artifact(object):
+    """
+    Exported pipeline loaded back for prediction. Arrays are memory mapped
+    read only, so loading costs milliseconds and every process serving the
+    same artifact shares one copy of it in the page cache.
+    """
+
+    def __init__(self, directory, mmap=True):
+        self.directory = directory
+
+        with open(os.path.join(directory, 'manifest.json')) as infile:
+            self.manifest = json.load(infile)
+
+        if self.manifest['version'] != FORMAT_VERSION:
+            raise ValueError('artifact format %s, expected %s' % (self.manifest['version'], FORMAT_VERSION))
+
+        self.arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r' if mmap else None)
+                       for name in self.manifest['arrays']}
+
+        with open(os.path.join(directory, 'analyzers.pkl'), 'rb') as infile:
+            self.analyzers = pickle.load(infile)
+
+        self._analyze = {}
+
+    def vocabulary(self, names):
+        return FlatVocabulary(self.arrays[names[0]], self.arrays[names[1]])
+
+    def analyze(self, name):
+        # building a sklearn analyzer is not free, do it once per artifact
+        if name not in self._analyze:
+            self._analyze[name] = self.analyzers[name].build_analyzer()
+
+        return self._analyze[name]
+
+    def tfidf(self, spec, docs):
+        analyze = self.analyze(spec['analyzer'])
+        vocabulary = self.vocabulary(spec['vocabulary'])
+
+        features = [analyze(doc) for doc in docs]
+        indptr = np.concatenate([[0], np.cumsum([len(f) for f in features])])
+        columns = vocabulary.lookup([feature for f in features for feature in f])
+
+        rows = np.repeat(np.arange(len(features)), np.diff(indptr))
+        known = columns >= 0
+
+        X = sparse.csr_matrix((np.ones(known.sum()), (rows[known], columns[known])),
+                              shape=(len(features), len(vocabulary.keys)))
+        X.sum_duplicates()
+
+        if spec['sublinear_tf']:
+            np.log(X.data, X.data)
+            X.data += 1
+
+        if spec['idf'] is not None:
+            X.data *= self.arrays[spec['idf']][X.indices]
+
+        return normalize_rows(X, spec['norm'])
+
+    def tokenize(self, spec, df):
+        cache = self.analyzers[spec['analyzer']]
+        vocabulary = self.vocabulary(spec['vocabulary'])
+        unknown = len(vocabulary.keys)
+
+        keys = spec['keys'] if spec['keys'] is not None else list(df.columns)
+        tokens = df[keys].copy()
+
+        for key in keys:
+            ids = []
+
+            for text in df[key].values:
+                columns = vocabulary.lookup(cache.tokens(text if isinstance(text, str) else ''))
+                columns[columns < 0] = unknown
+                ids.append(columns.astype(np.int32))
+
+            tokens[key] = ids
+
+        return tokens
+
+    def run(self, spec, X):
+        kind = spec['type']
+
+        if kind == 'pipeline':
+            for _, step in spec['steps']:
+                X = self.run(step, X)
+            return X
+
+        if kind == 'union':
+            outputs = []
+
+            for _, branch, weight in spec['branches']:
+                Xt = self.run(branch, X)
+                outputs.append(Xt * weight if weight is not None else Xt)
+
+            if any(sparse.issparse(Xt) for Xt in outputs):
+                return sparse.hstack(outputs).tocsr()
+            return np.hstack(outputs)
+
+        if kind == 'function':
+            return self.analyzers[spec['analyzer']](X)
+
+        if kind == 'column':
+            return X[spec['key']]
+
+        if kind == 'tokenize':
+            return self.tokenize(spec, X)
+
+        if kind == 'tfidf':
+            return self.tfidf(spec, list(X))
+
+        if kind == 'hashing_tfidf':
+            vectorizer = self.analyzers[spec['analyzer']]
+            vectorizer.columns_ = self.arrays[spec['columns']]
+            vectorizer.idf_ = self.arrays[spec['idf']]
+            return vectorizer.transform(X)
+
+        if kind == 'projection':
+            return np.asarray(X @ self.arrays[spec['components']])
+
+        if kind == 'weight':
+            return spec['weight'] * X
+
+        if kind == 'affine':
+            return X * self.arrays[spec['scale']] + self.arrays[spec['offset']]
+
+        if kind == 'select':
+            return X[:, self.arrays[spec['columns']]]
+
+        if kind == 'logistic':
+            scores = X @ self.arrays[spec['coef']].T + self.arrays[spec['intercept']]
+            positive = 1. / (1. + np.exp(-np.asarray(scores).ravel()))
+            return np.column_stack([1 - positive, positive])
+
+        raise ValueError('unknown step type %s' % kind)
+
+    def predict_proba(self, X):
+        return self.run(self.manifest['root'], X)
+
+
+def load(directory, mmap=True):
+    return Artifact(directory, mmap)
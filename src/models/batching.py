@@ -0,0 +1,317 @@
+import os, sys
+import json
+import time
+import asyncio
+import argparse
+
+import numpy as np
+
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from models import serve
+
+
+class MicroBatcher(object):
+    """
+    Gathers concurrent requests into batches of at most max_batch items,
+    waiting at most max_wait seconds after the first one, and scores every
+    batch with a single call so tf-idf, svd and the model work on a matrix
+    instead of a row at a time.
+
+    The batch function runs on a worker thread, the event loop keeps
+    accepting requests meanwhile and they form the next batch.
+    """
+
+    def __init__(self, score_batch, max_batch=32, max_wait=0.005, window=10000):
+        """
+        score_batch: function of a list of items returning one result each
+        max_batch: largest batch handed to score_batch
+        max_wait: seconds the first item of a batch waits for company
+        window: number of recent batches and requests the stats cover
+        """
+        self.score_batch = score_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        self.queue = None
+        self.task = None
+        self.executor = ThreadPoolExecutor(1)
+
+        self.batch_sizes = Counter()
+        self.queue_delays = deque(maxlen=window)
+        self.batch_times = deque(maxlen=window)
+
+    async def submit(self, item):
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            self.task = asyncio.ensure_future(self.run())
+
+        future = asyncio.get_event_loop().create_future()
+        await self.queue.put((item, future, time.time()))
+
+        return await future
+
+    async def next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.time() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.time()
+
+            if timeout <= 0:
+                break
+
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # everything already waiting joins without waiting any longer
+        while len(batch) < self.max_batch and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+
+        return batch
+
+    async def score(self, loop, batch, split=True):
+        """
+        Set the result of every future of the batch. When the batch fails as
+        a whole and split is set its items are scored one at a time, so only
+        the failing ones get the error.
+        """
+        try:
+            results = await loop.run_in_executor(self.executor, self.score_batch, [item for item, _, _ in batch])
+
+            if len(results) != len(batch):
+                raise ValueError('%d results for a batch of %d' % (len(results), len(batch)))
+        except Exception:
+            if not split or len(batch) == 1:
+                raise
+
+            for entry in batch:
+                try:
+                    await self.score(loop, [entry], split=False)
+                except Exception as e:
+                    if not entry[1].done():
+                        entry[1].set_exception(e)
+
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+
+        while True:
+            batch = await self.next_batch()
+
+            try:
+                start = time.time()
+
+                self.batch_sizes[len(batch)] += 1
+                self.queue_delays.extend(1000 * (start - queued) for _, _, queued in batch)
+
+                await self.score(loop, batch)
+
+                self.batch_times.append(1000 * (time.time() - start))
+            except Exception as e:
+                # whatever went wrong fails this batch only, the loop keeps
+                # serving the next one
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def stats(self):
+        batches = sum(self.batch_sizes.values())
+        requests = sum(size * count for size, count in self.batch_sizes.items())
+
+        stats = {'batches': batches, 'requests': requests,
+                 'mean_batch_size': requests / batches if batches else 0.,
+                 'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())}}
+
+        if self.queue_delays:
+            p50, p99 = np.percentile(self.queue_delays, [50, 99])
+            stats.update(queue_delay_p50_ms=p50, queue_delay_p99_ms=p99,
+                         batch_ms_mean=float(np.mean(self.batch_times)))
+
+        return stats
+
+
+class BatchingServer(object):
+    """
+    Asyncio HTTP/1.1 front end with the same endpoints as serve.ScoreHandler,
+    POST /score requests are parsed on a thread pool and scored in micro batches,
+    GET /stats also reports the batch sizes and queueing delays
+    """
+
+    def __init__(self, scorer, max_batch=32, max_wait=0.005, parse_threads=4):
+        """
+        scorer: serve.Scorer
+        max_batch: largest batch scored at once
+        max_wait: seconds the first request of a batch waits for company
+        parse_threads: threads parsing the html of requests, off the event
+                       loop like the batch scoring
+        """
+        self.scorer = scorer
+        self.batcher = MicroBatcher(scorer.score_rows, max_batch, max_wait)
+        self.executor = ThreadPoolExecutor(parse_threads)
+        self.stats = serve.LatencyStats()
+
+    async def score(self, body):
+        start = time.time()
+
+        try:
+            request = json.loads(body)
+            row = await asyncio.get_event_loop().run_in_executor(self.executor, self.scorer.row,
+                                                                 request.get('html'), request.get('boilerplate'))
+            probability = float(await self.batcher.submit(row))
+        except Exception as e:
+            self.stats.add(1000 * (time.time() - start), error=True)
+            return 400, {'error': '%s: %s' % (type(e).__name__, e)}
+
+        ms = 1000 * (time.time() - start)
+        self.stats.add(ms)
+
+        return 200, {'probability': probability, 'ms': ms}
+
+    @staticmethod
+    def parse_head(head):
+        """
+        Method, path and lower cased headers of a request head, ValueError
+        when it is malformed
+        """
+        lines = head.decode('latin-1').split('\r\n')
+        request = lines[0].split(' ')
+
+        if len(request) != 3 or not request[2].startswith('HTTP/'):
+            raise ValueError('malformed request line %r' % lines[0])
+
+        headers = {}
+
+        for line in lines[1:]:
+            if not line:
+                continue
+
+            if ':' not in line:
+                raise ValueError('malformed header %r' % line)
+
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+
+        return request[0], request[1], headers
+
+    @staticmethod
+    def content_length(method, headers):
+        """
+        Length of the body, None when a POST does not say, ValueError when it
+        is not a length
+        """
+        if 'content-length' not in headers:
+            return None if method == 'POST' else 0
+
+        length = int(headers['content-length'])
+
+        if length < 0:
+            raise ValueError('negative content-length %d' % length)
+
+        return length
+
+    async def reply(self, writer, status, response):
+        payload = json.dumps(response).encode('utf-8')
+        writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                     % (status, b'OK' if status == 200 else b'Error', len(payload)) + payload)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.reply(writer, 400, {'error': 'request head too large'})
+                    break
+
+                # without a well formed head the next request cannot be
+                # found in the stream, so errors here close the connection
+                try:
+                    method, path, headers = self.parse_head(head)
+                    length = self.content_length(method, headers)
+                except ValueError as e:
+                    await self.reply(writer, 400, {'error': 'ValueError: %s' % e})
+                    break
+
+                if length is None:
+                    await self.reply(writer, 411, {'error': 'POST needs a content-length'})
+                    break
+
+                try:
+                    body = await reader.readexactly(length)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                if method == 'POST' and path == '/score':
+                    status, response = await self.score(body)
+                elif method == 'GET' and path == '/stats':
+                    status, response = 200, dict(self.stats.summary(), **self.batcher.stats())
+                elif method == 'GET' and path == '/health':
+                    status, response = 200, {'models': len(self.scorer.models)}
+                else:
+                    status, response = 404, {'error': 'unknown path %s' % path}
+
+                await self.reply(writer, status, response)
+
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        finally:
+            writer.close()
+
+    async def start(self, address):
+        """
+        address: host:port, or the path of a unix socket
+        """
+        if ':' in address:
+            host, port = address.rsplit(':', 1)
+            return await asyncio.start_server(self.handle, host, int(port))
+
+        if os.path.exists(address):
+            os.unlink(address)
+
+        return await asyncio.start_unix_server(self.handle, address)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score single pages over http in micro batches')
+    parser.add_argument('--model', action='append', help='artifact directory, repeatable, every exported model by default')
+    parser.add_argument('--address', default='127.0.0.1:8000', help='host:port or unix socket path')
+    parser.add_argument('--engine', default='lxml', choices=['lxml', 'soup'])
+    parser.add_argument('--max-batch', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.)
+    parser.add_argument('--parse-threads', type=int, default=4)
+    args = parser.parse_args()
+
+    directories = args.model or [os.path.join(basepath, model) for model in serve.MODELS
+                                 if os.path.exists(os.path.join(basepath, model, 'manifest.json'))]
+
+    server = BatchingServer(serve.Scorer(directories, engine=args.engine), args.max_batch, args.max_wait_ms / 1000.,
+                            args.parse_threads)
+    print('serving on %s, batches of up to %d, waiting up to %.1fms' % (args.address, args.max_batch, args.max_wait_ms))
+
+    async def run():
+        listener = await server.start(args.address)
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
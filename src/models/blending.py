@@ -1,45 +1,118 @@
+import os
 import numpy as np
 
+from sklearn.base import clone
 from sklearn.cross_validation import KFold
-from sklear.linear_model import LogisticRegression
+from sklearn.linear_model import LogisticRegression
+from sklearn.externals import joblib
+from sklearn.externals.joblib import Parallel, delayed
+
+
+def _fit_fold(model, Xtr, ytr, Xte, X_test):
+	model.fit(Xtr, ytr)
+
+	return model.predict_proba(Xte)[:, 1], model.predict_proba(X_test)[:, 1]
+
 
 class Blending(object):
-	def __init__(self, models):
+	"""
+	Stacking of base models under a logistic regression.
+
+	Every base model is fit on each fold, the fold fits run in parallel, and
+	its out of fold and averaged test predictions are cached on disk keyed by
+	the model, its feature list, the folds and the data. Retuning the meta
+	model or adding a base model only fits what is not cached yet.
+	"""
+
+	def __init__(self, models, n_folds=3, random_state=10, n_jobs=1, cache_dir=None, meta_model=None):
+		"""
+		models: dict of name -> (feature_list, model)
+		n_folds: number of folds the base models are fit on
+		random_state: seed of the fold shuffling
+		n_jobs: number of fold fits run at the same time
+		cache_dir: folder for the cached base model predictions, None to
+				   keep nothing between calls
+		meta_model: model blending the base predictions, logistic
+					regression by default
+		"""
 		self.models = models # dict
-		
-	def predict(self, X, X_test, y=None):
-		cv = KFold(len(X), n_folds=3, shuffle=True, random_state=10)
-		
-		dataset_blend_train = np.zeros((X.shape[0], len(self.models.keys())))
-		dataset_blend_test = np.zeros((X_test.shape[0], len(self.models.keys())))
-		
-		for index, key in enumerate(self.models.keys()):
-			dataset_blend_test_index = np.zeros((X_test.shape[0], len(cv)))
-			
-			model = self.models[key][1]
-			feature_list = self.models[key][0]
-			
+		self.n_folds = n_folds
+		self.random_state = random_state
+		self.n_jobs = n_jobs
+		self.cache_dir = cache_dir
+		self.meta_model = meta_model
+
+	def cache_path(self, key, X, X_test, y):
+		feature_list, model = self.models[key]
+		digest = joblib.hash((key, clone(model), list(feature_list), self.n_folds, self.random_state,
+							  X[feature_list], X_test[feature_list], np.asarray(y)))
+
+		return os.path.join(self.cache_dir, digest + '.pkl')
+
+	def base_predictions(self, X, X_test, y):
+		"""
+		Out of fold predictions on X and fold averaged predictions on X_test,
+		one column per base model
+		"""
+		cv = list(KFold(len(X), n_folds=self.n_folds, shuffle=True, random_state=self.random_state))
+		y = np.asarray(y)
+
+		predictions = {}
+		paths = {}
+
+		if self.cache_dir:
+			os.makedirs(self.cache_dir, exist_ok=True)
+
+			for key in self.models:
+				paths[key] = self.cache_path(key, X, X_test, y)
+
+				if os.path.exists(paths[key]):
+					predictions[key] = joblib.load(paths[key])
+
+		missing = [key for key in self.models if key not in predictions]
+		jobs = []
+
+		for key in missing:
+			feature_list, model = self.models[key]
 			print('Training model of type: ', key)
-			
-			for i , (itrain, itest) in enumerate(cv):
-				Xtr = X.iloc[itrain][feature_list]
-				ytr = y.iloc[itrain]
-
-				Xte = X.iloc[itest][feature_list]
-				yte = y.iloc[itest]
-
-				y_preds = model.predict_proba(Xte)[:, 1]
-				
-				dataset_blend_train[itest, index] = y_preds
-				dataset_blend_test_index[:, i] = model.predict_proba(X_test)[:, 1]
-				
-			dataset_blend_test[:, index] = dataset_blend_test_index.mean(1)
-			 
+
+			# select the features once per model, not once per fold
+			Xf = X[feature_list]
+			Xf_test = X_test[feature_list]
+
+			for itrain, itest in cv:
+				jobs.append(delayed(_fit_fold)(clone(model), Xf.iloc[itrain], y[itrain], Xf.iloc[itest], Xf_test))
+
+		results = iter(Parallel(n_jobs=self.n_jobs)(jobs))
+
+		for key in missing:
+			blend_train = np.zeros(X.shape[0])
+			blend_test = np.zeros((X_test.shape[0], len(cv)))
+
+			for i, (itrain, itest) in enumerate(cv):
+				blend_train[itest], blend_test[:, i] = next(results)
+
+			predictions[key] = (blend_train, blend_test.mean(1))
+
+			if self.cache_dir:
+				joblib.dump(predictions[key], paths[key])
+
+		dataset_blend_train = np.column_stack([predictions[key][0] for key in self.models])
+		dataset_blend_test = np.column_stack([predictions[key][1] for key in self.models])
+
+		return dataset_blend_train, dataset_blend_test
+
+	def blend(self, dataset_blend_train, dataset_blend_test, y):
 		print('\nBlending')
-		clf = LogisticRegression()
-		clf.fit(dataset_blend_train, y)
-		
+		clf = clone(self.meta_model) if self.meta_model is not None else LogisticRegression()
+		clf.fit(dataset_blend_train, np.asarray(y))
+
 		y_submission = clf.predict_proba(dataset_blend_test)[:, 1]
 		y_submission = (y_submission - y_submission.min()) / (y_submission.max() - y_submission.min())
-		
-		return y_submission
\ No newline at end of file
+
+		return y_submission
+
+	def predict(self, X, X_test, y=None):
+		dataset_blend_train, dataset_blend_test = self.base_predictions(X, X_test, y)
+
+		return self.blend(dataset_blend_train, dataset_blend_test, y)
@@ -0,0 +1,111 @@
+import os
+import pickle
+import hashlib
+import tempfile
+
+from collections import OrderedDict
+from multiprocessing import Pool
+
+
+def normalize_expression(s):
+    """ dataset expressions are evaluated without their spaces """
+    return s.replace(' ', '')
+
+def unique_expressions(expressions):
+    """
+    Drop expressions that only differ in spacing from an earlier one,
+    keeping the order of the first occurrences
+    """
+    seen = set()
+    unique = []
+
+    for s in expressions:
+        s = normalize_expression(s)
+
+        if s not in seen:
+            seen.add(s)
+            unique.append(s)
+
+    return unique
+
+def record_path(directory, name):
+    return os.path.join(directory, hashlib.sha1(name.encode('utf-8')).hexdigest() + '.pkl')
+
+def save_record(directory, name, result):
+    """
+    Write the result of one grid cell to its own file. The record is
+    written to a temporary file, synced and renamed into place, so a crash
+    leaves either the complete record or nothing.
+    """
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+    with os.fdopen(fd, 'wb') as outfile:
+        pickle.dump({'name': name, 'result': result}, outfile, pickle.HIGHEST_PROTOCOL)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+
+    os.replace(tmp, record_path(directory, name))
+
+def load_records(directory):
+    """ dict of cell name -> result for every completed cell """
+    records = {}
+
+    for filename in os.listdir(directory):
+        if filename.endswith('.pkl'):
+            with open(os.path.join(directory, filename), 'rb') as infile:
+                record = pickle.load(infile)
+                records[record['name']] = record['result']
+
+    return records
+
+def _run_cells(args):
+    run_cell, directory, group = args
+
+    for name, cell in group:
+        save_record(directory, name, run_cell(cell))
+
+    return [name for name, cell in group]
+
+def run_grid(cells, run_cell, directory, n_jobs=1, group_by=None, verbose=False):
+    """
+    Run every cell of an experiment grid that has no record yet, on a
+    process pool when n_jobs > 1. Each worker writes the record of a cell as
+    soon as it finishes, so rerunning after a crash resumes where it stopped.
+
+    cells: ordered dict of cell name -> argument passed to run_cell
+    run_cell: picklable function computing the result of one cell
+    directory: folder holding one record per completed cell
+    n_jobs: number of worker processes
+    group_by: optional function of a cell, cells with the same key are run
+              one after another by the same worker so they can share caches
+    verbose: print how many cells are left and every cell as it finishes
+
+    Returns the dict of cell name -> result of all completed cells.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    done = load_records(directory)
+    groups = OrderedDict()
+
+    for name, cell in cells.items():
+        if name not in done:
+            key = group_by(cell) if group_by else name
+            groups.setdefault(key, []).append((name, cell))
+
+    tasks = [(run_cell, directory, group) for group in groups.values()]
+    n_pending = sum(map(len, groups.values()))
+
+    if verbose:
+        print('%d cells done, %d to run' % (len(cells) - n_pending, n_pending))
+
+    if n_jobs == 1:
+        for names in map(_run_cells, tasks):
+            if verbose:
+                print('\n'.join(names))
+    else:
+        with Pool(n_jobs) as pool:
+            for names in pool.imap_unordered(_run_cells, tasks):
+                if verbose:
+                    print('\n'.join(names))
+
+    return load_records(directory)
@@ -4,12 +4,11 @@ import re, json
 
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.preprocessing import FunctionTransformer
-from sklearn.pipeline import Pipeline, FeatureUnion
+from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import roc_auc_score
 from sklearn.externals import joblib
-from sklearn.decomposition import TruncatedSVD
 from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.feature_selection import chi2, SelectKBest
@@ -26,35 +25,55 @@ sys.path.append(os.path.join(basepath, 'src'))
 np.random.seed(4)
 
 from data import load_datasets
-from helper import util
+from models import artifact
+from helpers import util
+from helpers.feature_union import ParallelFeatureUnion
+from helpers.svd import ChunkedSVD, TermSVD
+from helpers.hashing import HashingTfidfVectorizer
 
 sns = SnowballStemmer(language='english')
 
-def create_pipeline():
+def tfidf(n_features=None):
+	"""
+	n_features: number of hash buckets, None keeps a vocabulary
+	"""
+	if n_features:
+		return HashingTfidfVectorizer(n_features=n_features, strip_accents='unicode', tokenizer=util.LemmaTokenizer(),
+									  ngram_range=(1, 2), min_df=3, sublinear_tf=True)
+
+	return TfidfVectorizer(strip_accents='unicode', tokenizer=util.LemmaTokenizer(),
+						   ngram_range=(1, 2), min_df=3, sublinear_tf=True)
+
+def lsa(n_components, n_features=None, basis_cache=None, key=None):
+	"""
+	tf-idf followed by a truncated svd
+	
+	basis_cache: helpers.svd.BasisCache to warm start the svd from, under
+				 key, None starts every fit cold
+	"""
+	basis_key = key if basis_cache is not None else None
+	
+	return TermSVD(tfidf(n_features), ChunkedSVD(n_components=n_components, basis_cache=basis_cache, basis_key=basis_key))
+
+def create_pipeline(n_jobs=1, n_features=None, basis_cache=None):
 	strip_non_words = FunctionTransformer(util.remove_non_alphanumeric, validate=False)
 
 	# Lemma Tokenizer
 
-	pipeline_lemma = Pipeline([
+	pipeline = Pipeline([
 		('strip', strip_non_words),
-		('union', FeatureUnion([
+		('union', ParallelFeatureUnion(n_jobs=n_jobs, transformer_list=[
 			('body', Pipeline([
 				('var', util.VarSelect(keys='body_bp')),
-				('tfidf', TfidfVectorizer(strip_accents='unicode', tokenizer=util.LemmaTokenizer(),
-										 ngram_range=(1, 2), min_df=3, sublinear_tf=True)),
-				('svd', TruncatedSVD(n_components=100))
+				('lsa', lsa(100, n_features, basis_cache, 'stem/body'))
 			])),
 			('title', Pipeline([
 				('var', util.VarSelect(keys='title_bp')),
-				('tfidf', TfidfVectorizer(strip_accents='unicode', tokenizer=util.LemmaTokenizer(),
-										 ngram_range=(1, 2), min_df=3, sublinear_tf=True)),
-				('svd', TruncatedSVD(n_components=100))
+				('lsa', lsa(100, n_features, basis_cache, 'stem/title'))
 			])),
 			('url', Pipeline([
 				('var', util.VarSelect(keys='url_component')),
-				('tfidf', TfidfVectorizer(strip_accents='unicode', tokenizer=util.LemmaTokenizer(),
-										 ngram_range=(1,2), min_df=3, sublinear_tf=True)),
-				('svd', TruncatedSVD(n_components=50))
+				('lsa', lsa(50, n_features, basis_cache, 'stem/url'))
 			]))
 		])),
 		('scaler', MinMaxScaler()),
@@ -64,8 +83,8 @@ def create_pipeline():
 
 	return pipeline
 
-def fit_model(X, y):
-	pipeline = create_pipeline()
+def fit_model(X, y, n_jobs=1, n_features=None, basis_cache=None):
+	pipeline = create_pipeline(n_jobs, n_features, basis_cache)
 	pipeline.fit(X, y)
 
 	return pipeline
@@ -91,4 +110,6 @@ def train_model():
 		pipeline = fit_model(train, test)
 
 		joblib.dump(pipeline, os.path.join(basepath, 'data/processed/pipeline_boilerplate_stem/model_stem.pkl'))
+		# flat arrays a serving process can memory map, see models.artifact
+		artifact.export(pipeline, os.path.join(basepath, 'data/processed/pipeline_boilerplate_stem/model_stem'))
 		return pipeline
\ No newline at end of file
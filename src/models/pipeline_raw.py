@@ -8,8 +8,7 @@ warnings.filterwarnings('ignore')
 
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.preprocessing import FunctionTransformer
-from sklearn.pipeline import FeatureUnion, Pipeline
-from sklearn.decomposition import TruncatedSVD
+from sklearn.pipeline import Pipeline
 from sklearn.linear_model import LogisticRegression
 from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
 from sklearn.feature_extraction.text import TfidfVectorizer
@@ -18,7 +17,6 @@ from sklearn.feature_selection import f_classif, chi2, SelectKBest
 from sklearn.metrics import roc_auc_score
 from sklearn.externals import joblib
 
-from nltk import word_tokenize
 from nltk.stem.snowball import SnowballStemmer
 
 
@@ -31,8 +29,12 @@ sys.path.append(os.path.join(basepath, 'src'))
 np.random.seed(2)
 
 from data import parse_raw_features
-from models import train_test_split, cross_val_scheme
+from models import train_test_split, cross_val_scheme, artifact
 from helpers import util
+from helpers.feature_union import ParallelFeatureUnion
+from helpers.svd import ChunkedSVD, TermSVD
+from helpers.hashing import HashingTfidfVectorizer
+from helpers.tokens import TokenCache, Tokenize, NgramAnalyzer
 
 # intialize Porter Stemmer
 
@@ -41,8 +43,12 @@ from helpers import util
 custom_stopwords = ['i', 'http', 'www']
 ENGLISH_STOP_WORDS = set(ENGLISH_STOP_WORDS) | set(custom_stopwords)
 
+FIELDS = ['h1', 'h2', 'h3', 'h4', 'meta-title', 'meta-description', 'span', 'body', 'title']
+
+stemmer = util.StemTokenizer()
+
 def stem_tokens(x):
-	return ' '.join([sns.stem(word) for word in word_tokenize(x)])
+	return ' '.join(stemmer(x))
 
 def preprocess_string(s):
 	return stem_tokens(s)
@@ -57,60 +63,76 @@ class Weights(BaseEstimator, TransformerMixin):
 	def transform(self, X):
 		return self.weight * X
 
+# every field of every document is tokenized once per process, all the
+# branches below and every refit during cross validation share the ids, the
+# least recently used texts are dropped past max_docs
+token_cache = TokenCache(preprocessor=preprocess_string, tokenizer=util.LemmaTokenizer(), stop_words=ENGLISH_STOP_WORDS)
+
+def tfidf(n_features=None):
+	"""
+	n_features: number of hash buckets, None keeps a vocabulary
+	"""
+	if n_features:
+		return HashingTfidfVectorizer(n_features=n_features, analyzer=NgramAnalyzer(ngram_range=(1, 2)), min_df=2, norm='l2', sublinear_tf=True)
+
+	return TfidfVectorizer(analyzer=NgramAnalyzer(ngram_range=(1, 2)), min_df=2, norm='l2', sublinear_tf=True)
+
+def lsa(n_components, n_features=None, basis_cache=None, key=None):
+	"""
+	tf-idf followed by a truncated svd
+	
+	basis_cache: helpers.svd.BasisCache to warm start the svd from, under
+				 key, None starts every fit cold
+	"""
+	basis_key = key if basis_cache is not None else None
+	
+	return TermSVD(tfidf(n_features), ChunkedSVD(n_components=n_components, basis_cache=basis_cache, basis_key=basis_key))
 
-def create_pipeline():
-	strip_non_words = FunctionTransformer(remove_non_alphanumeric, validate=False)
+def create_pipeline(n_jobs=1, n_features=None, basis_cache=None):
+	strip_non_words = FunctionTransformer(util.remove_non_alphanumeric, validate=False)
 
 	pipeline = Pipeline([
 			('strip', strip_non_words),
-			('union', FeatureUnion([
+			('tokenize', Tokenize(token_cache, keys=FIELDS)),
+			('union', ParallelFeatureUnion(n_jobs=n_jobs, transformer_list=[
 					('h1_', Pipeline([
-						('var', VarSelect(keys='h1')),
-						('tfidf', TfidfVectorizer(ngram_range=(1, 2), min_df=2, tokenizer=LemmaTokenizer(), stop_words=ENGLISH_STOP_WORDS, preprocessor=preprocess_string, strip_accents='unicode', norm='l2', sublinear_tf=True)),
-						('svd', TruncatedSVD(n_components=50))
+						('var', util.VarSelect(keys='h1')),
+						('lsa', lsa(50, n_features, basis_cache, 'raw/h1'))
 					])),
 					('h2_', Pipeline([
-						('var', VarSelect(keys='h2')),
-						('tfidf', TfidfVectorizer(ngram_range=(1, 2), min_df=2, tokenizer=LemmaTokenizer(), stop_words=ENGLISH_STOP_WORDS, preprocessor=preprocess_string, strip_accents='unicode', norm='l2', sublinear_tf=True)),
-						('svd', TruncatedSVD(n_components=50))
+						('var', util.VarSelect(keys='h2')),
+						('lsa', lsa(50, n_features, basis_cache, 'raw/h2'))
 					])),
 					('h3_', Pipeline([
-						('var', VarSelect(keys='h3')),
-						('tfidf', TfidfVectorizer(ngram_range=(1, 2), min_df=2, tokenizer=LemmaTokenizer(), stop_words=ENGLISH_STOP_WORDS, preprocessor=preprocess_string, strip_accents='unicode', norm='l2', sublinear_tf=True)),
-						('svd', TruncatedSVD(n_components=50))
+						('var', util.VarSelect(keys='h3')),
+						('lsa', lsa(50, n_features, basis_cache, 'raw/h3'))
 					])),
 					('h4_', Pipeline([
-						('var', VarSelect(keys='h4')),
-						('tfidf', TfidfVectorizer(ngram_range=(1, 2), min_df=2, tokenizer=LemmaTokenizer(), stop_words=ENGLISH_STOP_WORDS, preprocessor=preprocess_string, strip_accents='unicode', norm='l2', sublinear_tf=True)),
-						('svd', TruncatedSVD(n_components=50))
+						('var', util.VarSelect(keys='h4')),
+						('lsa', lsa(50, n_features, basis_cache, 'raw/h4'))
 					])),
 					('meta_title', Pipeline([
-						('var', VarSelect(keys='meta-title')),
-						('tfidf', TfidfVectorizer(ngram_range=(1, 2), min_df=2, tokenizer=LemmaTokenizer(), stop_words=ENGLISH_STOP_WORDS, preprocessor=preprocess_string, strip_accents='unicode', norm='l2', sublinear_tf=True)),
-						('svd', TruncatedSVD(n_components=50)),
+						('var', util.VarSelect(keys='meta-title')),
+						('lsa', lsa(50, n_features, basis_cache, 'raw/meta_title')),
 						('weight', Weights(weight=5))
 					])),
 					('meta_description', Pipeline([
-						('var', VarSelect(keys='meta-description')),
-						('tfidf', TfidfVectorizer(ngram_range=(1, 2), min_df=2, tokenizer=LemmaTokenizer(), stop_words=ENGLISH_STOP_WORDS, preprocessor=preprocess_string, strip_accents='unicode', norm='l2', sublinear_tf=True)),
-						('svd', TruncatedSVD(n_components=50)),
+						('var', util.VarSelect(keys='meta-description')),
+						('lsa', lsa(50, n_features, basis_cache, 'raw/meta_description')),
 						('weight', Weights(weight=3))
 					])),
 					('span_', Pipeline([
-						('var', VarSelect(keys='span')),
-						('tfidf', TfidfVectorizer(min_df=2, ngram_range=(1, 2), tokenizer=LemmaTokenizer(), stop_words=ENGLISH_STOP_WORDS, preprocessor=preprocess_string, strip_accents='unicode', norm='l2', sublinear_tf=True)),
-						('svd', TruncatedSVD(n_components=50))
+						('var', util.VarSelect(keys='span')),
+						('lsa', lsa(50, n_features, basis_cache, 'raw/span'))
 					])),
 					('lsa_body', Pipeline([
-						('var', VarSelect(keys='body')),
-						('tfidf', TfidfVectorizer(min_df=2, ngram_range=(1, 2), tokenizer=LemmaTokenizer(), stop_words=ENGLISH_STOP_WORDS, preprocessor=preprocess_string, strip_accents='unicode', norm='l2', sublinear_tf=True)),
-						('svd', TruncatedSVD(n_components=100)),
+						('var', util.VarSelect(keys='body')),
+						('lsa', lsa(100, n_features, basis_cache, 'raw/lsa_body')),
 						('weight', Weights(weight=20))
 					])),
 					('lsa_title', Pipeline([
-						('var', VarSelect(keys='title')),
-						('tfidf', TfidfVectorizer(ngram_range=(1, 2), min_df=2, tokenizer=LemmaTokenizer(), stop_words=ENGLISH_STOP_WORDS,preprocessor=preprocess_string, strip_accents='unicode', norm='l2', sublinear_tf=True)),
-						('svd', TruncatedSVD(n_components=50)),
+						('var', util.VarSelect(keys='title')),
+						('lsa', lsa(50, n_features, basis_cache, 'raw/lsa_title')),
 						('weight', Weights(weight=5))
 					])),
 				])),
@@ -120,8 +142,8 @@ def create_pipeline():
 		])
 	return pipeline
 
-def fit_model(X, y):
-	pipeline = create_pipeline()
+def fit_model(X, y, n_jobs=1, n_features=None, basis_cache=None):
+	pipeline = create_pipeline(n_jobs, n_features, basis_cache)
 	pipeline.fit(X, y)
 
 	return pipeline
@@ -145,5 +167,7 @@ def train_model():
 
 		# store this model on the disk
 		joblib.dump(pipeline, os.path.join(basepath, 'data/processed/pipeline_raw/model_raw.pkl'))
+		# flat arrays a serving process can memory map, see models.artifact
+		artifact.export(pipeline, os.path.join(basepath, 'data/processed/pipeline_raw/model_raw'))
 
 		return pipeline
\ No newline at end of file
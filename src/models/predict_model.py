@@ -1,7 +1,8 @@
 from sklearn.linear_model import LogisticRegression
 
-def predict(train, labels, test):
-    model = LogisticRegression()
+def predict(train, labels, test, model=None):
+    if model is None:
+        model = LogisticRegression()
     model.fit(train, labels)
 
     return model.predict_proba(test)[:, -1]
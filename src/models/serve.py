@@ -0,0 +1,211 @@
+import os, sys
+import json
+import time
+import socket
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+basepath = os.path.expanduser('~/Desktop/src/Stumbleupon_classification_challenge/')
+sys.path.append(os.path.join(basepath, 'src'))
+
+from data.parse_raw_features import Parse
+from models import artifact
+
+# artifacts written by train_model in the pipeline modules
+MODELS = ['data/processed/pipeline_raw/model_raw',
+          'data/processed/pipeline_boilerplate_lemma/model_lemma',
+          'data/processed/pipeline_boilerplate_stem/model_stem']
+
+
+class Scorer(object):
+    """
+    Loads exported pipelines once and scores single pages, the evergreen
+    probability is the mean over the loaded models
+    """
+
+    def __init__(self, models, engine='lxml'):
+        """
+        models: exported artifact directories, see models.artifact, or
+                fitted pipelines
+        engine: Parse engine used on the raw html
+        """
+        self.models = [artifact.load(model) if isinstance(model, str) else model for model in models]
+        self.parser = Parse(engine=engine)
+
+    def row(self, html, boilerplate):
+        """
+        Every column the pipelines select from, the Parse tags of the html
+        and the boilerplate components
+        """
+        if isinstance(boilerplate, str):
+            boilerplate = json.loads(boilerplate) if boilerplate else {}
+
+        boilerplate = boilerplate or {}
+        row = dict(zip(Parse.TAGS, self.parser.extract_html(html or '')))
+
+        for key in ['body', 'title', 'url']:
+            row[key] = boilerplate.get(key) or u''
+
+        row['body_bp'], row['title_bp'], row['url_component'] = row['body'], row['title'], row['url']
+
+        return row
+
+    def score_rows(self, rows):
+        """
+        Probabilities of many rows, every model transforms them in one call
+        """
+        X = pd.DataFrame(rows)
+        return np.mean([model.predict_proba(X)[:, 1] for model in self.models], axis=0)
+
+    def score(self, html, boilerplate):
+        return float(self.score_rows([self.row(html, boilerplate)])[0])
+
+
+class LatencyStats(object):
+    """
+    Request latencies over a sliding window, in milliseconds
+    """
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def add(self, ms, error=False):
+        with self.lock:
+            self.latencies.append(ms)
+            self.count += 1
+            self.errors += int(error)
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            count, errors = self.count, self.errors
+
+        if not len(latencies):
+            return {'count': count, 'errors': errors}
+
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+
+        return {'count': count, 'errors': errors, 'mean_ms': latencies.mean(),
+                'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99, 'max_ms': latencies.max()}
+
+
+class ScoreHandler(BaseHTTPRequestHandler):
+    """
+    POST /score with {"html": ..., "boilerplate": ...} returns
+    {"probability": ..., "ms": ...}, GET /stats the latency summary
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # headers and body go out in two writes, nagle would hold the second
+        # one back until the client's delayed ack, 40ms on linux
+        self.disable_nagle_algorithm = self.request.family != socket.AF_UNIX
+        BaseHTTPRequestHandler.setup(self)
+
+    def reply(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self.reply(200, self.server.stats.summary())
+        elif self.path == '/health':
+            self.reply(200, {'models': len(self.server.scorer.models)})
+        else:
+            self.reply(404, {'error': 'unknown path %s' % self.path})
+
+    def do_POST(self):
+        if self.path != '/score':
+            return self.reply(404, {'error': 'unknown path %s' % self.path})
+
+        start = time.time()
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            probability = self.server.scorer.score(request.get('html'), request.get('boilerplate'))
+        except Exception as e:
+            self.server.stats.add(1000 * (time.time() - start), error=True)
+            return self.reply(400, {'error': '%s: %s' % (type(e).__name__, e)})
+
+        ms = 1000 * (time.time() - start)
+        self.server.stats.add(ms)
+
+        self.reply(200, {'probability': probability, 'ms': ms})
+
+    def address_string(self):
+        # unix socket peers have no address
+        return str(self.client_address[0]) if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(scorer, address, verbose=False):
+    """
+    address: host:port, or the path of a unix socket
+    """
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        server = ThreadingHTTPServer((host, int(port)), ScoreHandler)
+    else:
+        if os.path.exists(address):
+            os.unlink(address)
+        server = ThreadingUnixHTTPServer(address, ScoreHandler)
+
+    server.scorer = scorer
+    server.stats = LatencyStats()
+    server.verbose = verbose
+
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Score single pages over http')
+    parser.add_argument('--model', action='append', help='artifact directory, repeatable, every exported model by default')
+    parser.add_argument('--address', default='127.0.0.1:8000', help='host:port or unix socket path')
+    parser.add_argument('--engine', default='lxml', choices=['lxml', 'soup'])
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    directories = args.model or [os.path.join(basepath, model) for model in MODELS
+                                 if os.path.exists(os.path.join(basepath, model, 'manifest.json'))]
+
+    start = time.time()
+    scorer = Scorer(directories, engine=args.engine)
+    print('loaded %d models in %.1fms' % (len(scorer.models), 1000 * (time.time() - start)))
+
+    server = make_server(scorer, args.address, args.verbose)
+    print('serving on %s' % args.address)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,224 @@
+import os
+import hashlib
 import numpy as np
 
+from scipy import sparse
+from collections.abc import Mapping
+from multiprocessing import Pool, cpu_count
 from sklearn.cross_validation import KFold
+from sklearn.linear_model import LogisticRegression
 from .predict_model import predict
 
+from features.feature_sets import get_featureset
+from helpers.feature_store import take_rows
+from helpers.shared_arrays import share_arrays, attach_arrays, matrix_arrays, matrix_from_arrays, release
+
 import gensim
+from gensim.models import LdaModel, LdaMulticore
+
+# set in every worker of get_scores by _attach_data
+_worker = {}
+
+def make_model(warm_start=False, random_state=0, solver=None):
+    """ solver: LogisticRegression solver, None for its default """
+    options = {'solver': solver} if solver is not None else {}
+    model = LogisticRegression(warm_start=warm_start, random_state=random_state, **options)
+
+    # liblinear ('warn' picks it) ignores warm_start, quietly fitting cold
+    # would not be what was asked for
+    if warm_start and model.solver in ('liblinear', 'warn'):
+        raise ValueError('the %s solver ignores warm_start, pass e.g. solver=\'lbfgs\'' % model.solver)
+
+    return model
+
+def get_folds(n_labels, n_rows):
+    """ 10 KFold splits of the labelled rows, then all labelled rows vs the rest """
+    folds = list(KFold(n_labels, 10))
+    folds.append((np.arange(n_labels), np.arange(n_labels, n_rows)))
 
-def get_scores(data, labels):
-    
+    return folds
+
+def fit_folds(data, labels, folds, tasks, warm_start, random_state, solver=None):
+    """
+    Fit and predict the given folds one after another, warm started folds
+    reuse the model of the previous fold as their starting point
+    """
+    model = make_model(warm_start, random_state, solver)
     scores = []
 
-    for train_idx, test_idx in KFold(len(labels), 10):
-        score = predict(data[train_idx], labels[train_idx], data[test_idx])
-        scores.append(score)
+    for task in tasks:
+        train_idx, test_idx = folds[task]
+
+        if not warm_start:
+            model = make_model(warm_start, random_state, solver)
+
+        # KFold rows are sorted runs, the test fold is a view of data
+        scores.append(predict(take_rows(data, train_idx), labels[train_idx], take_rows(data, test_idx), model))
+
+    return scores
+
+def _attach_data(spec, warm_start, random_state, solver):
+    blocks, arrays = attach_arrays(spec)
 
-    score = predict(data[:len(labels)], labels, data[len(labels):])
-    scores.append(score)
+    _worker['blocks'] = blocks
+    _worker['data'] = matrix_from_arrays({k: v for k, v in arrays.items() if k != 'labels'})
+    _worker['labels'] = arrays['labels']
+    _worker['folds'] = get_folds(len(arrays['labels']), _worker['data'].shape[0])
+    _worker['options'] = (warm_start, random_state, solver)
+
+def _fit_shared(tasks):
+    return fit_folds(_worker['data'], _worker['labels'], _worker['folds'], tasks, *_worker['options'])
+
+def get_scores(data, labels, n_jobs=1, warm_start=False, random_state=0, solver=None):
+    """
+    Out of fold predictions for the 10 KFold splits followed by the test set
+    predictions of a model fit on all labelled rows
+
+    data: feature matrix, labelled rows first
+    labels: labels of the first len(labels) rows
+    n_jobs: worker processes, the matrix is shared with them through shared
+            memory so it is not pickled for every fit, -1 uses every core
+    warm_start: start every fit from the coefficients of the previous one,
+                with n_jobs > 1 each worker warm starts through its own
+                contiguous run of folds
+    random_state: seed of every model, for a given seed and warm_start=False
+                  the scores do not depend on n_jobs
+    solver: LogisticRegression solver, None for its default. warm_start
+            needs one that honours it, liblinear does not.
+    """
+    # fail before forking rather than in every worker
+    make_model(warm_start, random_state, solver)
+
+    folds = get_folds(len(labels), data.shape[0])
+    tasks = list(range(len(folds)))
+    n_jobs = n_jobs if n_jobs > 0 else max(cpu_count() + 1 + n_jobs, 1)
+
+    if n_jobs == 1:
+        return np.hstack(fit_folds(data, labels, folds, tasks, warm_start, random_state, solver))
+
+    if warm_start:
+        chunks = [list(chunk) for chunk in np.array_split(tasks, n_jobs)]
+    else:
+        chunks = [[task] for task in tasks]
+
+    arrays = matrix_arrays(data)
+    arrays['labels'] = np.asarray(labels)
+    blocks, spec = share_arrays(arrays)
+
+    try:
+        with Pool(n_jobs, initializer=_attach_data, initargs=(spec, warm_start, random_state, solver)) as pool:
+            scores = [score for chunk in pool.map(_fit_shared, chunks) for score in chunk]
+    finally:
+        release(blocks, unlink=True)
 
     return np.hstack(scores)
 
 
-def get_lda(name, n):
+class ColumnIds(Mapping):
+    """
+    id2word for gensim that names every column of the matrix by its index,
+    without scanning the corpus or building a dict of the whole vocabulary
+    """
+
+    def __init__(self, n_columns):
+        self.n_columns = n_columns
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.n_columns:
+            raise KeyError(i)
+        return str(i)
+
+    def __iter__(self):
+        return iter(range(self.n_columns))
+
+    def __len__(self):
+        return self.n_columns
+
+class CsrCorpus(object):
+    """
+    Streams the rows of a sparse matrix to gensim as bag of words documents,
+    slicing chunksize rows at a time instead of converting the whole matrix
+    """
+
+    def __init__(self, data, chunksize=2000):
+        self.data = sparse.csr_matrix(data)
+        self.chunksize = chunksize
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __iter__(self):
+        for start in range(0, self.data.shape[0], self.chunksize):
+            chunk = self.data[start:start + self.chunksize]
+
+            for i in range(chunk.shape[0]):
+                lo, hi = chunk.indptr[i], chunk.indptr[i + 1]
+                yield list(zip(chunk.indices[lo:hi].tolist(), chunk.data[lo:hi].tolist()))
+
+def matrix_fingerprint(data):
+    """ hash of the shape and the stored entries of a sparse or dense matrix """
+    h = hashlib.sha1(str(data.shape).encode('utf-8'))
+
+    for name, array in sorted(matrix_arrays(data).items()):
+        h.update(name.encode('utf-8'))
+        h.update(np.ascontiguousarray(array))
+
+    return h.hexdigest()
+
+def lda_path(name, n, data, workers=1, chunksize=2000, passes=1, random_state=0):
+    """
+    Where the model trained with these options on data is saved, any change
+    to the options or to the underlying text features gives a new path
+    """
+    key = '%s:%d:%d:%d:%d:%d:%s' % (name.replace(' ', ''), n, workers, chunksize, passes, random_state,
+                                    matrix_fingerprint(data))
+    return os.path.join('../data/processed/lda/', hashlib.sha1(key.encode('utf-8')).hexdigest() + '.model')
+
+def train_lda(data, n, workers=1, chunksize=2000, passes=1, random_state=0):
+    """
+    Train an LDA model on the rows of a sparse count matrix, streamed in
+    chunks, on several cores when workers > 1
+    """
+    corpus = CsrCorpus(data, chunksize)
+    id2word = ColumnIds(data.shape[1])
+
+    if workers > 1:
+        return LdaMulticore(corpus, num_topics=n, id2word=id2word, workers=workers,
+                            chunksize=chunksize, passes=passes, random_state=random_state)
+
+    return LdaModel(corpus, num_topics=n, id2word=id2word, chunksize=chunksize,
+                    passes=passes, random_state=random_state)
+
+def lda_topics(lda, data, chunksize=2000):
+    """
+    Sparse topic distributions of the rows of data under a trained model,
+    new pages only need this inference step
+    """
+    blocks = []
+
+    for start in range(0, data.shape[0], chunksize):
+        chunk = list(CsrCorpus(data[start:start + chunksize], chunksize))
+        blocks.append(gensim.matutils.corpus2csc(lda[chunk], num_terms=lda.num_topics).T)
+
+    return sparse.vstack(blocks).tocsr()
+
+def get_lda(name, n, workers=1, chunksize=2000, passes=1):
+    """
+    Topic features of a dataset expression, the topic model is trained once
+    per expression, number of topics, training options and text features
+    and kept on disk
+    """
     data = get_featureset(name, tf_idf=False, norm=None, stem=False,
                           stopwords=True)
 
-    corpus = gensim.matutils.Scipy2Corpus(data)
-    lda = LdaModel(corpus, num_topics=n)
-    data = gensim.matutils.corpus2csc(lda[corpus]).T
+    path = lda_path(name, n, data, workers, chunksize, passes)
+
+    if os.path.exists(path):
+        lda = LdaModel.load(path)
+    else:
+        lda = train_lda(data, n, workers, chunksize, passes)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lda.save(path)
 
-    return data
+    return lda_topics(lda, data, chunksize)
@@ -0,0 +1,4 @@
+import os, sys
+
+# the modules import each other as top level packages of src, e.g. helpers.util
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
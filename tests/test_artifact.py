@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_selection import SelectKBest, chi2
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import FeatureUnion, Pipeline
+from sklearn.preprocessing import FunctionTransformer, MinMaxScaler, StandardScaler
+
+# the scikit-learn the code is written against
+pytest.importorskip('sklearn.externals.joblib')
+
+from helpers import util
+from helpers.feature_union import ParallelFeatureUnion
+from helpers.hashing import HashingTfidfVectorizer
+from helpers.svd import ChunkedSVD, TermSVD
+from helpers.tokens import NgramAnalyzer, TokenCache, Tokenize
+from models import artifact
+
+FIELDS = ['title', 'body']
+
+
+class Weights(BaseEstimator, TransformerMixin):
+    """ same as the Weights step of the pipelines, exported by its name """
+
+    def __init__(self, weight):
+        self.weight = weight
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        return self.weight * X
+
+    def __sklearn_is_fitted__(self):
+        return True
+
+
+def pages(n, seed=0):
+    random_state = np.random.RandomState(seed)
+    words = np.array(['w%d' % i for i in range(300)])
+    labels = random_state.randint(0, 2, n)
+
+    def text(length, label):
+        picked = words[np.minimum(random_state.zipf(1.3, length), len(words)) - 1]
+        return ' '.join(picked) + (' good!' if label else ' bad?') * random_state.randint(0, 3)
+
+    df = pd.DataFrame({'title': [text(10, label) for label in labels],
+                       'body': [text(60, label) for label in labels]})
+
+    return df, labels
+
+
+def raw_pipeline():
+    """ pipeline_raw: token cache, n-gram ids, term svd, weights """
+    cache = TokenCache(stop_words={'w0'})
+
+    def branch(field, weight=None):
+        steps = [('var', util.VarSelect(keys=field)),
+                 ('lsa', TermSVD(TfidfVectorizer(analyzer=NgramAnalyzer(ngram_range=(1, 2)), min_df=2, sublinear_tf=True),
+                                 ChunkedSVD(n_components=8, random_state=0)))]
+
+        if weight:
+            steps.append(('weight', Weights(weight=weight)))
+
+        return Pipeline(steps)
+
+    return Pipeline([
+        ('strip', FunctionTransformer(util.remove_non_alphanumeric, validate=False)),
+        ('tokenize', Tokenize(cache, keys=FIELDS)),
+        ('union', ParallelFeatureUnion(transformer_list=[('title', branch('title', 5)), ('body', branch('body'))])),
+        ('scale', MinMaxScaler()),
+        ('feat', SelectKBest(chi2, k=10)),
+        ('model', LogisticRegression())
+    ])
+
+
+def boilerplate_pipeline():
+    """ the boilerplate pipelines: word tf-idf, hashing tf-idf, weighted union """
+    return Pipeline([
+        ('union', FeatureUnion([
+            ('title', Pipeline([('var', util.VarSelect(keys='title')),
+                                ('tfidf', TfidfVectorizer(ngram_range=(1, 2), min_df=2, sublinear_tf=True)),
+                                ('svd', TruncatedSVD(n_components=8, random_state=0))])),
+            ('body', Pipeline([('var', util.VarSelect(keys='body')),
+                               ('lsa', TermSVD(HashingTfidfVectorizer(n_features=2 ** 12, ngram_range=(1, 2), min_df=2),
+                                               ChunkedSVD(n_components=8, random_state=0)))]))
+        ], transformer_weights={'title': 2., 'body': None})),
+        ('scale', StandardScaler()),
+        ('model', LogisticRegression())
+    ])
+
+
+@pytest.mark.parametrize('make_pipeline', [raw_pipeline, boilerplate_pipeline])
+@pytest.mark.parametrize('mmap', [True, False])
+def test_artifact_predicts_like_the_pipeline(tmp_path, make_pipeline, mmap):
+    train, labels = pages(120)
+    # different seed: unseen words and n-grams, tokens missing from the cache
+    test, _ = pages(30, seed=1)
+
+    pipeline = make_pipeline().fit(train, labels)
+    loaded = artifact.load(artifact.export(pipeline, str(tmp_path)), mmap=mmap)
+
+    np.testing.assert_allclose(loaded.predict_proba(test), pipeline.predict_proba(test), atol=1e-10)
+    np.testing.assert_allclose(loaded.predict_proba(test[:1]), pipeline.predict_proba(test[:1]), atol=1e-10)
+
+
+def test_flat_vocabulary_lookup():
+    vocabulary = artifact.FlatVocabulary.from_dict({'b': 0, 'a': 2, 'ab': 1, 'é': 3})
+
+    assert vocabulary.lookup(['a', 'é', 'zzz', 'abc', 'b']).tolist() == [2, 3, -1, -1, 0]
+    assert artifact.FlatVocabulary.from_dict({7: 1, 3: 0}).lookup([3, 5, 7]).tolist() == [0, -1, 1]
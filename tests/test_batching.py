@@ -0,0 +1,179 @@
+import json
+import time
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+# the scikit-learn the code is written against
+pytest.importorskip('sklearn.externals.joblib')
+
+from helpers import util
+from models import batching, serve
+
+
+def page(i):
+    words = ['green', 'forever', 'news', 'today', 'recipe', 'cake']
+    picked = [words[(i * 7 + j) % len(words)] for j in range(i % 5 + 1)]
+
+    html = '<html><head><meta name="title" content="%s"></head><body><h1>%s</h1><span>%d</span></body></html>' \
+        % (' '.join(picked), ' '.join(reversed(picked)), i)
+    boilerplate = {'title': picked[0], 'body': ' '.join(picked * 2), 'url': 'page %d' % i}
+
+    return html, boilerplate
+
+
+@pytest.fixture(scope='module')
+def scorer():
+    pages = [page(i) for i in range(60)]
+    unfitted = serve.Scorer([])
+    X = pd.DataFrame([unfitted.row(html, boilerplate) for html, boilerplate in pages])
+    y = np.arange(len(pages)) % 3 == 0
+
+    models = [Pipeline([('var', util.VarSelect(keys=key)), ('tfidf', TfidfVectorizer()), ('model', LogisticRegression())]).fit(X, y)
+              for key in ['body_bp', 'h1']]
+
+    return serve.Scorer(models)
+
+
+def test_batched_scores_equal_single_scores(scorer):
+    server = batching.BatchingServer(scorer, max_batch=16, max_wait=0.01)
+    pages = [page(i) for i in range(120)]
+
+    async def score_all():
+        return await asyncio.gather(*[server.score(json.dumps({'html': html, 'boilerplate': json.dumps(boilerplate)}))
+                                      for html, boilerplate in pages])
+
+    responses = asyncio.run(score_all())
+
+    assert [status for status, _ in responses] == [200] * len(pages)
+    np.testing.assert_allclose([response['probability'] for _, response in responses],
+                               [scorer.score(html, boilerplate) for html, boilerplate in pages], rtol=1e-12)
+
+    # requests really were scored together
+    stats = server.batcher.stats()
+    assert stats['requests'] == len(pages) and stats['batches'] < len(pages)
+
+
+class Recorder(object):
+    """ score_batch doubling its items and remembering every batch """
+
+    def __init__(self, fail=()):
+        self.batches = []
+        self.fail = set(fail)
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+
+        if self.fail & set(items):
+            raise RuntimeError('cannot score %s' % sorted(self.fail & set(items)))
+
+        return [2 * item for item in items]
+
+
+def test_max_batch_is_respected():
+    recorder = Recorder()
+    batcher = batching.MicroBatcher(recorder, max_batch=8, max_wait=0.05)
+
+    async def submit_all():
+        return await asyncio.gather(*[batcher.submit(i) for i in range(50)])
+
+    assert asyncio.run(submit_all()) == [2 * i for i in range(50)]
+    assert max(len(batch) for batch in recorder.batches) == 8
+    assert sorted(item for batch in recorder.batches for item in batch) == list(range(50))
+
+
+def test_max_wait_is_respected():
+    recorder = Recorder()
+    batcher = batching.MicroBatcher(recorder, max_batch=8, max_wait=0.05)
+
+    async def staggered():
+        start = time.time()
+        first = asyncio.ensure_future(batcher.submit(1))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(batcher.submit(2))
+        results = await asyncio.gather(first, second)
+        waited = time.time() - start
+
+        # well past max_wait, so it starts a batch of its own
+        await asyncio.sleep(0.1)
+        late = await batcher.submit(3)
+
+        return results, late, waited
+
+    results, late, waited = asyncio.run(staggered())
+
+    assert results == [2, 4] and late == 6
+    assert recorder.batches == [[1, 2], [3]]
+    # a batch that does not fill up waits max_wait for company, not longer
+    assert 0.05 <= waited < 0.5
+
+
+def test_failing_request_does_not_fail_its_batch_mates():
+    recorder = Recorder(fail={3})
+    batcher = batching.MicroBatcher(recorder, max_batch=8, max_wait=0.05)
+
+    async def submit_all():
+        results = await asyncio.gather(*[batcher.submit(i) for i in range(6)], return_exceptions=True)
+        # the loop keeps serving
+        return results, await batcher.submit(7)
+
+    results, again = asyncio.run(submit_all())
+
+    assert isinstance(results[3], RuntimeError)
+    assert [result for i, result in enumerate(results) if i != 3] == [0, 2, 4, 8, 10]
+    assert again == 14
+
+
+def test_wrong_number_of_results_fails_only_that_batch():
+    batcher = batching.MicroBatcher(lambda items: [0.5], max_batch=4, max_wait=0.05)
+
+    async def submit_all():
+        return await asyncio.gather(*[batcher.submit(i) for i in range(3)], return_exceptions=True)
+
+    # split into single items, each of which gets its one result
+    assert asyncio.run(submit_all()) == [0.5, 0.5, 0.5]
+
+    batcher = batching.MicroBatcher(lambda items: [], max_batch=4, max_wait=0.05)
+    results = asyncio.run(submit_all())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+async def exchange(server, raw):
+    """ status line of the server's answer to raw bytes sent on a fresh connection """
+    listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(raw)
+        await writer.drain()
+
+        answer = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+    finally:
+        listener.close()
+        await listener.wait_closed()
+
+    return answer.split(b'\r\n', 1)[0]
+
+
+@pytest.mark.parametrize('raw, status', [
+    (b'GET /health HTTP/1.1\r\nConnection: close\r\n\r\n', b'HTTP/1.1 200 OK'),
+    (b'POST /score HTTP/1.1\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}', b'HTTP/1.1 200 OK'),
+    (b'POST /score HTTP/1.1\r\nContent-Length: 5\r\nConnection: close\r\n\r\n{nope', b'HTTP/1.1 400 Error'),
+    (b'POST /score HTTP/1.1\r\nContent-Length: twelve\r\n\r\n', b'HTTP/1.1 400 Error'),
+    (b'POST /score HTTP/1.1\r\nContent-Length: -1\r\n\r\n', b'HTTP/1.1 400 Error'),
+    (b'POST /score HTTP/1.1\r\nHost: x\r\n\r\n{}', b'HTTP/1.1 411 Error'),
+    (b'GARBAGE\r\n\r\n', b'HTTP/1.1 400 Error'),
+    (b'GET /health HTTP/1.1\r\nno colon here\r\n\r\n', b'HTTP/1.1 400 Error'),
+    (b'GET /nowhere HTTP/1.1\r\nConnection: close\r\n\r\n', b'HTTP/1.1 404 Error'),
+])
+def test_malformed_requests_get_an_answer(scorer, raw, status):
+    server = batching.BatchingServer(scorer)
+    assert asyncio.run(exchange(server, raw)) == status
@@ -0,0 +1,38 @@
+from collections import OrderedDict
+
+from models.experiment_grid import load_records, run_grid, unique_expressions
+
+
+CELLS = OrderedDict([('a:x', ('a', 'x')), ('b:x', ('b', 'x')), ('a:y', ('a', 'y'))])
+
+
+def score(cell):
+    return '-'.join(cell)
+
+
+def test_quiet_unless_verbose(tmp_path, capsys):
+    scores = run_grid(CELLS, score, str(tmp_path))
+
+    assert scores == {name: score(cell) for name, cell in CELLS.items()}
+    assert capsys.readouterr().out == ''
+
+    run_grid(CELLS, score, str(tmp_path / 'verbose'), group_by=lambda cell: cell[1], verbose=True)
+    out = capsys.readouterr().out.splitlines()
+
+    assert out[0] == '0 cells done, 3 to run'
+    assert out[1:] == ['a:x', 'b:x', 'a:y']
+
+
+def test_resumes_from_the_records(tmp_path, capsys):
+    run_grid(OrderedDict(list(CELLS.items())[:1]), score, str(tmp_path))
+
+    def fail_on_done(cell):
+        assert cell != ('a', 'x')
+        return score(cell)
+
+    assert run_grid(CELLS, fail_on_done, str(tmp_path), verbose=True) == load_records(str(tmp_path))
+    assert capsys.readouterr().out.splitlines()[0] == '1 cells done, 2 to run'
+
+
+def test_unique_expressions():
+    assert unique_expressions(['a + b', 'a+b', 'c', 'a +b', 'c ']) == ['a+b', 'c']
@@ -0,0 +1,265 @@
+from functools import reduce
+
+import numpy as np
+import pytest
+
+from scipy import sparse
+
+from data import DATASETS
+from features import feature_sets
+
+FIELDS = ['title', 'h1', 'h2', 'h3', 'other', 'meta-description', 'meta-keywords', 'img', 'a',
+          'boilerplate', 'boilerpipe']
+
+
+def pairwise_maximum(A, B):
+    """ the two argument sparse maximum n-ary max replaced """
+    BisBigger = A - B
+    BisBigger.data = np.where(BisBigger.data < 0, 1, 0)
+
+    return A - A.multiply(BisBigger) + B.multiply(BisBigger)
+
+
+def random_features(n_rows=40, n_cols=60, seed=0):
+    random_state = np.random.RandomState(seed)
+
+    return {field: sparse.random(n_rows, n_cols, density=0.1, format='csr', random_state=random_state,
+                                 data_rvs=lambda n: random_state.randint(1, 5, n).astype(float))
+            for field in FIELDS}
+
+
+@pytest.fixture
+def text(monkeypatch):
+    text = random_features()
+    monkeypatch.setattr(feature_sets, '_loaded', {'text_features': text})
+
+    return text
+
+
+def recursive_parse(s, text):
+    """ the string splitting parser compile_expression replaced """
+    plus = lambda x, y: x + y
+    times = lambda x, y: x * y
+
+    if s == 'body':
+        s = 'h1+h2+h3+img+a+other'
+
+    if feature_sets.FUNCTION.match(s):
+        name, param = feature_sets.FUNCTION.match(s).group(1, 2)
+
+        if param == 'all':
+            param = ','.join(text)
+
+        items = [recursive_parse(p, text) for p in param.split(',')]
+
+        return reduce({'max': pairwise_maximum, 'sum': plus}[name], items)
+
+    if '+' in s:
+        return reduce(plus, [recursive_parse(p, text) for p in s.split('+')])
+
+    if '*' in s:
+        return reduce(times, [recursive_parse(p, text) for p in s.split('*')])
+
+    try:
+        return float(s)
+    except ValueError:
+        pass
+
+    return text[s]
+
+
+EXPRESSIONS = sorted(set(DATASETS.DATASETS + DATASETS.LDA_DATASETS + ['body', 'sum(h1,title)', 'max(h2)']))
+
+
+@pytest.mark.parametrize('expression', EXPRESSIONS)
+def test_parse_matches_recursive_parse(text, expression):
+    expected = recursive_parse(expression.replace(' ', ''), text)
+
+    np.testing.assert_allclose(feature_sets.parse(expression).toarray(), expected.toarray())
+
+
+def test_shared_memo_matches_private_memo(text):
+    memo = {}
+
+    for expression in EXPRESSIONS:
+        np.testing.assert_allclose(feature_sets.parse(expression, memo).toarray(),
+                                   feature_sets.parse(expression).toarray())
+
+    # max(title, h1) and max(h1, title) share one node
+    assert feature_sets.compile_expression('max(title,h1)', tuple(text)) == \
+        feature_sets.compile_expression('max(h1,title)', tuple(text))
+
+
+def test_parse_returns_a_copy(text):
+    memo = {}
+    first = feature_sets.parse('max(title,h1)*10', memo)
+    first.data[:] = 0
+
+    assert feature_sets.parse('max(title,h1)*10', memo).sum() > 0
+
+
+def signed_matrices(n, n_rows=30, n_cols=25, density=0.2, seed=1):
+    random_state = np.random.RandomState(seed)
+
+    return [sparse.random(n_rows, n_cols, density=density, format='csr', random_state=random_state,
+                          data_rvs=lambda k: random_state.randint(-3, 4, k).astype(float))
+            for _ in range(n)]
+
+
+@pytest.mark.parametrize('n', [1, 2, 3, 6])
+@pytest.mark.parametrize('block_size', [1, 7, 1 << 20])
+def test_sparse_maximum_matches_pairwise(n, block_size):
+    matrices = signed_matrices(n)
+    result = feature_sets.sparse_maximum(*matrices, block_size=block_size)
+
+    np.testing.assert_array_equal(result.toarray(), reduce(pairwise_maximum, matrices).toarray())
+    np.testing.assert_array_equal(result.toarray(), reduce(np.maximum, [M.toarray() for M in matrices]))
+
+    # no explicit zeros, canonical csr
+    assert not np.any(result.data == 0)
+    assert result.has_canonical_format
+
+
+def test_sparse_maximum_non_canonical_input():
+    A, B = signed_matrices(2)
+
+    # every entry stored twice with half its value, columns unsorted within
+    # a row, summed first like the sparse operators do
+    indices = np.concatenate([np.tile(A.indices[a:b][::-1], 2) for a, b in zip(A.indptr[:-1], A.indptr[1:])])
+    data = np.concatenate([np.tile(A.data[a:b][::-1] / 2, 2) for a, b in zip(A.indptr[:-1], A.indptr[1:])])
+    duplicated = sparse.csr_matrix((data, indices, 2 * A.indptr), shape=A.shape)
+
+    assert not duplicated.has_canonical_format
+
+    expected = pairwise_maximum(A, B).toarray()
+
+    np.testing.assert_allclose(feature_sets.sparse_maximum(duplicated, B).toarray(), expected)
+
+
+def test_sparse_maximum_empty_and_mixed():
+    empty = sparse.csr_matrix((30, 25))
+    A, B = signed_matrices(2)
+
+    np.testing.assert_array_equal(feature_sets.sparse_maximum(empty, empty).toarray(), np.zeros((30, 25)))
+    np.testing.assert_array_equal(feature_sets.sparse_maximum(empty, A, B).toarray(),
+                                  reduce(pairwise_maximum, [empty, A, B]).toarray())
+
+    # a dense argument turns the whole maximum sparse
+    np.testing.assert_array_equal(feature_sets.maximum(A, B.toarray()).toarray(), pairwise_maximum(A, B).toarray())
+    np.testing.assert_array_equal(feature_sets.maximum(A.toarray(), B.toarray()), np.maximum(A.toarray(), B.toarray()))
+
+
+WORDS = ['the', 'running', 'runs', 'and', 'connection', 'run', 'connected', 'of', 'cats', 'cat', 'zebra', 'between']
+
+
+def dok_stopword_matrix(words):
+    """ the stopword matrix as it was built before the masks """
+    matrix = sparse.eye(len(words), format='dok')
+
+    for word_id, word in enumerate(words):
+        if word in feature_sets.ENGLISH_STOP_WORDS:
+            matrix[word_id, word_id] = 0
+
+    return matrix.tocsr()
+
+
+def dok_stem_matrix(words):
+    stems = {}
+
+    for word_id, word in enumerate(words):
+        stems.setdefault(feature_sets.stemmer.stem(word), []).append(word_id)
+
+    matrix = sparse.dok_matrix((len(words), len(stems)))
+
+    for stem_id, s in enumerate(stems):
+        for word_id in stems[s]:
+            matrix[word_id, stem_id] = 1.
+
+    return matrix.tocsr()
+
+
+def word_counts(n_rows=20, seed=2):
+    random_state = np.random.RandomState(seed)
+    counts = sparse.random(n_rows, len(WORDS), density=0.4, format='csr', random_state=random_state,
+                           data_rvs=lambda k: random_state.randint(1, 4, k).astype(float))
+    # an explicit zero, which the product drops as well
+    counts.data[0] = 0
+
+    return counts
+
+
+def test_stopword_and_stem_matrices_match_dok():
+    np.testing.assert_array_equal(feature_sets.make_stopword_matrix(WORDS).toarray(), dok_stopword_matrix(WORDS).toarray())
+    np.testing.assert_array_equal(feature_sets.make_stem_matrix(WORDS).toarray(), dok_stem_matrix(WORDS).toarray())
+
+
+def test_mask_columns_matches_product():
+    counts = word_counts()
+    masked = feature_sets.mask_columns(counts, feature_sets.make_stopword_mask(WORDS))
+    product = counts * dok_stopword_matrix(WORDS)
+    product.eliminate_zeros()
+
+    np.testing.assert_array_equal(masked.toarray(), product.toarray())
+    # same stored entries, the product just leaves them unsorted
+    np.testing.assert_array_equal(masked.indptr, product.indptr)
+    assert masked.dtype == product.dtype
+
+
+@pytest.mark.parametrize('tf_idf', [True, False])
+def test_get_featureset_matches_products(monkeypatch, tf_idf):
+    counts = word_counts()
+    monkeypatch.setattr(feature_sets, '_loaded', {'text_features': {'title': counts},
+                                                  'stopword_matrix': dok_stopword_matrix(WORDS),
+                                                  'stem_matrix': feature_sets.make_stem_matrix(WORDS)})
+
+    expected = counts * dok_stopword_matrix(WORDS) * dok_stem_matrix(WORDS)
+
+    if tf_idf:
+        expected = feature_sets.TfidfTransformer(use_idf=True, smooth_idf=True, sublinear_tf=True).fit_transform(expected)
+
+    expected = feature_sets.normalize(expected, 'l2')
+    result = feature_sets.get_featureset('title', stem=True, stopwords=True, tf_idf=tf_idf,
+                                         use_idf=True, smooth_idf=True, sublinear_tf=True)
+
+    np.testing.assert_allclose(result.toarray(), expected.toarray())
+
+
+class Vocabulary(object):
+    """ stands in for the pickled text_vectorizer """
+
+    def __init__(self, words):
+        self.words = words
+
+    def get_feature_names(self):
+        return self.words
+
+
+def test_save_replaces_what_load_cached_kept(tmp_path, monkeypatch):
+    # save and load work on ../data/processed relative to src
+    (tmp_path / 'data' / 'processed').mkdir(parents=True)
+    (tmp_path / 'src').mkdir()
+    monkeypatch.chdir(tmp_path / 'src')
+    monkeypatch.setattr(feature_sets, '_loaded', {})
+
+    counts = word_counts()
+    feature_sets.save('text_features', {'title': counts})
+
+    def rebuild(words):
+        feature_sets.save('text_vectorizer', Vocabulary(words))
+        feature_sets.save('stopword_matrix', feature_sets.make_stopword_matrix())
+        feature_sets.save('stem_matrix', feature_sets.make_stem_matrix())
+
+    def featureset():
+        return feature_sets.get_featureset('title', stem=True, stopwords=True, tf_idf=False, norm=None).toarray()
+
+    rebuild(WORDS)
+    np.testing.assert_array_equal(featureset(), (counts * dok_stopword_matrix(WORDS) * dok_stem_matrix(WORDS)).toarray())
+
+    # the vocabulary changes, e.g. the text features were recounted
+    words = WORDS[::-1]
+    rebuild(words)
+    np.testing.assert_array_equal(featureset(), (counts * dok_stopword_matrix(words) * dok_stem_matrix(words)).toarray())
+
+    recounted = word_counts(seed=3)
+    feature_sets.save('text_features', {'title': recounted})
+    np.testing.assert_array_equal(feature_sets.parse('title').toarray(), recounted.toarray())
@@ -0,0 +1,140 @@
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scipy import sparse
+
+from helpers import feature_store
+from helpers.feature_store import FeatureStore, row_runs, row_slice, take_rows
+
+
+ROWS = [
+    np.arange(3, 9),                    # one run
+    np.array([0, 1, 2, 7, 8, 11]),      # sorted runs
+    np.array([5]),
+    np.array([8, 2, 5, 2]),             # unsorted with a repeat
+    np.array([], dtype=int),
+    np.arange(12) % 3 == 0,             # boolean mask
+    slice(2, 9),
+    slice(0, 12, 2),
+]
+
+
+def matrices(seed=0):
+    """ the same 12 x 7 matrix as CSR, dense and a DataFrame """
+    dense = sparse.random(12, 7, density=0.3, random_state=seed).toarray()
+    dense[4] = 0
+
+    return {'csr': sparse.csr_matrix(dense), 'dense': dense, 'frame': pd.DataFrame(dense, columns=list('abcdefg'))}
+
+
+def assert_same(got, expected):
+    if sparse.issparse(expected):
+        assert sparse.isspmatrix_csr(got)
+        assert got.shape == expected.shape
+        np.testing.assert_array_equal(got.toarray(), expected.toarray())
+        got.check_format(full_check=True)
+    elif isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(got, expected)
+    else:
+        np.testing.assert_array_equal(got, expected)
+
+
+@pytest.mark.parametrize('kind', ['csr', 'dense', 'frame'])
+@pytest.mark.parametrize('rows', ROWS, ids=range(len(ROWS)))
+def test_take_rows_matches_indexing(kind, rows):
+    X = matrices()[kind]
+    expected = X.iloc[rows] if kind == 'frame' else X[rows]
+
+    assert_same(take_rows(X, rows), expected)
+
+
+def test_single_run_shares_the_data():
+    X = matrices()
+    rows = take_rows(X['csr'], np.arange(3, 9))
+
+    assert np.shares_memory(rows.data, X['csr'].data) and np.shares_memory(rows.indices, X['csr'].indices)
+    assert np.shares_memory(take_rows(X['dense'], np.arange(3, 9)), X['dense'])
+
+
+@pytest.mark.parametrize('start, stop', [(0, 12), (3, 9), (4, 5), (6, 6), (11, 12)])
+def test_row_slice_matches_slicing(start, stop):
+    X = matrices()['csr']
+    rows = row_slice(X, start, stop)
+
+    assert_same(rows, X[start:stop])
+    assert rows.indptr[0] == 0
+
+
+def test_row_runs():
+    assert row_runs([3, 4, 5, 9, 10, 12]) == [(3, 6), (9, 11), (12, 13)]
+    assert row_runs(np.array([False, True, True, False, True])) == [(1, 3), (4, 5)]
+    assert row_runs([]) == []
+    assert row_runs([2, 1]) is None
+    assert row_runs([1, 1]) is None
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_write_read_round_trip(tmp_path, mmap):
+    X = matrices()
+    path = str(tmp_path / 'features')
+
+    # a pickle left behind is replaced
+    with open(path, 'wb') as outfile:
+        pickle.dump(X['dense'], outfile)
+
+    value = {'csr': X['csr'], 'dense': X['dense'], 'empty': sparse.csr_matrix((0, 7))}
+    assert feature_store.storable(value)
+
+    feature_store.write(path, value)
+
+    assert feature_store.is_stored(path)
+    assert not os.path.exists(path + '.tmp')
+
+    with open(os.path.join(path, feature_store.META)) as infile:
+        assert json.load(infile) == {'format': 'store', 'fields': ['csr', 'dense', 'empty']}
+
+    store = feature_store.read(path, mmap)
+
+    assert isinstance(store, FeatureStore)
+    assert list(store) == ['csr', 'dense', 'empty'] and len(store) == 3
+    assert store.loaded == {}
+
+    assert_same(store['csr'], X['csr'])
+    assert_same(store['dense'], X['dense'])
+    assert store['empty'].shape == (0, 7)
+    assert list(store.loaded) == ['csr', 'dense', 'empty']
+
+    assert_same(store.rows('csr', [0, 1, 2, 7]), X['csr'][[0, 1, 2, 7]])
+
+    with pytest.raises(KeyError):
+        store['missing']
+
+    restored = pickle.loads(pickle.dumps(store))
+    assert restored.loaded == {}
+    assert_same(restored['csr'], X['csr'])
+
+
+def test_single_matrix_round_trip(tmp_path):
+    X = matrices()['csr']
+    path = str(tmp_path / 'matrix')
+
+    feature_store.write(path, X)
+    assert_same(feature_store.read(path), X)
+
+    feature_store.write(path, X.toarray())
+    assert_same(feature_store.read(path), X.toarray())
+
+
+def test_storable():
+    X = matrices()
+
+    assert feature_store.storable(X['csr']) and feature_store.storable(X['dense'])
+    assert not feature_store.storable(X['frame'])
+    assert not feature_store.storable({})
+    assert not feature_store.storable({'a': {'b': X['dense']}})
+    assert not feature_store.storable(np.array(['text']))
@@ -0,0 +1,99 @@
+import pickle
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.pipeline import FeatureUnion, Pipeline
+from sklearn.preprocessing import FunctionTransformer
+
+from helpers import util
+from helpers.feature_union import ParallelFeatureUnion
+
+
+def frame(n=40, seed=0):
+    random_state = np.random.RandomState(seed)
+    words = ['w%d' % i for i in range(50)]
+
+    return pd.DataFrame({field: [' '.join(random_state.choice(words, 8)) for _ in range(n)]
+                         for field in ['title', 'body']})
+
+
+def text_length(column):
+    return np.array([[len(text)] for text in column], dtype=float)
+
+
+def branches(dense=False):
+    def tfidf(field):
+        steps = [('var', util.VarSelect(keys=field)), ('tfidf', TfidfVectorizer())]
+
+        if dense:
+            steps.append(('svd', TruncatedSVD(n_components=3, random_state=0)))
+
+        return Pipeline(steps)
+
+    return [('title', tfidf('title')), ('body', tfidf('body')),
+            ('length', Pipeline([('var', util.VarSelect(keys='body')),
+                                 ('length', FunctionTransformer(text_length, validate=False))]))]
+
+
+def as_array(X):
+    return X.toarray() if sparse.issparse(X) else X
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+@pytest.mark.parametrize('dense', [False, True])
+@pytest.mark.parametrize('weights', [None, {'title': 2., 'length': 0.5}])
+def test_matches_feature_union(n_jobs, dense, weights):
+    train, test = frame(), frame(seed=1)
+
+    expected = FeatureUnion(branches(dense), transformer_weights=weights)
+    union = ParallelFeatureUnion(branches(dense), n_jobs=n_jobs, transformer_weights=weights)
+
+    fitted = as_array(union.fit_transform(train))
+
+    np.testing.assert_allclose(fitted, as_array(expected.fit_transform(train)))
+    np.testing.assert_allclose(as_array(union.transform(test)), as_array(expected.transform(test)))
+    assert sparse.issparse(union.transform(test)) == (not dense)
+
+    # the fitted branches came back from the workers
+    assert union.transformer_list[0][1].named_steps['tfidf'].vocabulary_
+    assert set(union.timings_) == {'title', 'body', 'length'}
+
+
+def test_fit_then_transform_matches_fit_transform():
+    train = frame()
+    union = ParallelFeatureUnion(branches(), n_jobs=2)
+
+    np.testing.assert_allclose(as_array(union.fit(train).transform(train)),
+                               as_array(clone(union).fit_transform(train)))
+
+
+def test_pickle_round_trip():
+    train, test = frame(), frame(seed=1)
+    union = ParallelFeatureUnion(branches(), n_jobs=2, transformer_weights={'body': 3.}).fit(train)
+    restored = pickle.loads(pickle.dumps(union))
+
+    assert restored.n_jobs == 2 and restored.transformer_weights == {'body': 3.}
+    np.testing.assert_allclose(as_array(restored.transform(test)), as_array(union.transform(test)))
+
+
+def fit_in_worker(_):
+    union = ParallelFeatureUnion(branches(), n_jobs=2)
+    return union.workers(3), as_array(union.fit_transform(frame()))
+
+
+def test_serial_inside_daemon_workers():
+    assert ParallelFeatureUnion(branches(), n_jobs=2).workers(3) == 2
+    assert ParallelFeatureUnion(branches(), n_jobs=-1).workers(3) >= 1
+
+    with multiprocessing.get_context('fork').Pool(1) as pool:
+        workers, Xt = pool.map(fit_in_worker, [0])[0]
+
+    assert workers == 1
+    np.testing.assert_allclose(Xt, as_array(FeatureUnion(branches()).fit_transform(frame())))
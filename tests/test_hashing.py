@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# the scikit-learn the code is written against
+pytest.importorskip('sklearn.externals.joblib')
+
+from helpers.hashing import HashingTfidfVectorizer, mix64
+from helpers.tokens import NgramAnalyzer
+
+
+N_FEATURES = 2 ** 24
+
+DOCS = ['the cat sat on the mat', 'the dog sat', 'a cat and a dog and a cat', 'mat mat mat rug',
+        'dogs chase cats', 'the rug is on the floor', 'cat', '']
+
+NEW_DOCS = ['the cat chased the dog', 'unseen words only', 'rug rug cat']
+
+
+def string_buckets(terms):
+    hasher = FeatureHasher(n_features=N_FEATURES, input_type='string', alternate_sign=False)
+    return [hasher.transform([[term]]).indices[0] for term in terms]
+
+
+def int_buckets(terms):
+    return (mix64(np.array(terms, dtype=np.int64)) % np.uint64(N_FEATURES)).astype(np.int64).tolist()
+
+
+def aligned(hashing, vocabulary, buckets):
+    """
+    Columns of the TfidfVectorizer output in the order the hashing one keeps
+    its buckets, the toy vocabularies are far too small to collide
+    """
+    terms = sorted(vocabulary, key=vocabulary.get)
+    buckets = buckets(terms)
+
+    assert len(set(buckets)) == len(buckets)
+    assert sorted(buckets) == hashing.columns_.tolist()
+
+    return np.array([vocabulary[terms[i]] for i in np.argsort(buckets)])
+
+
+OPTIONS = [dict(), dict(sublinear_tf=True), dict(smooth_idf=False), dict(use_idf=False), dict(norm='l1'),
+           dict(norm=None, sublinear_tf=True), dict(min_df=2), dict(min_df=np.int64(2)), dict(min_df=0.3),
+           dict(ngram_range=(1, 2), min_df=2)]
+
+
+@pytest.mark.parametrize('options', OPTIONS)
+def test_string_features_match_tfidf_vectorizer(options):
+    vocabulary = TfidfVectorizer(**options)
+    hashing = HashingTfidfVectorizer(n_features=N_FEATURES, **options)
+
+    expected = vocabulary.fit_transform(DOCS)
+    result = hashing.fit_transform(DOCS)
+
+    order = aligned(hashing, vocabulary.vocabulary_, string_buckets)
+
+    np.testing.assert_allclose(result.toarray(), expected.toarray()[:, order])
+    np.testing.assert_allclose(hashing.transform(NEW_DOCS).toarray(), vocabulary.transform(NEW_DOCS).toarray()[:, order])
+
+
+@pytest.mark.parametrize('options', OPTIONS[:6])
+def test_int_features_match_tfidf_vectorizer(options):
+    random_state = np.random.RandomState(0)
+    docs = [random_state.randint(0, 30, random_state.randint(0, 20)) for _ in range(25)]
+
+    vocabulary = TfidfVectorizer(analyzer=NgramAnalyzer(ngram_range=(1, 2)), **options)
+    hashing = HashingTfidfVectorizer(n_features=N_FEATURES, analyzer=NgramAnalyzer(ngram_range=(1, 2)), **options)
+
+    expected = vocabulary.fit_transform(docs)
+    result = hashing.fit_transform(docs)
+
+    order = aligned(hashing, vocabulary.vocabulary_, int_buckets)
+
+    np.testing.assert_allclose(result.toarray(), expected.toarray()[:, order])
+
+
+def test_parallel_transform_matches_serial():
+    docs = DOCS * 5
+    serial = HashingTfidfVectorizer(n_features=2 ** 10, sublinear_tf=True).fit(docs)
+    parallel = HashingTfidfVectorizer(n_features=2 ** 10, sublinear_tf=True, n_jobs=2, chunksize=7).fit(docs)
+
+    np.testing.assert_array_equal(serial.columns_, parallel.columns_)
+    np.testing.assert_allclose(parallel.transform(docs).toarray(), serial.transform(docs).toarray())
+
+
+@pytest.mark.parametrize('min_df', [-1, -0.1, 1.5, 2.0])
+def test_rejects_min_df_outside_its_range(min_df):
+    with pytest.raises(ValueError):
+        HashingTfidfVectorizer(n_features=2 ** 10, min_df=min_df).fit(DOCS)
@@ -0,0 +1,77 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from unidecode import unidecode
+
+from data.make_dataset import extract_domain, parse_data, transliterate
+
+
+def row_parse(df):
+    """ the per row parsing parse_data replaced, as a list of dicts """
+    data = []
+
+    for key, row in df.iterrows():
+        item = {column: row[column] for column in df.columns}
+
+        item['real_url'] = row['url'].lower()
+        item['domain'] = extract_domain(row['url'])
+        item['tld'] = item['domain'].split('.')[-1]
+
+        boilerplate = json.loads(row['boilerplate'])
+
+        for f in ['title', 'url', 'body']:
+            item[f] = boilerplate[f] if f in boilerplate else u''
+            item[f] = unidecode(item[f]) if item[f] else ''
+
+        item['label'] = row['label'] if 'label' in row else np.nan
+        data.append(item)
+
+    return data
+
+
+def crawl(labelled=True):
+    urls = ['http://www.bbc.co.uk/news/a', 'http://WWW.Example.COM/Path', 'https://blog.example.com/x',
+            'http://www.bbc.co.uk/sport', 'http://recipes.food.net/', 'http://a.b.co.jp/c']
+    boilerplate = [{'title': 'Café naïve', 'body': 'résumé – über', 'url': 'bbc news'},
+                   {'title': 'plain ascii', 'body': None},
+                   {},
+                   {'title': '', 'url': '中文 text', 'body': 'ascii body'},
+                   {'title': 'Crème brûlée', 'body': 'café'},
+                   {'body': '© 2013'}]
+
+    df = pd.DataFrame({'url': urls, 'urlid': range(len(urls)),
+                       'boilerplate': [json.dumps(bp) for bp in boilerplate]})
+
+    if labelled:
+        df['label'] = [0, 1, 1, 0, 1, 0]
+
+    return df
+
+
+@pytest.mark.parametrize('labelled', [True, False])
+def test_parse_data_matches_row_parsing(labelled):
+    df = crawl(labelled)
+    parsed = parse_data(df)
+    rows = row_parse(df)
+
+    # url ends up holding the boilerplate url in both
+    for column in ['urlid', 'boilerplate', 'real_url', 'domain', 'tld', 'title', 'url', 'body']:
+        assert parsed[column].tolist() == [row[column] for row in rows], column
+
+    np.testing.assert_array_equal(parsed['label'].values.astype(float), [float(row['label']) for row in rows])
+
+
+def test_parse_data_rejects_urls_without_host():
+    df = crawl()
+    df.loc[2, 'url'] = 'not a url'
+
+    with pytest.raises(ValueError, match='not a url'):
+        parse_data(df)
+
+
+def test_transliterate_matches_unidecode():
+    texts = ['ascii', '', None, 'naïve café', '中文', 'café été']
+    assert transliterate(texts) == [unidecode(t) if t else '' for t in texts]
@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+from data.corpus_loader import DirectorySource, TarSource
+from data.packed_corpus import PackedCorpus, append, open_source, source_urlids
+
+
+PAGES = {'3': b'<html>three</html>', '10': b'<html>ten, a longer page</html>', '7': b'', '42': b'x' * 100}
+
+
+def raw_content(directory, pages):
+    """ one file per urlid, the layout DirectorySource reads """
+    os.makedirs(str(directory), exist_ok=True)
+
+    for urlid, content in pages.items():
+        with open(os.path.join(str(directory), urlid), 'wb') as outfile:
+            outfile.write(content)
+
+    return DirectorySource(str(directory))
+
+
+class Failing(object):
+    """ source whose read fails for one urlid """
+
+    def __init__(self, source, urlid):
+        self.source = source
+        self.urlid = urlid
+
+    def read(self, urlid):
+        if urlid == self.urlid:
+            raise IOError(urlid)
+
+        return self.source.read(urlid)
+
+
+@pytest.mark.parametrize('shard_size', [1 << 30, 20, 1])
+def test_pack_read_round_trip(tmp_path, shard_size):
+    source = raw_content(tmp_path / 'raw', PAGES)
+    corpus = append(str(tmp_path / 'packed'), source, sorted(PAGES), shard_size)
+
+    assert len(corpus) == len(PAGES)
+    assert all(bytes(corpus.read(urlid)) == content for urlid, content in PAGES.items())
+    assert corpus.stats()['live_bytes'] == sum(len(content) for content in PAGES.values())
+    assert '8' not in corpus and '42' in corpus
+
+    with pytest.raises(IOError):
+        corpus.read('8')
+
+
+def test_shards_are_cut_at_shard_size(tmp_path):
+    source = raw_content(tmp_path / 'raw', PAGES)
+    corpus = append(str(tmp_path / 'packed'), source, ['3', '10', '7', '42'], shard_size=20)
+
+    # a shard is closed by the page that takes it past shard_size
+    assert corpus.names == ['shard-00000', 'shard-00001']
+    assert {str(urlid): shard for urlid, shard in zip(corpus.urlids, corpus.shard)} == \
+           {'3': 0, '10': 0, '7': 1, '42': 1}
+    assert not [name for name in os.listdir(str(tmp_path / 'packed')) if name.endswith('.tmp')]
+
+
+def test_later_shards_override_earlier_ones(tmp_path):
+    directory = str(tmp_path / 'packed')
+    append(directory, raw_content(tmp_path / 'old', PAGES), sorted(PAGES))
+
+    newer = {'10': b'<html>recrawled</html>', '5': b'<html>five</html>'}
+    corpus = append(directory, raw_content(tmp_path / 'new', newer), sorted(newer))
+
+    assert corpus.stats()['shards'] == 2
+    assert len(corpus) == len(PAGES) + 1
+    assert bytes(corpus.read('10')) == newer['10']
+    assert bytes(corpus.read('3')) == PAGES['3']
+
+    # the override holds for a fresh reader too
+    assert bytes(PackedCorpus(directory).read('10')) == newer['10']
+
+
+def test_failing_read_keeps_finished_shards(tmp_path):
+    directory = str(tmp_path / 'packed')
+    source = Failing(raw_content(tmp_path / 'raw', PAGES), '42')
+
+    with pytest.raises(IOError):
+        append(directory, source, ['3', '10', '7', '42'], shard_size=20)
+
+    corpus = PackedCorpus(directory)
+
+    assert sorted(corpus.urlids.tolist()) == [3, 10]
+    assert not [name for name in os.listdir(directory) if name.endswith('.tmp')]
+
+
+def test_open_source_falls_back_to_the_directory(tmp_path):
+    raw = raw_content(tmp_path / 'raw', PAGES)
+
+    source = open_source(str(tmp_path / 'raw'))
+    assert isinstance(source, DirectorySource)
+    assert source_urlids(source) == sorted(PAGES)
+
+    TarSource.pack(raw, sorted(PAGES), str(tmp_path / 'raw.tar'))
+    source = open_source(str(tmp_path / 'raw.tar'))
+    assert isinstance(source, TarSource)
+    assert source_urlids(source) == sorted(PAGES)
+
+    append(str(tmp_path / 'packed'), source, source_urlids(source))
+    source = open_source(str(tmp_path / 'packed'))
+    assert isinstance(source, PackedCorpus)
+    assert sorted(source_urlids(source)) == sorted(PAGES)
+    assert all(bytes(source.read(urlid)) == content for urlid, content in PAGES.items())
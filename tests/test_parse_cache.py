@@ -0,0 +1,130 @@
+import os
+import pickle
+
+import pytest
+
+from data.parse_cache import ParseCache
+
+# the scikit-learn the code is written against
+pytest.importorskip('sklearn.externals.joblib')
+
+from data.corpus_loader import CorpusLoader, DirectorySource
+from data.parse_raw_features import Parse
+
+
+PAGES = {
+    '1': b'<html><body><h1>One</h1><span>first page</span></body></html>',
+    '2': b'<html><head><meta name="title" content="Two"></head><body><h2>Second</h2></body></html>',
+    '3': b'',
+}
+
+
+def write_pages(directory, pages):
+    for urlid, content in pages.items():
+        with open(os.path.join(str(directory), urlid), 'wb') as outfile:
+            outfile.write(content)
+
+
+def parser(directory, cache):
+    """ Parse reading the pages in directory through cache """
+    return Parse(cache=cache, loader=CorpusLoader(DirectorySource(str(directory)), n_threads=2))
+
+
+def counting(parse):
+    """ record the urlids extract_pages is asked to parse """
+    parsed = []
+    extract_pages = parse.extract_pages
+
+    def record(urlids):
+        parsed.extend(str(urlid) for urlid in urlids)
+        return extract_pages(urlids)
+
+    parse.extract_pages = record
+    return parsed
+
+
+def test_hit_after_put_many(tmp_path):
+    cache = ParseCache(str(tmp_path / 'cache.db'), 'v1')
+    digest = cache.digest(PAGES['1'])
+
+    assert cache.get_many([('1', digest)]) == {}
+
+    cache.put_many([(1, digest, ['one', ''])])
+
+    assert cache.get_many([(1, digest), ('2', cache.digest(PAGES['2']))]) == {'1': ['one', '']}
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3.}
+    assert str(cache) == 'ParseCache(hits=1, misses=2, hit_rate=33.33%)'
+
+
+def test_miss_after_the_content_changes(tmp_path):
+    cache = ParseCache(str(tmp_path / 'cache.db'), 'v1')
+    cache.put_many([('1', cache.digest(PAGES['1']), ['one'])])
+
+    assert cache.get_many([('1', cache.digest(PAGES['1'] + b' '))]) == {}
+
+    # the new content replaces the old row
+    cache.put_many([('1', cache.digest(PAGES['1'] + b' '), ['changed'])])
+    assert cache.get_many([('1', cache.digest(PAGES['1'] + b' '))]) == {'1': ['changed']}
+    assert cache.get_many([('1', cache.digest(PAGES['1']))]) == {}
+
+
+def test_miss_after_a_version_change(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    old = ParseCache(path, 'v1')
+    old.put_many([('1', old.digest(PAGES['1']), ['one'])])
+
+    new = ParseCache(path, 'v2')
+
+    assert new.digest(PAGES['1']) != old.digest(PAGES['1'])
+    assert new.get_many([('1', new.digest(PAGES['1']))]) == {}
+    assert ParseCache(path, 'v1').get_many([('1', old.digest(PAGES['1']))]) == {'1': ['one']}
+
+
+def test_cache_version_follows_parse_version_and_tags(monkeypatch):
+    version = Parse.cache_version()
+
+    monkeypatch.setattr(Parse, 'VERSION', Parse.VERSION + 1)
+    bumped = Parse.cache_version()
+
+    monkeypatch.setattr(Parse, 'TAGS', Parse.TAGS + ['h5'])
+
+    assert len({version, bumped, Parse.cache_version()}) == 3
+
+
+def test_pickled_cache_reopens_its_database(tmp_path):
+    cache = ParseCache(str(tmp_path / 'cache.db'), 'v1')
+    cache.put_many([('1', cache.digest(PAGES['1']), ['one'])])
+
+    restored = pickle.loads(pickle.dumps(cache))
+
+    assert restored._conn is None
+    assert restored.get_many([('1', cache.digest(PAGES['1']))]) == {'1': ['one']}
+
+
+def test_extract_all_only_parses_new_or_modified_pages(tmp_path):
+    write_pages(tmp_path, PAGES)
+    cache = ParseCache(str(tmp_path / 'cache.db'), Parse.cache_version())
+    urlids = sorted(PAGES)
+
+    parse = parser(tmp_path, cache)
+    parsed = counting(parse)
+    rows = parse.extract_all(urlids)
+
+    assert parsed == urlids
+    assert rows == parser(tmp_path, None).extract_all(urlids)
+
+    parse = parser(tmp_path, cache)
+    parsed = counting(parse)
+
+    assert parse.extract_all(urlids) == rows
+    assert parsed == []
+
+    write_pages(tmp_path, {'2': b'<html><body><h2>Rewritten</h2></body></html>'})
+    parse = parser(tmp_path, cache)
+    parsed = counting(parse)
+    changed = parse.extract_all(urlids)
+
+    assert parsed == ['2']
+    assert changed[0] == rows[0] and changed[2] == rows[2]
+    assert changed[1][Parse.TAGS.index('h2')] == 'rewritten'
+    assert cache.stats()['hits'] == 5 and cache.stats()['misses'] == 4
@@ -0,0 +1,98 @@
+import warnings
+
+import pytest
+
+from bs4 import BeautifulSoup
+
+from features import parse_raw_content
+from features.parse_raw_content import ParserChoice
+
+
+# page, the parser the old lxml -> xml -> html5lib chain ends up using
+DOCUMENTS = {
+    'body': (b'<html><head><title>T</title></head><body><h1>Hi</h1><img alt="pic"><a href="/">link</a></body></html>',
+             'lxml'),
+    'no body tag': (b'<title>T</title><h2>Heading</h2><p>just a paragraph</p>', 'lxml'),
+    'head only': (b'<!DOCTYPE html><html><head><title>T</title><meta name="description" content="d">'
+                  b'<script>var a = "<b>";</script><style>p {}</style></head></html>', 'html5lib'),
+    'empty': (b'', 'html5lib'),
+    'whitespace': (b'  \n\t ', 'html5lib'),
+    'comment': (b'<!-- nothing but a comment -->', 'html5lib'),
+    'frameset': (b'<html><head><title>F</title></head><frameset><frame src="a.html"></frameset></html>', None),
+    'xml': (b'<?xml version="1.0"?><rss><channel><title>feed</title></channel></rss>', 'lxml'),
+}
+
+
+def old_soup(html):
+    """ the parser chain every page went through before ParserChoice """
+    for parser in ['lxml', 'xml', 'html5lib']:
+        soup = BeautifulSoup(html, parser)
+
+        if soup.body:
+            return parser, soup
+
+    return None, BeautifulSoup(html)
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    # BeautifulSoup warns when no parser is named, as the old fallback did
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+@pytest.mark.parametrize('name', sorted(DOCUMENTS))
+def test_parses_once_with_the_parser_the_chain_ends_up_using(name):
+    html, expected = DOCUMENTS[name]
+    choice = ParserChoice()
+
+    soup = choice.soup(html)
+    parser, old = old_soup(html)
+
+    assert parser == expected
+    assert str(soup) == str(old)
+    assert sum(choice.attempts.values()) == 1
+    assert choice.wins[expected] == 1
+
+
+def test_sniff():
+    choice = ParserChoice()
+
+    assert choice.sniff(DOCUMENTS['head only'][0]) == 'html5lib'
+    assert choice.sniff(DOCUMENTS['no body tag'][0]) == 'lxml'
+    assert choice.sniff(DOCUMENTS['frameset'][0]) is None
+    assert choice.candidates(DOCUMENTS['frameset'][0]) == []
+
+
+def test_remembered_domain_parser_comes_second():
+    choice = ParserChoice()
+    html = DOCUMENTS['no body tag'][0]
+
+    assert choice.candidates(html, 'example.com') == ['lxml', 'xml', 'html5lib']
+
+    choice.domains['example.com'] = 'html5lib'
+    assert choice.candidates(html, 'example.com') == ['lxml', 'html5lib', 'xml']
+    assert choice.candidates(html, 'other.com') == ['lxml', 'xml', 'html5lib']
+
+    choice.soup(DOCUMENTS['head only'][0], 'example.org')
+    assert choice.domains['example.org'] == 'html5lib'
+
+
+def test_memoryview_pages():
+    html = DOCUMENTS['body'][0]
+
+    assert str(ParserChoice().soup(memoryview(html))) == str(old_soup(html)[1])
+
+
+@pytest.mark.parametrize('name', sorted(DOCUMENTS))
+def test_parse_item_matches_the_old_chain(name, monkeypatch):
+    html = DOCUMENTS[name][0]
+    item = {'urlid': 1, 'domain': 'example.com', 'title': 'Boiler Title', 'body': 'Boiler  Body'}
+
+    parsed = parse_raw_content.parse_item(item, html)
+
+    monkeypatch.setattr(parse_raw_content, 'soupify', lambda urlid, domain=None, html=None: old_soup(html)[1])
+
+    assert parsed == parse_raw_content.parse_item(item, html)
+    assert parsed['boilerplate'] == ['boiler title', 'boiler body']
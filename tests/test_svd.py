@@ -0,0 +1,156 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from helpers.svd import BasisCache, ChunkedSVD, TermSVD, feature_terms
+
+
+def decaying(n_rows=300, n_cols=60, seed=0):
+    """ sparse matrix whose spectrum decays, so a few passes settle it """
+    random_state = np.random.RandomState(seed)
+    X = sparse.random(n_rows, n_cols, density=0.2, format='csr', random_state=random_state)
+
+    return sparse.csr_matrix(X @ sparse.diags(0.85 ** np.arange(n_cols)))
+
+
+def subspace_distance(A, B):
+    """ largest difference between the projections onto the rows of A and B """
+    return np.abs(A.T @ A - B.T @ B).max()
+
+
+def test_matches_exact_svd():
+    X = decaying()
+    svd = ChunkedSVD(n_components=5, n_iter=20, tol=1e-10, random_state=0)
+    Xt = svd.fit_transform(X)
+
+    U, s, Vt = np.linalg.svd(X.toarray(), full_matrices=False)
+
+    np.testing.assert_allclose(svd.singular_values_, s[:5], rtol=1e-6)
+    assert subspace_distance(svd.components_, Vt[:5]) < 1e-6
+    np.testing.assert_allclose(Xt, X @ svd.components_.T)
+
+
+def test_explained_variance_matches_truncated_svd():
+    X = decaying()
+    svd = ChunkedSVD(n_components=5, n_iter=20, tol=1e-10, random_state=0).fit(X)
+    reference = TruncatedSVD(n_components=5, algorithm='arpack').fit(X)
+
+    np.testing.assert_allclose(svd.singular_values_, reference.singular_values_, rtol=1e-6)
+    np.testing.assert_allclose(svd.explained_variance_, reference.explained_variance_, rtol=1e-5)
+    np.testing.assert_allclose(svd.explained_variance_ratio_, reference.explained_variance_ratio_, rtol=1e-5)
+
+
+def test_dense_input():
+    X = decaying()
+    sparse_fit = ChunkedSVD(n_components=5, random_state=0).fit(X)
+    dense_fit = ChunkedSVD(n_components=5, random_state=0).fit(X.toarray())
+
+    np.testing.assert_allclose(dense_fit.components_, sparse_fit.components_, atol=1e-10)
+
+
+def test_chunked_fit_matches_single_chunk():
+    X = decaying()
+    single = ChunkedSVD(n_components=5, random_state=0)
+    chunked = ChunkedSVD(n_components=5, max_memory=4096, random_state=0)
+
+    assert single.chunk_rows(X, 15) >= X.shape[0]
+    assert chunked.chunk_rows(X, 15) < X.shape[0] // 4
+
+    np.testing.assert_allclose(chunked.fit_transform(X), single.fit_transform(X), atol=1e-10)
+    assert chunked.n_iter_ == single.n_iter_
+
+
+def test_tol_stops_early():
+    X = decaying()
+
+    # the first pass has nothing to compare with, the second always settles
+    assert ChunkedSVD(n_components=5, tol=1., n_iter=10, random_state=0).fit(X).n_iter_ == 2
+    assert ChunkedSVD(n_components=5, tol=-1., n_iter=4, random_state=0).fit(X).n_iter_ == 4
+
+    settled = ChunkedSVD(n_components=5, tol=1e-6, n_iter=50, random_state=0).fit(X)
+    assert 2 < settled.n_iter_ < 50
+
+
+def test_cold_by_default():
+    X = decaying()
+    terms = list(range(X.shape[1]))
+
+    first = ChunkedSVD(n_components=5, basis_key='x', random_state=0)
+    first.fit(X, terms=terms)
+    second = ChunkedSVD(n_components=5, basis_key='x', random_state=0)
+    second.fit(X, terms=terms)
+
+    assert not first.warm_started_ and not second.warm_started_
+    np.testing.assert_array_equal(first.components_, second.components_)
+
+
+def test_warm_start_gives_the_cold_subspace():
+    X = decaying()
+    terms = ['t%d' % i for i in range(X.shape[1])]
+    cache = BasisCache()
+
+    ChunkedSVD(n_components=5, basis_cache=cache, basis_key='x', random_state=0).fit(X, terms=terms)
+    assert len(cache) == 1
+
+    # another fold, with its columns in a different order
+    rows = np.arange(0, X.shape[0], 2)
+    order = np.random.RandomState(1).permutation(X.shape[1])
+    fold = X[rows][:, order]
+    fold_terms = [terms[i] for i in order]
+
+    warm = ChunkedSVD(n_components=5, n_iter=20, tol=1e-10, basis_cache=cache, basis_key='x', random_state=1)
+    warm.fit(fold, terms=fold_terms)
+    cold = ChunkedSVD(n_components=5, n_iter=20, tol=1e-10, random_state=1).fit(fold)
+
+    assert warm.warm_started_ and not cold.warm_started_
+    assert subspace_distance(warm.components_, cold.components_) < 1e-6
+
+    # a different key or n_components starts cold
+    other = ChunkedSVD(n_components=4, basis_cache=cache, basis_key='x', random_state=0).fit(fold, terms=fold_terms)
+    assert not other.warm_started_
+
+
+def test_basis_cache_is_shared_by_clone_and_pickled_empty():
+    X = decaying()
+    cache = BasisCache(max_size=1)
+    svd = ChunkedSVD(n_components=5, basis_cache=cache, basis_key='x', random_state=0)
+
+    assert clone(svd).basis_cache is cache
+
+    svd.fit(X, terms=list(range(X.shape[1])))
+    ChunkedSVD(n_components=5, basis_cache=cache, basis_key='y', random_state=0).fit(X, terms=list(range(X.shape[1])))
+
+    # only the most recent basis fits
+    assert len(cache) == 1 and cache.get(('y', 5)) is not None
+
+    restored = pickle.loads(pickle.dumps(svd))
+    assert len(restored.basis_cache) == 0 and len(cache) == 1
+    np.testing.assert_array_equal(restored.components_, svd.components_)
+
+
+def test_term_svd_passes_the_vocabulary():
+    docs = ['the cat sat', 'the dog sat on the mat', 'a cat and a dog', 'mat and rug', 'the rug'] * 4
+    cache = BasisCache()
+    lsa = TermSVD(TfidfVectorizer(), ChunkedSVD(n_components=3, basis_cache=cache, basis_key='x', random_state=0))
+
+    Xt = lsa.fit_transform(docs)
+    terms = feature_terms(lsa.vectorizer)
+
+    assert [lsa.vectorizer.vocabulary_[term] for term in terms] == list(range(len(terms)))
+    np.testing.assert_allclose(Xt, lsa.transform(docs))
+    np.testing.assert_allclose(Xt, ChunkedSVD(n_components=3, random_state=0).fit_transform(TfidfVectorizer().fit_transform(docs)))
+
+    refit = clone(lsa)
+    refit.fit(docs[:10])
+    assert refit.svd.warm_started_
+
+
+def test_terms_must_match_columns():
+    with pytest.raises(ValueError):
+        ChunkedSVD(n_components=2).fit(decaying(), terms=['a', 'b'])
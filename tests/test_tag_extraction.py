@@ -0,0 +1,48 @@
+import pytest
+
+# the scikit-learn the code is written against
+pytest.importorskip('sklearn.externals.joblib')
+
+from data.parse_raw_features import Parse
+
+
+PAGES = [
+    '',
+    '<html><head><title>T</title></head><body><p>no tags of interest</p></body></html>',
+    '<html><head><meta name="title" content="Meta  Title!"><meta name="description" content="A page, about Things">'
+    '<style>h1 { color: red }</style></head><body><h1>First <b>Heading</b></h1><h1>Second</h1>'
+    '<h2>Sub<script>var h2 = 1;</script>heading</h2><h3></h3><span>s1</span><span>s2</span>'
+    '<a href="/x">Link &amp; more</a><ul><li>one<ul><li>nested</li></ul></li><li>two</li></ul></body></html>',
+    '<HTML><BODY><H1>Upper Case</H1><H4>Four</H4><LI>item</LI></BODY></HTML>',
+    '<html><head><meta name="description"><meta name="title" content="first"><meta name="title" content="second">'
+    '</head><body><a><span>span in a link</span></a><label_>odd tag</label_></body></html>',
+    '<html><body><h1><script>document.write("<h2>x</h2>")</script>Scripted</h1><h2>\n  Spaced\tout  \n</h2>'
+    '<span><style>.a{}</style></span><li>été café 42</li></body></html>',
+    '<div><h3>unclosed <span>inner<h4>deeper</div><a href="#">last',
+]
+
+
+def find_all_row(html):
+    """ the row the page gets from remove_tags and a tag_content per tag """
+    soup = Parse.remove_tags(Parse.parse_html(html), ['style', 'script'])
+    return [Parse.tag_content(soup, tag) for tag in Parse.TAGS]
+
+
+@pytest.mark.parametrize('html', PAGES)
+def test_extract_tags_matches_find_all(html):
+    assert Parse.extract_tags(Parse.parse_html(html), Parse.TAGS) == find_all_row(html)
+
+
+@pytest.mark.parametrize('html', PAGES)
+def test_extract_tags_lxml_matches_find_all(html):
+    row = Parse.extract_tags_lxml(html, Parse.TAGS)
+
+    # None hands the page to the soup engine
+    if row is not None:
+        assert row == find_all_row(html)
+
+
+@pytest.mark.parametrize('engine', ['soup', 'lxml'])
+def test_extract_html_engines(engine):
+    for html in PAGES:
+        assert Parse(engine=engine).extract_html(html) == find_all_row(html)
@@ -0,0 +1,67 @@
+import pickle
+
+import pytest
+
+from helpers import util
+
+
+TEXT = 'The runners were running and the cats ran after the running runners'
+
+
+@pytest.fixture(autouse=True)
+def split_words(monkeypatch):
+    # the punkt models word_tokenize needs may not be downloaded, the cache
+    # sits behind the word splitting anyway
+    monkeypatch.setattr(util, 'word_tokenize', str.split)
+
+
+def wordnet():
+    try:
+        util.WordNetLemmatizer().lemmatize('cats')
+    except LookupError:
+        pytest.skip('wordnet data is not downloaded')
+
+
+TOKENIZERS = {
+    'memoized': lambda: util.MemoizedTokenizer(str.lower, maxsize=4),
+    'stem': util.StemTokenizer,
+    'lemma': lambda: wordnet() or util.LemmaTokenizer(),
+}
+
+
+@pytest.mark.parametrize('name', sorted(TOKENIZERS))
+def test_matches_the_unmemoized_function(name):
+    tokenizer = TOKENIZERS[name]()
+
+    assert tokenizer(TEXT) == [tokenizer.normalize_word(word) for word in TEXT.split()]
+    assert tokenizer(TEXT) == tokenizer(TEXT)
+
+
+@pytest.mark.parametrize('name', sorted(TOKENIZERS))
+def test_unpickled_tokenizer_rebuilds_its_cache(name):
+    tokenizer = TOKENIZERS[name]()
+    tokens = tokenizer(TEXT)
+
+    assert tokenizer.cache_info().currsize > 0
+
+    restored = pickle.loads(pickle.dumps(tokenizer))
+
+    assert restored.normalize is not tokenizer.normalize
+    assert restored.cache_info().currsize == 0
+    assert restored.cache_info().maxsize == tokenizer.maxsize
+
+    assert restored(TEXT) == tokens
+    assert restored(TEXT) == [restored.normalize_word(word) for word in TEXT.split()]
+    assert restored.cache_info().hits > 0
+
+
+def test_bounded_cache_and_hit_rate():
+    tokenizer = util.MemoizedTokenizer(str.lower, maxsize=4)
+
+    assert tokenizer.hit_rate() == 0.
+
+    tokenizer('a b a b a b')
+    assert tokenizer.cache_info().hits == 4 and tokenizer.hit_rate() == 4 / 6.
+
+    tokenizer('c d e f g')
+    assert tokenizer.cache_info().currsize == 4
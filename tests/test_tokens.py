@@ -0,0 +1,171 @@
+import copy
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sklearn.base import clone
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from helpers.tokens import NgramAnalyzer, TokenCache, Tokenize
+
+
+TRAIN = ['The cat sat on the mat', 'the dog sat', 'A cat and a dog', 'the mat', None]
+TEST = ['the bird sat on the cat', 'a fish and a dog', 'the mat']
+STOP_WORDS = ['a', 'and']
+
+
+def make_cache(**kwargs):
+    return TokenCache(preprocessor=str.lower, stop_words=STOP_WORDS, **kwargs)
+
+
+def decode(feature, words):
+    """ token strings of a feature packed by NgramAnalyzer """
+    mask = (1 << NgramAnalyzer.BITS) - 1
+    grams = [words[feature & mask]]
+    feature >>= NgramAnalyzer.BITS
+
+    while feature:
+        grams.insert(0, words[(feature & mask) - 1])
+        feature >>= NgramAnalyzer.BITS
+
+    return ' '.join(grams)
+
+
+def by_term(X, terms):
+    """ {term: value} of every row """
+    X = X.tocsr()
+    return [{terms[j]: X[i, j] for j in X[i].indices} for i in range(X.shape[0])]
+
+
+def test_packs_preceding_ids_above_the_last():
+    shift = NgramAnalyzer.BITS
+
+    assert NgramAnalyzer((1, 1))([0, 1, 2]) == [0, 1, 2]
+    assert NgramAnalyzer((1, 2))([0, 1, 2]) == [0, 1, 2, 1 | 1 << shift, 2 | 2 << shift]
+    assert NgramAnalyzer((2, 3))([0, 1, 2]) == [1 | 1 << shift, 2 | 2 << shift,
+                                                2 | 2 << shift | 1 << 2 * shift]
+    assert NgramAnalyzer((1, 2))([]) == []
+
+
+def test_grams_do_not_collide():
+    random_state = np.random.RandomState(0)
+    analyzer = NgramAnalyzer((1, 3))
+    grams = {}
+
+    for _ in range(50):
+        ids = random_state.randint(0, 5, size=6).tolist()
+
+        for n in range(1, 4):
+            for i in range(len(ids) - n + 1):
+                grams.setdefault(tuple(ids[i:i + n]), set()).update(
+                    NgramAnalyzer((n, n))(ids[i:i + n]))
+
+        assert len(analyzer(ids)) == sum(len(ids) - n + 1 for n in range(1, 4))
+
+    features = [feature for packed in grams.values() for feature in packed]
+
+    assert all(len(packed) == 1 for packed in grams.values())
+    assert len(set(features)) == len(features)
+
+
+def test_overflow_raises():
+    largest = (1 << NgramAnalyzer.BITS) - 2
+
+    assert NgramAnalyzer((1, 2))([largest, 0])
+
+    with pytest.raises(ValueError):
+        NgramAnalyzer((1, 2))([largest + 1, 0])
+
+    with pytest.raises(ValueError):
+        NgramAnalyzer((1, 4))([0, 1])
+
+    # unigrams are never packed
+    assert NgramAnalyzer((1, 1))([largest + 1]) == [largest + 1]
+
+
+def test_tokenizes_like_the_uncached_tokenizer():
+    cache = make_cache()
+
+    for text, ids in zip(TRAIN, cache.transform(TRAIN)):
+        assert ids.dtype == np.int32
+        assert [w for w in (text or '').lower().split() if w not in STOP_WORDS] == \
+               [next(t for t, i in cache.vocabulary.items() if i == id) for id in ids]
+
+    assert sorted(cache.vocabulary.values()) == list(range(len(cache.vocabulary)))
+
+
+def test_tfidf_matches_the_uncached_vectorizer():
+    cache = make_cache()
+    tokenize = Tokenize(cache, keys=['text'])
+    vectorizer = TfidfVectorizer(analyzer=NgramAnalyzer((1, 2)), sublinear_tf=True)
+    plain = TfidfVectorizer(preprocessor=str.lower, tokenizer=str.split, token_pattern=None,
+                            stop_words=STOP_WORDS, ngram_range=(1, 2), sublinear_tf=True)
+
+    train = pd.DataFrame({'text': [text or '' for text in TRAIN]})
+    test = pd.DataFrame({'text': TEST})
+
+    X = vectorizer.fit_transform(tokenize.fit_transform(train)['text'])
+    Xt = vectorizer.transform(tokenize.transform(test)['text'])
+    expected, expected_t = plain.fit_transform(train['text']), plain.transform(test['text'])
+
+    words = {i: t for t, i in cache.vocabulary.items()}
+    terms = {column: decode(feature, words) for feature, column in vectorizer.vocabulary_.items()}
+    plain_terms = {column: term for term, column in plain.vocabulary_.items()}
+
+    for got, want in zip(by_term(X, terms) + by_term(Xt, terms),
+                         by_term(expected, plain_terms) + by_term(expected_t, plain_terms)):
+        assert got.keys() == want.keys()
+        assert all(np.isclose(got[term], want[term]) for term in want)
+
+
+def test_vocabulary_is_frozen_outside_fit():
+    cache = make_cache()
+    cache.transform(TRAIN)
+    vocabulary = dict(cache.vocabulary)
+
+    ids = cache.transform(TEST, grow=False)
+
+    assert cache.vocabulary == vocabulary
+    unknown = len(vocabulary)
+    assert ids[0].tolist() == [vocabulary['the'], unknown, vocabulary['sat'], vocabulary['on'],
+                               vocabulary['the'], vocabulary['cat']]
+
+    # texts with unknown tokens are not kept, those without are
+    assert TEST[0] not in cache.docs and TEST[2] in cache.docs
+
+    # a later fit gives the tokens ids of their own
+    grown = cache.transform(TEST)[0]
+    assert grown[1] == unknown and 'bird' in cache.vocabulary
+    assert cache.tokenize('the owl', grow=False)[1] == len(cache.vocabulary)
+
+
+def test_keeps_the_most_recently_used_texts():
+    cache = make_cache(max_docs=2)
+    cache.transform(['one', 'two'])
+    cache.tokenize('one')
+    cache.tokenize('three')
+
+    assert list(cache.docs) == ['one', 'three']
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 3
+
+
+def test_clone_shares_the_cache():
+    cache = make_cache()
+    tokenize = Tokenize(cache, keys=['text'])
+
+    assert clone(tokenize).cache is cache
+    assert copy.deepcopy(tokenize).cache is cache
+
+
+def test_pickled_cache_keeps_only_the_vocabulary():
+    cache = make_cache()
+    ids = cache.transform(TRAIN)
+
+    restored = pickle.loads(pickle.dumps(cache))
+
+    assert restored.vocabulary == cache.vocabulary
+    assert len(restored.docs) == 0 and len(cache.docs) == len(set(TRAIN))
+    assert all(np.array_equal(a, b) for a, b in zip(restored.transform(TRAIN, grow=False), ids))
+    assert restored.vocabulary == cache.vocabulary
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from multiprocessing import shared_memory
+from scipy import sparse
+
+# the scikit-learn the code is written against
+pytest.importorskip('sklearn.cross_validation')
+pytest.importorskip('gensim')
+
+from models import train_model
+
+
+def problem(n_labels=120, n_rows=160, seed=0):
+    random_state = np.random.RandomState(seed)
+    data = sparse.random(n_rows, 30, density=0.2, format='csr', random_state=random_state)
+    labels = (np.asarray(data[:n_labels].sum(axis=1)).ravel() + random_state.normal(0, 0.3, n_labels) > 0.6).astype(int)
+
+    return data, labels
+
+
+@pytest.mark.parametrize('dense', [False, True])
+def test_parallel_scores_match_serial(dense):
+    data, labels = problem()
+    data = data.toarray() if dense else data
+
+    serial = train_model.get_scores(data, labels, n_jobs=1)
+
+    # out of fold scores of the labelled rows, then the unlabelled ones
+    assert serial.shape == (data.shape[0],)
+    np.testing.assert_array_equal(train_model.get_scores(data, labels, n_jobs=2), serial)
+    np.testing.assert_array_equal(train_model.get_scores(data, labels, n_jobs=-1), serial)
+
+
+def test_scores_match_plain_fold_loop():
+    data, labels = problem()
+    expected = []
+
+    for train_idx, test_idx in train_model.get_folds(len(labels), data.shape[0]):
+        model = train_model.make_model()
+        expected.append(model.fit(data[train_idx], labels[train_idx]).predict_proba(data[test_idx])[:, -1])
+
+    np.testing.assert_array_equal(train_model.get_scores(data, labels), np.hstack(expected))
+
+
+def recording_share_arrays(monkeypatch):
+    names = []
+    share_arrays = train_model.share_arrays
+
+    def share(arrays):
+        blocks, spec = share_arrays(arrays)
+        names.extend(block.name for block in blocks)
+        return blocks, spec
+
+    monkeypatch.setattr(train_model, 'share_arrays', share)
+    return names
+
+
+def assert_released(names):
+    assert names
+
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+
+def test_shared_memory_is_released(monkeypatch):
+    names = recording_share_arrays(monkeypatch)
+    data, labels = problem()
+
+    train_model.get_scores(data, labels, n_jobs=2)
+    assert_released(names)
+
+
+def test_shared_memory_is_released_when_a_fit_fails(monkeypatch):
+    names = recording_share_arrays(monkeypatch)
+    data, _ = problem()
+
+    # a single class cannot be fit
+    with pytest.raises(ValueError):
+        train_model.get_scores(data, np.zeros(120, dtype=int), n_jobs=2)
+
+    assert_released(names)
+
+
+def test_warm_start_keeps_the_solver():
+    assert train_model.make_model(warm_start=True, solver='newton-cg').solver == 'newton-cg'
+
+    with pytest.raises(ValueError):
+        train_model.make_model(warm_start=True, solver='liblinear')
+
+    # rejected before any worker is started
+    data, labels = problem()
+    with pytest.raises(ValueError):
+        train_model.get_scores(data, labels, n_jobs=2, warm_start=True, solver='liblinear')
+
+
+def test_warm_start_runs_in_parallel():
+    data, labels = problem()
+    scores = train_model.get_scores(data, labels, n_jobs=2, warm_start=True, solver='lbfgs')
+    cold = train_model.get_scores(data, labels, solver='lbfgs')
+
+    assert scores.shape == cold.shape
+    np.testing.assert_allclose(scores, cold, atol=1e-3)